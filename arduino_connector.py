@@ -1,17 +1,305 @@
+import time
+
+# 시작 시간 측정 기준 (모듈 로드 시간도 포함하도록 다른 import보다 먼저 기록)
+STARTUP_STARTED = time.perf_counter()
+
 import sys
-import json
-import requests
-import socket
-import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
-import time
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-import os
-import glob
-from tkcalendar import DateEntry, Calendar
+import threading
+import logging
+from collections import deque
+import multiprocessing
+import argparse
+import itertools
+
+from syrup_core import (
+    SyrupCore, PrescriptionCache, bulk_import_prescriptions, normalize_pill_code, STARTUP_STAGES,
+)
+
+# 모듈을 모두 불러온 시점 (tkcalendar는 달력을 처음 열 때 불러옴)
+MODULES_LOADED = time.perf_counter()
+
+# 조제 로그(SyrupCore.log)를 받지 않는 UI 이벤트 처리의 오류 기록용
+logger = logging.getLogger("syrup.ui")
+
+
+# UI 갱신 주기 (약 30fps)와 한 번에 실행할 최대 UI 이벤트 수
+UI_FRAME_INTERVAL_MS = 33
+UI_MAX_EVENTS_PER_FRAME = 500
+
+
+class UIDispatcher:
+    """작업 스레드가 보낸 UI 이벤트를 모아 Tk 스레드에서 일정한 주기로 실행합니다.
+
+    key를 주고 보낸 이벤트는 아직 실행되지 않은 같은 key의 이벤트를 덮어쓰므로,
+    한 프레임 안에 같은 대상을 여러 번 갱신해도 마지막 값으로 한 번만 그립니다.
+    """
+
+    def __init__(self, root, interval_ms=UI_FRAME_INTERVAL_MS, max_events=UI_MAX_EVENTS_PER_FRAME):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._events = deque()
+        self._keyed = {}
+
+    def after(self, ms, callback, *args):
+        """Tk 스레드에서 ms 밀리초 뒤에 콜백을 실행합니다 (SyrupCore의 타이머용)."""
+        self.root.after(ms, callback, *args)
+
+    def post(self, callback, *args, key=None):
+        """어느 스레드에서나 호출할 수 있습니다."""
+        with self._lock:
+            if key is not None:
+                if key in self._keyed:
+                    self._keyed[key] = (callback, args)
+                    return
+                self._keyed[key] = (callback, args)
+            self._events.append((key, callback, args))
+
+    def pump(self):
+        """대기 중인 이벤트를 최대 max_events개 실행하고 다음 프레임을 예약합니다."""
+        batch = []
+        with self._lock:
+            while self._events and len(batch) < self.max_events:
+                key, callback, args = self._events.popleft()
+                if key is not None:
+                    callback, args = self._keyed.pop(key)
+                batch.append((callback, args))
+        for callback, args in batch:
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.exception(f"UI 이벤트 처리 중 오류 발생: {e}")
+        self.root.after(self.interval_ms, self.pump)
+
+
+# 조제 로그 화면에 표시할 최소 수준과 최대 줄 수
+LOG_UI_LEVEL = logging.INFO
+LOG_MAX_LINES = 2000
+
+
+class VirtualTable:
+    """보이는 범위의 행만 ttk.Treeview 항목으로 만드는 가상 테이블입니다.
+
+    전체 행은 key 순서 목록과 key -> (values, tags)로 보관하고, 스크롤 위치에 해당하는
+    화면 한 장 분량의 행만 iid=key인 Treeview 항목으로 그립니다. 데이터나 스크롤 위치가
+    바뀌면 이미 그려진 항목과 비교해 바뀐 행만 추가/수정/이동/삭제합니다.
+    선택은 key 집합으로 기억하므로 선택한 행이 화면 밖으로 스크롤되어도 유지되며,
+    방향키와 PageUp/PageDown은 그려진 범위 끝에서 멈추지 않고 스크롤 위치를 옮겨 다시 그립니다.
+    """
+
+    DEFAULT_ROW_HEIGHT = 20
+
+    def __init__(self, tree, scrollbar, on_select=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.on_select = on_select
+        self.columns = tuple(tree.cget("columns"))
+        self.order = []
+        self.rows = {}
+        self.first = 0
+        # 현재 Treeview에 그려진 key (화면 순서)와 그릴 때 사용한 행 값
+        self.shown = []
+        self.drawn = {}
+        # 선택된 key 집합과 키보드 이동의 기준 행
+        self.selected = set()
+        self.cursor = None
+        self._render_pending = False
+        tree.configure(yscrollcommand="")
+        scrollbar.config(command=self.yview)
+        tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        tree.bind("<Configure>", lambda event: self.schedule_render())
+        tree.bind("<MouseWheel>", self._on_mousewheel)
+        tree.bind("<Button-4>", lambda event: self.scroll(-3) or "break")
+        tree.bind("<Button-5>", lambda event: self.scroll(3) or "break")
+        tree.bind("<ButtonPress-1>", self._on_click)
+        tree.bind("<Up>", lambda event: self.move_cursor(-1, extend=event.state & 0x0001))
+        tree.bind("<Down>", lambda event: self.move_cursor(1, extend=event.state & 0x0001))
+        tree.bind("<Prior>", lambda event: self.move_cursor(-self.visible_rows()))
+        tree.bind("<Next>", lambda event: self.move_cursor(self.visible_rows()))
+
+    def keys(self):
+        return list(self.order)
+
+    def values(self, key):
+        return list(self.rows[key][0])
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __len__(self):
+        return len(self.order)
+
+    def selection(self):
+        """선택된 key를 테이블 순서대로 반환합니다."""
+        if not self.selected:
+            return ()
+        return tuple(key for key in self.order if key in self.selected)
+
+    def set_rows(self, rows):
+        """전체 행을 (key, values, tags) 목록으로 바꾸고 맨 위로 스크롤합니다."""
+        self.order = []
+        self.rows = {}
+        for key, values, tags in rows:
+            self.order.append(key)
+            self.rows[key] = (tuple(values), tuple(tags))
+        self.first = 0
+        self._set_selected({key for key in self.selected if key in self.rows})
+        self.schedule_render()
+
+    def insert(self, index, key, values, tags=()):
+        """행을 index 위치에 추가합니다. 이미 있는 key면 값을 바꾸고 위치를 옮깁니다."""
+        if key in self.rows:
+            self.order.remove(key)
+        if index == "end":
+            self.order.append(key)
+        else:
+            self.order.insert(index, key)
+        self.rows[key] = (tuple(values), tuple(tags))
+        self.schedule_render()
+        return key
+
+    def update(self, key, values=None, tags=None):
+        old_values, old_tags = self.rows[key]
+        self.rows[key] = (old_values if values is None else tuple(values),
+                          old_tags if tags is None else tuple(tags))
+        if key in self.drawn:
+            self.schedule_render()
+
+    def set(self, key, column, value):
+        values = list(self.rows[key][0])
+        values[self.columns.index(column)] = value
+        self.update(key, values=values)
+
+    def delete(self, *keys):
+        for key in keys:
+            if self.rows.pop(key, None) is not None:
+                self.order.remove(key)
+        self._set_selected({key for key in self.selected if key in self.rows})
+        self.schedule_render()
+
+    def clear(self):
+        self.set_rows(())
+
+    def scroll(self, rows):
+        self.first += rows
+        self.schedule_render()
+
+    def yview(self, *args):
+        """스크롤바 명령 ('moveto', 비율) 또는 ('scroll', 수, 'units'|'pages')을 처리합니다."""
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.order))
+        elif args[0] == "scroll":
+            step = self.visible_rows() if args[2] == "pages" else 1
+            self.first += int(args[1]) * step
+        self.schedule_render()
+
+    def move_cursor(self, rows, extend=False):
+        """선택 행을 rows만큼 옮기고, 그려진 범위를 벗어나면 스크롤 위치를 옮겨 다시 그립니다.
+
+        extend(Shift)면 기존 선택에 옮긴 행을 더합니다.
+        """
+        if self.order:
+            key = self.cursor if self.cursor in self.rows else self.tree.focus()
+            index = self.order.index(key) + rows if key in self.rows else self.first
+            index = max(0, min(index, len(self.order) - 1))
+            count = self.visible_rows()
+            if index < self.first:
+                self.first = index
+            elif index >= self.first + count:
+                self.first = index - count + 1
+            self.cursor = self.order[index]
+            self._set_selected(self.selected | {self.cursor} if extend else {self.cursor})
+            self.schedule_render()
+        return "break"
+
+    def _on_mousewheel(self, event):
+        self.scroll(-1 if event.delta > 0 else 1)
+        return "break"
+
+    def visible_rows(self):
+        """현재 Treeview 높이에 들어가는 행 수입니다. 아직 배치되지 않았으면 height 옵션을 사용합니다."""
+        height = self.tree.winfo_height()
+        if height <= 1:
+            return max(1, int(self.tree.cget("height")))
+        row_height = self.DEFAULT_ROW_HEIGHT
+        try:
+            row_height = int(ttk.Style().lookup("Treeview", "rowheight")) or row_height
+        except (tk.TclError, ValueError):
+            pass
+        # 머리글 한 줄을 뺀 높이
+        return max(1, height // row_height - 1)
+
+    def schedule_render(self):
+        if not self._render_pending:
+            self._render_pending = True
+            self.tree.after_idle(self.render)
+
+    def render(self):
+        """스크롤 위치의 행들을 그려진 항목과 비교해 바뀐 부분만 Treeview에 반영합니다."""
+        self._render_pending = False
+        count = self.visible_rows()
+        total = len(self.order)
+        self.first = max(0, min(self.first, total - count))
+        window = self.order[self.first:self.first + count]
+        wanted = set(window)
+        stale = [key for key in self.shown if key not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for key in stale:
+                del self.drawn[key]
+        shown = [key for key in self.shown if key in wanted]
+        for index, key in enumerate(window):
+            row = self.rows[key]
+            if key not in self.drawn:
+                self.tree.insert("", index, iid=key, values=row[0], tags=row[1])
+                shown.insert(index, key)
+            else:
+                if self.drawn[key] != row:
+                    self.tree.item(key, values=row[0], tags=row[1])
+                if shown[index] != key:
+                    self.tree.move(key, "", index)
+                    shown.remove(key)
+                    shown.insert(index, key)
+            self.drawn[key] = row
+        self.shown = shown
+        visible_selected = tuple(key for key in window if key in self.selected)
+        if set(visible_selected) != set(self.tree.selection()):
+            self.tree.selection_set(visible_selected)
+        if self.cursor in wanted and self.tree.focus() != self.cursor:
+            self.tree.focus(self.cursor)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + count) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _on_click(self, event):
+        """Ctrl/Shift 없이 행을 클릭하면 화면 밖의 선택도 해제합니다 (Treeview는 보이는 행만 바꿈)."""
+        if event.state & 0x0005 or not self.tree.identify_row(event.y):
+            return
+        shown = set(self.shown)
+        self._set_selected({key for key in self.selected if key in shown})
+
+    def _on_tree_select(self, event):
+        # Treeview의 선택은 보이는 행만 담으므로, 화면 밖으로 스크롤되어 지워진 행의 선택은 유지
+        shown = set(self.shown)
+        self._set_selected({key for key in self.selected if key not in shown} | set(self.tree.selection()))
+        focus = self.tree.focus()
+        if focus in self.rows:
+            self.cursor = focus
+
+    def _set_selected(self, keys):
+        if keys == self.selected:
+            return
+        self.selected = keys
+        if self.on_select:
+            self.on_select()
+
 
 class ArduinoConnector:
     def __init__(self):
@@ -35,28 +323,28 @@ class ArduinoConnector:
         self.root.geometry(f"{window_width}x{window_height}+{x}+{y}")
         
         self.root.bind("<F12>", self.start_dispensing)   # ← F12 누르면 조제시작
+        self.root.bind("<F11>", self.start_urgent_dispensing)   # ← F11 누르면 긴급 조제
         
-        # 자동 조제 상태
-        self.auto_dispensing = False
+        # 작업 스레드에서 UI 스레드로 전달할 이벤트를 프레임 단위로 모아 실행하는 디스패처
+        self.ui = UIDispatcher(self.root)
         
-        # 저장된 연결 정보
-        self.saved_connections = {}
-        self.network_prefix = None
-        self.available_networks = []
+        # 기기 연결, 조제 대기열, 처방전을 관리하는 엔진 (UI 스레드에서 실행하고 상태 변화는 이벤트로 받음)
+        self.core = SyrupCore(self.ui)
         
-        # 현재 연결된 기기들
-        self.connected_devices = {}
-        self.last_connected = None
-        self.auto_reconnect_attempted = set()
+        # 약물 정보 테이블 행 -> (약물명, 약품코드, 총량), 약품코드 -> 행 목록
+        self.medicine_rows = {}
+        self.medicine_items_by_code = {}
+        self.medicine_keys = itertools.count()
         
-        # 처방전 파일 경로
-        self.prescription_path = self.load_prescription_path()
+        # 기기 목록(Listbox) 항목 순서대로의 MAC 주소
+        self.ip_list_macs = []
+        self.saved_list_macs = []
         
-        # 파싱된 파일 목록
-        self.parsed_files = set()
+        # 다음 프레임에 다시 칠할 약품코드
+        self.pending_color_codes = set()
         
-        # 파싱된 처방전 데이터 (접수번호별)
-        self.parsed_prescriptions = {}
+        # 조제 로그: 아직 화면에 그리지 않은 줄
+        self.pending_log_lines = deque(maxlen=LOG_MAX_LINES)
         
         # 페이지 프레임
         self.main_frame = ttk.Frame(self.root)
@@ -66,26 +354,21 @@ class ArduinoConnector:
         self.init_main_ui()
         self.init_network_ui()
         
-        # 저장된 연결 정보 로드
-        self.load_connections()
+        # 엔진 이벤트를 화면에 연결
+        self.subscribe_core_events()
         
-        # 네트워크 인터페이스 감지
-        self.detect_networks()
+        # 저장된 연결 정보 표시
+        self.update_saved_list()
         
         # 약물명 콤보박스 초기화
         self.update_pill_name_combo()
         
-        # 모든 처방전 파일 파싱 및 환자 정보 테이블 초기화
-        self.parse_all_prescription_files()
-        
-        # 주기적인 스캔 설정
-        self.schedule_scan()
+        # 남은 조제 작업 확인, 주기적인 상태 확인 시작
+        # (네트워크 감지, 처방전 색인, 첫 스캔은 백그라운드에서 진행하고 끝나면 화면에 반영)
+        self.core.start()
         
-        # 주기적인 연결 상태 확인
-        self.schedule_connection_check()
-        
-        # 처방전 파일 모니터링 시작
-        self.start_prescription_monitor()
+        # UI 대기열 처리 시작
+        self.ui.pump()
         
         # 초기 페이지 설정
         self.show_main_page()
@@ -93,9 +376,48 @@ class ArduinoConnector:
         # 약물 정보 테이블 태그 설정
         self.medicine_tree.tag_configure('connected', foreground='blue')
         self.medicine_tree.tag_configure('disconnected', foreground='red')
+        
+        # 창 구성 완료 시점과 첫 화면이 그려진 시점 (시작 시간 보고용)
+        self.startup_times = {"modules": MODULES_LOADED - STARTUP_STARTED,
+                              "window": time.perf_counter() - STARTUP_STARTED}
+        self.root.after_idle(self.on_first_frame)
+
+    def subscribe_core_events(self):
+        """엔진의 상태 변화 이벤트를 화면 갱신 메서드에 연결합니다."""
+        subscribe = self.core.subscribe
+        subscribe("log", self.on_core_log)
+        subscribe("saved_devices_changed", self.on_saved_devices_changed)
+        subscribe("device_discovered", self.on_device_discovered)
+        subscribe("scan_finished", self.on_scan_finished)
+        subscribe("device_connected", self.on_device_connected)
+        subscribe("device_disconnected", self.on_device_disconnected)
+        subscribe("device_status", self.on_device_status)
+        subscribe("pill_codes_changed", self.on_pill_codes_changed)
+        subscribe("connection_stats", self.on_connection_stats)
+        subscribe("prescription_added", self.on_prescription_added)
+        subscribe("prescriptions_reloaded", self.filter_patients_by_date)
+        subscribe("transmission_status", self.on_transmission_status)
+        subscribe("dispense_queue_changed", self.update_dispense_queue_label)
+        subscribe("dispense_failed", self.on_dispense_failed)
+        subscribe("dispense_expired", self.on_dispense_expired)
+        subscribe("bulk_import_progress", self.on_bulk_import_progress)
+        subscribe("bulk_import_finished", self.on_bulk_import_finished)
+        subscribe("networks_detected", self.on_networks_detected)
+        subscribe("startup_progress", self.on_startup_progress)
+        subscribe("startup_finished", self.on_startup_finished)
 
     def init_main_ui(self):
         """메인 페이지 UI를 초기화합니다."""
+        # 시작 준비 진행 표시 (백그라운드 시작 단계가 끝나면 숨김)
+        self.startup_frame = ttk.Frame(self.main_frame)
+        self.startup_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.startup_progress = ttk.Progressbar(self.startup_frame, mode='determinate',
+                                                maximum=len(STARTUP_STAGES), bootstyle="info")
+        self.startup_progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.startup_label = ttk.Label(
+            self.startup_frame, text=f"시작 준비 중: {', '.join(STARTUP_STAGES.values())}")
+        self.startup_label.pack(side=tk.LEFT, padx=5)
+        
         # 처방전 파일 경로 설정 프레임
         path_frame = ttk.LabelFrame(self.main_frame, text="처방전 파일 경로 설정", bootstyle="primary")
         path_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -105,8 +427,8 @@ class ArduinoConnector:
         
         self.path_entry = ttk.Entry(path_input_frame)
         self.path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        if self.prescription_path:
-            self.path_entry.insert(0, self.prescription_path)
+        if self.core.prescription_path:
+            self.path_entry.insert(0, self.core.prescription_path)
         
         ttk.Button(path_input_frame, text="경로 선택", 
                   command=self.select_prescription_path,
@@ -116,13 +438,24 @@ class ArduinoConnector:
                   command=self.save_prescription_path,
                   style='success.TButton').pack(side=tk.LEFT, padx=5)
         
+        ttk.Button(path_input_frame, text="일괄 가져오기", 
+                  command=self.start_bulk_import,
+                  style='info.TButton').pack(side=tk.LEFT, padx=5)
+        
+        # 일괄 가져오기 진행 표시 (가져오는 동안에만 표시)
+        self.import_progress_frame = ttk.Frame(path_frame)
+        self.import_progress = ttk.Progressbar(self.import_progress_frame, mode='determinate', bootstyle="info")
+        self.import_progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.import_progress_label = ttk.Label(self.import_progress_frame, text="")
+        self.import_progress_label.pack(side=tk.LEFT, padx=5)
+        
         # 날짜 선택 프레임 (Entry + 달력 버튼)
         date_frame = ttk.Frame(self.main_frame)
         date_frame.pack(fill=tk.X, padx=5, pady=5)
         ttk.Label(date_frame, text="날짜 선택:").pack(side=tk.LEFT, padx=5)
         self.date_var = tk.StringVar()
         self.date_var.set(datetime.now().strftime('%Y-%m-%d'))
-        self.date_entry = ttk.Entry(date_frame, textvariable=self.date_var, width=12)
+        self.date_entry = ttk.Entry(date_frame, textvariable=self.date_var, width=24)
         self.date_entry.pack(side=tk.LEFT, padx=5)
         tk.Button(date_frame, text="달력", command=self.show_calendar_popup).pack(side=tk.LEFT, padx=5)
         ttk.Button(date_frame, text="조회", command=self.filter_patients_by_date, style='info.TButton').pack(side=tk.LEFT, padx=5)
@@ -174,10 +507,7 @@ class ArduinoConnector:
         
         # 환자 정보 컬럼 설정
         patient_columns = ('username', 'createdat', 'receipt_number', 'transmission_status')
-        self.patient_tree = ttk.Treeview(patient_table_frame, columns=patient_columns, show='headings', height=5, yscrollcommand=patient_scrollbar.set, bootstyle="primary")
-        
-        # 스크롤바와 테이블 연결
-        patient_scrollbar.config(command=self.patient_tree.yview)
+        self.patient_tree = ttk.Treeview(patient_table_frame, columns=patient_columns, show='headings', height=5, bootstyle="primary")
         
         # 환자 정보 컬럼 헤더 설정
         self.patient_tree.heading('username', text='환자 이름')
@@ -193,8 +523,8 @@ class ArduinoConnector:
         
         self.patient_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        # 환자 선택 이벤트 바인딩
-        self.patient_tree.bind('<<TreeviewSelect>>', self.on_patient_select)
+        # 보이는 행만 그리는 가상 테이블 (행 key는 접수번호, 스크롤바와 선택 이벤트 처리)
+        self.patient_table = VirtualTable(self.patient_tree, patient_scrollbar, on_select=self.on_patient_select)
         
         # 약물 정보 입력 프레임
         medicine_input_frame = ttk.Frame(prescription_frame)
@@ -244,10 +574,7 @@ class ArduinoConnector:
         
         # 약물 정보 컬럼 설정
         medicine_columns = ('pillname', 'pillcode', 'volume', 'dailyintakenumber', 'intakeperiod', 'totalvolume')
-        self.medicine_tree = ttk.Treeview(medicine_table_frame, columns=medicine_columns, show='headings', height=5, yscrollcommand=medicine_scrollbar.set, bootstyle="primary")
-        
-        # 스크롤바와 테이블 연결
-        medicine_scrollbar.config(command=self.medicine_tree.yview)
+        self.medicine_tree = ttk.Treeview(medicine_table_frame, columns=medicine_columns, show='headings', height=5, bootstyle="primary")
         
         # 약물 정보 컬럼 헤더 설정
         self.medicine_tree.heading('pillname', text='약물명')
@@ -267,6 +594,9 @@ class ArduinoConnector:
         
         self.medicine_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
+        # 보이는 행만 그리는 가상 테이블
+        self.medicine_table = VirtualTable(self.medicine_tree, medicine_scrollbar)
+        
         # 약물 정보 삭제 버튼 프레임
         medicine_button_frame = ttk.Frame(medicine_frame)
         medicine_button_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -290,10 +620,19 @@ class ArduinoConnector:
         )
         self.auto_dispense_toggle.pack(side=tk.LEFT, padx=5)
         
+        # 조제 대기열 상태
+        self.dispense_queue_label = ttk.Label(start_button_frame, text="")
+        self.dispense_queue_label.pack(side=tk.LEFT, padx=10)
+        self.update_dispense_queue_label()
+        
         ttk.Button(start_button_frame, text="조제시작 (F12)", 
                   command=self.start_dispensing,
                   style='success.TButton').pack(side=tk.RIGHT, padx=5)
         
+        ttk.Button(start_button_frame, text="긴급 조제 (F11)", 
+                  command=self.start_urgent_dispensing,
+                  style='danger.TButton').pack(side=tk.RIGHT, padx=5)
+        
         # 조제 로그 프레임
         log_frame = ttk.LabelFrame(prescription_frame, text="조제 로그", bootstyle="primary")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -318,6 +657,10 @@ class ArduinoConnector:
         
         # 로그 텍스트 폰트 설정
         self.log_text.config(font=('Consolas', 10))
+        
+        # 로그 수준별 색상
+        self.log_text.tag_configure('WARNING', foreground='#d97706')
+        self.log_text.tag_configure('ERROR', foreground='#dc2626')
 
     def init_network_ui(self):
         """네트워크 설정 페이지 UI를 초기화합니다."""
@@ -357,6 +700,10 @@ class ArduinoConnector:
         self.ip_list = tk.Listbox(devices_frame, height=10)
         self.ip_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # 마지막 스캔 결과 표시
+        self.scan_status_label = ttk.Label(devices_frame, text="")
+        self.scan_status_label.pack(fill=tk.X, padx=5)
+        
         # 연결 정보 입력 프레임
         info_frame = ttk.Frame(devices_frame)
         info_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -415,6 +762,10 @@ class ArduinoConnector:
         
         self.connected_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # 기기 통신 연결 통계 표시
+        self.connection_stats_label = ttk.Label(connected_frame, text="")
+        self.connection_stats_label.pack(fill=tk.X, padx=5)
+        
         # 돌아가기 버튼
         ttk.Button(scrollable_frame, text="메인 화면으로 돌아가기", 
                   command=self.show_main_page,
@@ -442,26 +793,15 @@ class ArduinoConnector:
 
     def detect_networks(self):
         try:
-            hostname = socket.gethostname()
-            host_ips = socket.getaddrinfo(hostname, None)
-            self.available_networks = []
-            for host_ip in host_ips:
-                if len(host_ip[4]) == 2:
-                    ip = host_ip[4][0]
-                    if not ip.startswith('127.'):
-                        network = '.'.join(ip.split('.')[:-1]) + '.'
-                        if network not in self.available_networks:
-                            self.available_networks.append(network)
-            if self.available_networks:
-                self.network_combo['values'] = self.available_networks
-                self.network_combo.set(self.available_networks[0])
-                self.network_prefix = self.available_networks[0]
-                self.scan_network()
+            networks = self.core.detect_networks()
+            if networks:
+                self.network_combo['values'] = networks
+                self.network_combo.set(networks[0])
             else:
                 ttk.dialogs.Messagebox.show_warning("사용 가능한 네트워크를 찾을 수 없습니다.\n수동으로 설정해주세요.")
                 self.show_network_settings_dialog()
         except Exception as e:
-            print(f"네트워크 감지 중 오류 발생: {e}")
+            self.core.log(f"네트워크 감지 중 오류 발생: {e}", logging.ERROR)
             ttk.dialogs.Messagebox.show_warning("네트워크 감지 중 오류가 발생했습니다.\n수동으로 설정해주세요.")
             self.show_network_settings_dialog()
 
@@ -475,13 +815,10 @@ class ArduinoConnector:
         def on_ok():
             prefix = ip_input.get().strip()
             if prefix and prefix.endswith('.'):
-                self.network_prefix = prefix
-                if prefix not in self.available_networks:
-                    self.available_networks.append(prefix)
-                    self.network_combo['values'] = self.available_networks
-                self.network_combo.set(prefix)
                 dialog.destroy()
-                self.scan_network()
+                self.core.select_network(prefix, reset=True)
+                self.network_combo['values'] = self.core.available_networks
+                self.network_combo.set(prefix)
             else:
                 ttk.dialogs.Messagebox.show_error("올바른 네트워크 주소 범위를 입력하세요.", parent=dialog)
         button_frame = ttk.Frame(dialog)
@@ -489,140 +826,80 @@ class ArduinoConnector:
         ttk.Button(button_frame, text="확인", command=on_ok, style='primary.TButton').pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="취소", command=dialog.destroy, style='secondary.TButton').pack(side=tk.LEFT, padx=5)
 
+    def on_networks_detected(self, networks):
+        """시작할 때 찾은 네트워크 대역을 네트워크 선택 목록에 반영합니다."""
+        self.network_combo['values'] = self.core.available_networks
+        if self.core.network_prefix:
+            self.network_combo.set(self.core.network_prefix)
+        elif networks:
+            self.network_combo.set(networks[0])
+        else:
+            self.scan_status_label.config(text="사용 가능한 네트워크를 찾을 수 없습니다. 수동으로 설정해주세요.")
+
     def on_network_changed(self):
-        self.network_prefix = self.network_combo.get()
-        self.scan_network()
+        self.core.select_network(self.network_combo.get(), reset=True)
 
-    def schedule_scan(self):
-        self.scan_network()
-        self.root.after(5000, self.schedule_scan)
+    def on_device_discovered(self, mac, ip):
+        """스캔 중 응답한 기기를 연결가능한 기기 목록에 반영합니다."""
+        text = f"{ip} (MAC: {mac})"
+        if mac in self.ip_list_macs:
+            i = self.ip_list_macs.index(mac)
+            if self.ip_list.get(i) != text:
+                self.ip_list.delete(i)
+                self.ip_list.insert(i, text)
+        else:
+            self.ip_list.insert(tk.END, text)
+            self.ip_list_macs.append(mac)
 
-    def scan_network(self):
-        if not self.network_prefix:
-            return
-        self.ip_list.delete(0, tk.END)
-        def check_ip(ip):
-            try:
-                response = requests.get(f"http://{ip}", timeout=1)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("status") == "ready":
-                        return data
-            except:
-                pass
-            return None
-        results = {}
-        threads = []
-        for i in range(1, 255):
-            ip = f"{self.network_prefix}{i}"
-            thread = threading.Thread(target=lambda ip=ip: results.update({ip: check_ip(ip)}))
-            thread.start()
-            threads.append(thread)
-        for thread in threads:
-            thread.join()
-        found_devices = {}
-        for ip, data in results.items():
-            if data:
-                mac = data['mac']
-                found_devices[mac] = ip
-                self.ip_list.insert(tk.END, f"{ip} (MAC: {mac})")
-        for mac, info in self.saved_connections.items():
-            if mac in self.connected_devices or mac in self.auto_reconnect_attempted:
-                continue
-            if mac in found_devices:
-                for i in range(self.saved_list.size()):
-                    if mac in self.saved_list.get(i):
-                        self.saved_list.selection_clear(0, tk.END)
-                        self.saved_list.selection_set(i)
-                        self.connect_to_device(silent=True)
-                        self.auto_reconnect_attempted.add(mac)
-                        break
-
-    def connect_to_device(self, silent=False):
-        """기기에 연결합니다."""
+    def on_scan_finished(self, summary):
+        """스캔이 끝나면 응답하지 않은 기기를 목록에서 제거하고 소요 시간을 표시합니다."""
+        for i in reversed(range(len(self.ip_list_macs))):
+            if self.ip_list_macs[i] not in self.core.discovered_devices:
+                self.ip_list.delete(i)
+                del self.ip_list_macs[i]
+        self.scan_status_label.config(text=summary)
+
+    def post_to_ui(self, callback, *args, key=None):
+        """작업 스레드에서 UI 스레드로 콜백을 전달합니다. key가 같은 대기 중인 콜백은 하나로 합쳐집니다."""
+        self.ui.post(callback, *args, key=key)
+
+    def connect_to_device(self):
+        """저장된 기기 목록에서 선택한 기기에 연결합니다."""
         selection = self.saved_list.curselection()
         if not selection:
-            if not silent:
-                ttk.dialogs.Messagebox.show_warning("연결할 기기를 선택해주세요.")
-            return
-            
-        item_text = self.saved_list.get(selection[0])
-        mac = item_text.split("(MAC: ")[1][:-1]
-        
-        if mac in self.connected_devices:
-            if not silent:
-                ttk.dialogs.Messagebox.show_info("이미 연결된 기기입니다.")
+            ttk.dialogs.Messagebox.show_warning("연결할 기기를 선택해주세요.")
             return
-            
-        if mac in self.saved_connections:
-            ip = self.saved_connections[mac]["ip"]
-            try:
-                response = requests.get(f"http://{ip}", timeout=1)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data["mac"] == mac:
-                        self.connected_devices[mac] = {
-                            "ip": ip,
-                            "nickname": self.saved_connections[mac]["nickname"],
-                            "pill_code": self.saved_connections[mac].get("pill_code", ""),
-                            "status": "연결됨"
-                        }
-                        self.connected_tree.insert('', 'end', values=(
-                            self.saved_connections[mac]["nickname"],
-                            self.saved_connections[mac].get("pill_code", ""),
-                            ip, "연결됨",
-                            datetime.now().strftime("%H:%M:%S")))
-                        if not silent:
-                            ttk.dialogs.Messagebox.show_info(f"{self.saved_connections[mac]['nickname']}에 연결되었습니다.")
-                        # 연결 상태 변경 시 약물 색상 업데이트
-                        self.update_medicine_colors()
-                        return
-            except:
-                pass
-            for i in range(self.ip_list.size()):
-                item_text = self.ip_list.get(i)
-                if mac in item_text:
-                    new_ip = item_text.split()[0]
-                    self.saved_connections[mac]["ip"] = new_ip
-                    self.connected_devices[mac] = {
-                        "ip": new_ip,
-                        "nickname": self.saved_connections[mac]["nickname"],
-                        "pill_code": self.saved_connections[mac].get("pill_code", ""),
-                        "status": "연결됨"
-                    }
-                    self.connected_tree.insert('', 'end', values=(
-                        self.saved_connections[mac]["nickname"],
-                        self.saved_connections[mac].get("pill_code", ""),
-                        new_ip, "연결됨",
-                        datetime.now().strftime("%H:%M:%S")))
-                    if not silent:
-                        ttk.dialogs.Messagebox.show_info(f"{self.saved_connections[mac]['nickname']}에 연결되었습니다.")
-                    return
-            if not silent:
-                ttk.dialogs.Messagebox.show_warning("기기를 찾을 수 없습니다.")
+        mac = self.saved_list_macs[selection[0]]
+        result = self.core.connect_to_device(mac)
+        if result == "already_connected":
+            ttk.dialogs.Messagebox.show_info("이미 연결된 기기입니다.")
+        elif result == "connected":
+            ttk.dialogs.Messagebox.show_info(f"{self.core.saved_connections[mac]['nickname']}에 연결되었습니다.")
+        else:
+            ttk.dialogs.Messagebox.show_warning("기기를 찾을 수 없습니다.")
+
+    def on_device_connected(self, mac, info):
+        """연결된 기기를 연결 기기 테이블에 추가합니다."""
+        row = self.connected_tree.insert('', 'end', values=(
+            info["nickname"], info["pill_code"], info["ip"], info["status"],
+            datetime.now().strftime("%H:%M:%S")))
+        self.core.connected_devices.bind_row(mac, row)
+
+    def on_device_disconnected(self, mac, row):
+        """연결이 해제된 기기를 연결 기기 테이블에서 제거합니다."""
+        if row is not None and self.connected_tree.exists(row):
+            self.connected_tree.delete(row)
 
     def disconnect_device(self):
         selection = self.connected_tree.selection()
         if not selection:
             ttk.dialogs.Messagebox.show_warning("연결을 끊을 기기를 선택해주세요.")
             return
-        item = self.connected_tree.item(selection[0])
-        ip = item['values'][2]
-        nickname = item['values'][0]
-        mac_to_remove = None
-        for mac, info in self.connected_devices.items():
-            if info['ip'] == ip:
-                mac_to_remove = mac
-                break
-        if mac_to_remove:
-            self.connected_devices[mac_to_remove]['status'] = "연결 끊김"
-            self.connected_tree.delete(selection[0])
-            if self.last_connected and self.last_connected.get("mac") == mac_to_remove:
-                self.last_connected = None
-            self.save_connections()
-            # 연결 해제 시 약물 색상 업데이트
-            self.update_medicine_colors()
-            ttk.dialogs.Messagebox.show_info(f"{nickname}과의 연결이 해제되었습니다.")
+        mac = self.core.connected_devices.mac_for_row(selection[0])
+        if mac is None:
+            return
+        nickname = self.core.disconnect_device(mac)
+        ttk.dialogs.Messagebox.show_info(f"{nickname}과의 연결이 해제되었습니다.")
 
     def save_connection(self):
         """연결 정보를 저장합니다."""
@@ -632,26 +909,16 @@ class ArduinoConnector:
             return
         nickname = self.nickname_input.get().strip()
         pill_code = self.pill_code_input.get().strip()
-        
+
         if not nickname or nickname == "기기 별명 입력":
             ttk.dialogs.Messagebox.show_warning("별명을 입력해주세요.")
             return
-            
+
         if not pill_code:
             ttk.dialogs.Messagebox.show_warning("약품코드를 입력해주세요.")
             return
-            
-        item_text = self.ip_list.get(selection[0])
-        ip = item_text.split()[0]
-        mac = item_text.split("(MAC: ")[1][:-1]
-        self.saved_connections[mac] = {
-            "ip": ip, 
-            "nickname": nickname,
-            "pill_code": pill_code
-        }
-        self.save_connections()
-        self.update_saved_list()
-        self.update_pill_name_combo()
+
+        self.core.save_device(self.ip_list_macs[selection[0]], nickname, pill_code)
         ttk.dialogs.Messagebox.show_info("연결 정보가 저장되었습니다.")
 
     def delete_device(self):
@@ -660,112 +927,39 @@ class ArduinoConnector:
         if not selection:
             ttk.dialogs.Messagebox.show_warning("삭제할 기기를 선택해주세요.")
             return
-            
-        item_text = self.saved_list.get(selection[0])
-        mac = item_text.split("(MAC: ")[1][:-1]
-        
-        if mac in self.connected_devices:
+
+        if not self.core.delete_device(self.saved_list_macs[selection[0]]):
             ttk.dialogs.Messagebox.show_warning("연결된 기기는 삭제할 수 없습니다. 먼저 연결을 해제해주세요.")
             return
-            
-        del self.saved_connections[mac]
-        self.save_connections()
-        self.update_saved_list()
         ttk.dialogs.Messagebox.show_info("기기가 삭제되었습니다.")
 
-    def load_connections(self):
-        """저장된 연결 정보를 로드합니다."""
-        try:
-            with open("connections.json", "r") as f:
-                data = json.load(f)
-                self.saved_connections = data.get("connections", {})
-                self.last_connected = data.get("last_connected")
-                
-                # 기존 연결 정보에 pill_code 필드가 없는 경우 추가
-                for mac, info in self.saved_connections.items():
-                    if "pill_code" not in info:
-                        info["pill_code"] = ""
-                
-            self.update_saved_list()
-        except FileNotFoundError:
-            pass
-
-    def save_connections(self):
-        data = {"connections": self.saved_connections, "last_connected": self.last_connected}
-        with open("connections.json", "w") as f:
-            json.dump(data, f)
+    def on_saved_devices_changed(self):
+        self.update_saved_list()
+        self.update_pill_name_combo()
 
     def update_saved_list(self):
         self.saved_list.delete(0, tk.END)
-        for mac, info in self.saved_connections.items():
+        self.saved_list_macs = []
+        for mac, info in self.core.saved_connections.items():
             self.saved_list.insert(tk.END, f"{info['nickname']} (MAC: {mac})")
+            self.saved_list_macs.append(mac)
 
-    def schedule_connection_check(self):
-        for item in self.connected_tree.get_children():
-            values = self.connected_tree.item(item)['values']
-            ip = values[2]
-            current_status = values[3]  # 현재 상태 가져오기
-            mac = None
-            for device_mac, device_info in self.connected_devices.items():
-                if device_info['ip'] == ip:
-                    mac = device_mac
-                    break
-            
-            # 조제 중인 기기는 연결 상태 확인을 건너뛰기
-            if current_status == "시럽 조제 중":
-                self.log_message(f"조제 중인 기기 연결 상태 확인 건너뜀: {ip}")
-                continue
-                
-            try:
-                # 연결 상태 확인을 위한 재시도 로직 추가
-                response = None
-                for retry in range(2):
-                    try:
-                        response = requests.get(f"http://{ip}", timeout=5)  # 타임아웃을 5초로 증가
-                        break
-                    except requests.exceptions.Timeout:
-                        if retry == 0:
-                            self.log_message(f"연결 상태 확인 재시도: {ip} - timeout of 5000ms exceeded")
-                            time.sleep(1)  # 1초 대기 후 재시도
-                        else:
-                            raise
-                    except Exception as e:
-                        if retry == 1:
-                            self.log_message(f"연결 상태 확인 실패: {ip} - {str(e)}")
-                        raise
-                        
-                if response and response.status_code == 200:
-                    data = response.json()
-                    if mac and data.get("mac") == mac:
-                        self.update_device_status(ip, "연결됨")
-                    else:
-                        self.connected_tree.delete(item)
-                        if mac:
-                            del self.connected_devices[mac]
-                else:
-                    self.update_device_status(ip, "연결 끊김")
-            except Exception as e:
-                self.update_device_status(ip, "연결 끊김")
-                self.log_message(f"연결 상태 확인 오류: {ip} - {str(e)}")
-        # 연결 상태 변경 후 약물 색상 갱신
-        self.update_medicine_colors()
-        self.root.after(5000, self.schedule_connection_check)
-
-    def update_device_status(self, ip, status):
-        for mac, device_info in self.connected_devices.items():
-            if device_info['ip'] == ip:
-                self.connected_devices[mac]['status'] = status  # 항상 status 갱신!
-                # connected_tree도 갱신
-                for item in self.connected_tree.get_children():
-                    if self.connected_tree.item(item)['values'][2] == ip:
-                        values = list(self.connected_tree.item(item)['values'])
-                        values[3] = status
-                        values[4] = datetime.now().strftime("%H:%M:%S")
-                        self.connected_tree.item(item, values=values)
-                        break
-                break
-        # 연결 상태 변경 시 약물 색상도 갱신
-        self.update_medicine_colors()
+    def on_device_status(self, mac):
+        # 연결 기기 테이블은 다음 프레임에 기기별로 한 번만 갱신
+        self.post_to_ui(self.update_device_row, mac, key=("device_row", mac))
+
+    def update_device_row(self, mac):
+        """연결 기기 테이블에서 기기 행의 상태와 마지막 활동 시각을 현재 값으로 갱신합니다."""
+        device_info = self.core.connected_devices.get(mac)
+        row = self.core.connected_devices.row_for(mac)
+        if device_info is None or row is None or not self.connected_tree.exists(row):
+            return
+        self.connected_tree.set(row, 'status', device_info['status'])
+        self.connected_tree.set(row, 'last_activity', datetime.now().strftime("%H:%M:%S"))
+
+    def on_connection_stats(self, stats):
+        self.connection_stats_label.config(
+            text=f"HTTP 요청 {stats['requests']}회, 새 연결 {stats['opened']}회, 연결 재사용 {stats['reused']}회")
 
     def send_syrup_amount(self):
         selection = self.connected_tree.selection()
@@ -779,64 +973,48 @@ class ArduinoConnector:
         except ValueError:
             ttk.dialogs.Messagebox.show_warning("올바른 용량을 입력해주세요.")
             return
-        item = self.connected_tree.item(selection[0])
-        ip = item['values'][2]
+        mac = self.core.connected_devices.mac_for_row(selection[0])
+        if mac is None:
+            return
         try:
-            response = requests.post(f"http://{ip}/syrup", json={"amount": amount}, timeout=1)
-            if response.status_code == 200:
+            if self.core.send_syrup_amount(mac, amount):
                 ttk.dialogs.Messagebox.show_info("시럽 용량이 전송되었습니다.")
-                self.update_device_status(ip, "시럽 조제 중")
             else:
                 ttk.dialogs.Messagebox.show_error("시럽 용량 전송에 실패했습니다.")
         except:
             ttk.dialogs.Messagebox.show_error("시럽조제기와 통신할 수 없습니다.")
 
-    def on_patient_select(self, event):
-        selection = self.patient_tree.selection()
+    def on_patient_select(self, event=None):
+        selection = self.patient_table.selection()
         if not selection:
             return
-        receipt_number = str(self.patient_tree.item(selection[0])['values'][2]).strip()
+        receipt_number = selection[0]
         # 약물 정보 테이블 초기화
-        for item in self.medicine_tree.get_children():
-            self.medicine_tree.delete(item)
-        # 딕셔너리 키도 strip해서 비교
-        for k in self.parsed_prescriptions.keys():
-            if k.strip() == receipt_number:
-                for medicine in self.parsed_prescriptions[k]['medicines']:
-                    self.medicine_tree.insert(
-                        '', 'end',
-                        values=(
-                            medicine['pill_name'],
-                            medicine['pill_code'],
-                            medicine['volume'],
-                            medicine['daily'],
-                            medicine['period'],
-                            medicine['total']
-                        ),
-                        tags=('connected' if any(str(device.get('pill_code', '')) == str(medicine['pill_code']) for device in self.connected_devices.values()) else 'disconnected')
-                    )
-                break
-        # 약물 정보 테이블 초기화 및 데이터 삽입 후
-        self.update_medicine_colors()
+        self.clear_medicine_rows()
+        prescription = self.core.parsed_prescriptions.get(receipt_number)
+        if prescription:
+            for medicine in prescription.medicines:
+                self.insert_medicine_row(medicine.pill_name, medicine.pill_code, medicine.volume,
+                                         medicine.daily, medicine.period, medicine.total)
 
     def add_patient(self):
         """환자 정보를 테이블에 추가합니다."""
         name = self.patient_name.get().strip()
         time = self.receipt_time.get().strip()
         number = self.receipt_number.get().strip()
-        
+
         if not all([name, time, number]):
             ttk.dialogs.Messagebox.show_warning("모든 환자 정보를 입력해주세요.")
             return
-            
+
         # 최근 데이터가 최상단에 위치하도록 0번 인덱스에 삽입
-        self.patient_tree.insert('', 0, values=(name, time, number, ""))
-        
+        self.insert_patient_row(0, name, time, number)
+
         # 입력 필드 초기화
         self.patient_name.delete(0, tk.END)
         self.receipt_time.delete(0, tk.END)
         self.receipt_number.delete(0, tk.END)
-        
+
         # 환자 이름 입력 필드로 포커스 이동
         self.patient_name.focus()
 
@@ -844,7 +1022,7 @@ class ArduinoConnector:
         """약물 정보를 테이블에 추가합니다."""
         name = self.pill_name.get().strip()
         code = self.pill_code.get().strip()
-        
+
         try:
             volume = int(self.volume.get().strip())
             daily = int(self.daily_intake.get().strip())
@@ -853,23 +1031,14 @@ class ArduinoConnector:
         except ValueError:
             ttk.dialogs.Messagebox.show_warning("1회 복용량, 일일복용횟수, 일수는 정수로 입력해주세요.")
             return
-            
+
         if not all([name, code]):
             ttk.dialogs.Messagebox.show_warning("약물명과 약물코드를 입력해주세요.")
             return
-            
-        # 현재 연결된 기기 중 해당 약품 코드와 일치하는 기기 찾기
-        is_connected = False
-        for device_info in self.connected_devices.values():
-            if device_info.get('pill_code') == code:
-                is_connected = True
-                break
-        
+
         # 약물 정보 추가 (연결 상태에 따라 태그 설정)
-        item = self.medicine_tree.insert('', 'end', values=(
-            name, code, volume, daily, period, total
-        ), tags=('connected' if is_connected else 'disconnected'))
-        
+        self.insert_medicine_row(name, code, volume, daily, period, total)
+
         # 입력 필드 초기화
         self.pill_name.delete(0, tk.END)
         self.pill_code.delete(0, tk.END)
@@ -877,280 +1046,160 @@ class ArduinoConnector:
         self.daily_intake.delete(0, tk.END)
         self.intake_period.delete(0, tk.END)
 
-    def update_medicine_colors(self):
-        """약물 정보 테이블의 모든 항목의 색상을 현재 연결 상태에 따라 업데이트합니다."""
-        print("=== update_medicine_colors 호출 ===")
-        for item in self.medicine_tree.get_children():
-            values = self.medicine_tree.item(item)['values']
-            pill_code = str(values[1]).strip()
-            is_connected = False
-            for device_info in self.connected_devices.values():
-                print(f"비교: 약물코드={pill_code}, 기기코드={str(device_info.get('pill_code', '')).strip()}, 상태={device_info.get('status', '')}")
-                if (
-                    str(device_info.get('pill_code', '')).strip() == pill_code
-                    and device_info.get('status', '') == '연결됨'
-                ):
-                    is_connected = True
-                    break
-            print(f"약물코드 {pill_code} -> {'파랑' if is_connected else '빨강'}")
-            self.medicine_tree.item(item, tags=('connected' if is_connected else 'disconnected'))
-
-    def log_message(self, message):
-        """로그 메시지를 추가합니다."""
-        try:
-            self.log_text.config(state=tk.NORMAL)
-            self.log_text.insert(tk.END, f"{datetime.now().strftime('%H:%M:%S')} - {message}\n")
-            self.log_text.see(tk.END)  # 스크롤을 최신 메시지로 이동
-            self.log_text.config(state=tk.DISABLED)
-            print(f"로그 메시지: {message}")  # 디버깅을 위한 콘솔 출력
-        except Exception as e:
-            print(f"로그 메시지 출력 중 오류 발생: {str(e)}")
+    def insert_medicine_row(self, pill_name, pill_code, volume, daily, period, total):
+        """약물 정보 테이블에 행을 추가하고 약품코드별 행 목록에 등록합니다."""
+        pill_code = normalize_pill_code(pill_code)
+        tag = 'connected' if pill_code in self.core.connected_devices.ready_pill_codes else 'disconnected'
+        item = self.medicine_table.insert('end', str(next(self.medicine_keys)), (
+            pill_name, pill_code, volume, daily, period, total
+        ), tags=(tag,))
+        self.medicine_rows[item] = (pill_name, pill_code, total)
+        self.medicine_items_by_code.setdefault(pill_code, set()).add(item)
+        return item
+
+    def delete_medicine_row(self, item):
+        pill_code = self.medicine_rows.pop(item)[1]
+        items = self.medicine_items_by_code.get(pill_code)
+        if items is not None:
+            items.discard(item)
+            if not items:
+                del self.medicine_items_by_code[pill_code]
+        self.medicine_table.delete(item)
+
+    def clear_medicine_rows(self):
+        self.medicine_table.clear()
+        self.medicine_rows.clear()
+        self.medicine_items_by_code.clear()
+
+    def on_pill_codes_changed(self, pill_codes):
+        """연결 상태가 바뀐 약품코드를 모아 두었다가 다음 프레임에 해당 약물만 다시 칠합니다."""
+        self.pending_color_codes |= pill_codes
+        self.post_to_ui(self.flush_medicine_colors, key="medicine_colors")
+
+    def flush_medicine_colors(self):
+        """이번 프레임 동안 상태가 바뀐 약품코드의 약물 색상을 한 번에 다시 칠합니다."""
+        pill_codes, self.pending_color_codes = self.pending_color_codes, set()
+        self.update_medicine_colors(pill_codes)
+
+    def update_medicine_colors(self, pill_codes=None):
+        """약물 정보 테이블 항목의 색상을 현재 연결 상태에 따라 업데이트합니다.
 
-    def start_dispensing(self, event=None):
-        """연결된 약물의 총량을 해당 기기에 전송합니다."""
+        pill_codes를 주면 해당 약품코드의 항목만 다시 칠합니다.
+        """
+        if pill_codes is None:
+            pill_codes = list(self.medicine_items_by_code)
+        for pill_code in pill_codes:
+            tag = 'connected' if pill_code in self.core.connected_devices.ready_pill_codes else 'disconnected'
+            for item in self.medicine_items_by_code.get(pill_code, ()):
+                self.medicine_table.update(item, tags=(tag,))
+
+    def log_message(self, message, level=logging.INFO, **fields):
+        """조제 로그에 메시지를 남깁니다. 어느 스레드에서나 호출할 수 있습니다."""
+        self.core.log(message, level, **fields)
+
+    def on_core_log(self, message, level):
+        """LOG_UI_LEVEL 이상의 로그만 모아 두었다가 다음 프레임에 화면에 그립니다. 작업 스레드에서도 호출됩니다."""
+        if level >= LOG_UI_LEVEL:
+            line = f"{datetime.now().strftime('%H:%M:%S')} - {message}\n"
+            self.pending_log_lines.append((line, logging.getLevelName(level)))
+            self.post_to_ui(self.flush_log, key="log")
+
+    def flush_log(self):
+        """모아 둔 로그 줄을 한 번에 추가하고, LOG_MAX_LINES를 넘는 오래된 줄은 지웁니다."""
+        chunks = []
+        while self.pending_log_lines:
+            chunks.extend(self.pending_log_lines.popleft())
+        if not chunks:
+            return
+        # 사용자가 위로 스크롤해 둔 경우에는 최신 메시지로 이동하지 않음
+        at_bottom = self.log_text.yview()[1] >= 0.999
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.insert(tk.END, *chunks)
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_text.delete('1.0', f'{excess + 1}.0')
+        self.log_text.config(state=tk.DISABLED)
+        if at_bottom:
+            self.log_text.see(tk.END)
+
+    def start_urgent_dispensing(self, event=None):
+        self.start_dispensing(urgent=True)
+
+    def start_dispensing(self, event=None, urgent=False):
+        """선택한 환자의 약물 정보 테이블 내용을 조제 대기열에 넣습니다.
+
+        urgent면 긴급 작업으로 넣고, 이미 대기열에 있는 접수번호는 남은 작업을 긴급으로 올립니다.
+        """
         # 현재 선택된 환자 정보 가져오기
-        selected_patients = self.patient_tree.selection()
+        selected_patients = self.patient_table.selection()
         if not selected_patients:
             message = "환자를 선택해주세요."
-            self.log_message(message)
+            self.log_message(message, logging.WARNING)
             ttk.dialogs.Messagebox.show_warning("경고", message)
             return
-            
-        receipt_number = self.patient_tree.item(selected_patients[0])['values'][2]
-        
-        # 연결된 기기 목록 가져오기
-        connected_devices = self.connected_devices
-        
-        if not connected_devices:
+
+        receipt_number = selected_patients[0]
+        patient_name = self.patient_table.values(receipt_number)[0]
+
+        if urgent and self.core.dispense_queue.has_receipt(receipt_number):
+            self.core.promote(receipt_number)
+            return
+
+        if not self.core.connected_devices:
             message = "연결된 시럽조제기가 없습니다."
-            self.log_message(message)
+            self.log_message(message, logging.WARNING)
             ttk.dialogs.Messagebox.show_warning("연결된 시럽조제기가 없습니다.", message)
             return
-            
-        # 디버깅을 위한 로그 추가
-        self.log_message(f"연결된 기기 목록: {connected_devices}")
-        
-        # 모든 약물 전송 성공 여부를 추적
-        all_success = True
-            
-        # 약물 정보 테이블의 모든 항목 확인
-        for item in self.medicine_tree.get_children():
-            values = self.medicine_tree.item(item)['values']
-            pill_name = values[0]
-            pill_code = str(values[1])  # 문자열로 변환
-            total_volume = values[5]  # 전체 용량
-            
-            # 연결된 약물인지 확인 (파란색으로 표시된 약물만 처리)
-            is_connected = False
-            connected_device_info = None
-            for device_info in connected_devices.values():
-                if str(device_info.get('pill_code', '')) == pill_code:
-                    if device_info.get('status', '') == '연결됨':
-                        is_connected = True
-                        connected_device_info = device_info
-                    break
-            
-            if not is_connected:
-                self.log_message(f"{pill_name}은(는) 연결되지 않은 약물이므로 건너뜁니다.")
-                all_success = False
-                continue
-            
-            # 디버깅을 위한 로그 추가
-            self.log_message(f"처리 중인 약물: {pill_name}, 코드: {pill_code}, 총량: {total_volume}")
-            
-            # 연결된 기기 중 해당 약품 코드와 일치하는 기기 찾기
-            device_found = False
-            for mac, device_info in connected_devices.items():
-                device_pill_code = str(device_info.get('pill_code', ''))  # 문자열로 변환
-                if device_pill_code == pill_code and device_info.get('status', '') == '연결됨':
-                    device_found = True
-                    ip = device_info['ip']
-                    
-                    # 조제 시작 전에 상태를 "시럽 조제 중"으로 변경
-                    self.update_device_status(ip, "시럽 조제 중")
-                    self.log_message(f"{pill_name} 조제 시작 - 기기 상태를 '시럽 조제 중'으로 변경")
-                    
-                    # 최대 3번까지 재시도
-                    max_retries = 3
-                    retry_count = 0
-                    success = False
-                    
-                    while retry_count < max_retries and not success:
-                        try:
-                            # 선택된 환자 정보 가져오기
-                            selected_patients = self.patient_tree.selection()
-                            patient_name = "Unknown"
-                            if selected_patients:
-                                patient_name = self.patient_tree.item(selected_patients[0])['values'][0]
-                            
-                            # 환자 이름과 총량을 JSON 형태로 전송
-                            data = {
-                                "patient_name": patient_name,
-                                "total_volume": total_volume
-                            }
-                            headers = {
-                                'Content-Type': 'application/json',
-                                'Accept': 'application/json'
-                            }
-                            response = requests.post(f"http://{ip}/dispense", 
-                                                  json=data,
-                                                  headers=headers,
-                                                  timeout=30)  # 타임아웃을 30초로 증가
-                            
-                            # 응답 상세 정보 로깅
-                            self.log_message(f"응답 상태 코드: {response.status_code}")
-                            self.log_message(f"응답 내용: {response.text}")
-                            
-                            # JSON 파싱
-                            StaticJsonDocument<256> doc;  # 크기를 늘려서 환자 이름을 포함할 수 있도록 함
-                            DeserializationError err = deserializeJson(doc, response.text);
-                            if (!err && doc.containsKey("total_volume")) {
-                              int total_volume = doc["total_volume"];
-                              String patient_name = doc["patient_name"] | "Unknown";  # 환자 이름이 없으면 "Unknown"
-                              
-                              Serial.println("📥 환자 이름 수신: " + patient_name);
-                              Serial.println("📥 total_volume 수신: " + String(total_volume) + " mL");
-
-                              U_volume = total_volume;
-                              // HMI와 동일하게 목표량을 표시
-                              sendToNextion("tPump.txt=\"Vol=" + String(U_volume) + "mL\"");
-                              
-                              // 환자 이름을 HMI의 process.t2.txt에 전송
-                              sendToNextion("process.t2.txt=\"" + patient_name + "\"");
-
-                              // 1) 응답 먼저 전송
-                              String res = "OK";
-                              client.println("HTTP/1.1 200 OK");
-                              client.println("Content-Type: text/plain");
-                              client.print  ("Content-Length: "); client.println(res.length());
-                              client.println("Connection: close");
-                              client.println();
-                              client.print(res);
-                              client.flush();
-                              client.stop();
-
-                              if (pageSwitchedToProcess || !jobQueue.empty()) {
-                                jobQueue.push({total_volume, marginFlag});
-                                Serial.println("�� 현재 시퀀스 진행 중 또는 대기열 존재 → 작업 대기열에 추가됨");
-                              } else {
-                                jobQueue.push({ total_volume, marginFlag });
-                              }
-
-                              return;
-                            }
-                            
-                            // ESP32의 응답 확인
-                            if response.status_code == 200:
-                                if "BUSY" in response.text:
-                                    message = f"{pill_name} 조제 중 - 대기열에 추가됨"
-                                    self.log_message(message)
-                                    success = True
-                                elif "OK" in response.text:
-                                message = f"{pill_name} 총량 전달 성공"
-                                self.log_message(message)
-                                success = True
-                                else:
-                                    message = f"{pill_name} 총량 전달 실패 (시도 {retry_count + 1}/{max_retries})"
-                                    self.log_message(message)
-                                    retry_count += 1
-                                    if retry_count < max_retries:
-                                        self.log_message("3초 후 재시도합니다...")
-                                        time.sleep(3)  # 3초 대기 후 재시도
-                            else:
-                                message = f"{pill_name} 총량 전달 실패 (시도 {retry_count + 1}/{max_retries})"
-                                self.log_message(message)
-                                retry_count += 1
-                                if retry_count < max_retries:
-                                    self.log_message("3초 후 재시도합니다...")
-                                    time.sleep(3)  # 3초 대기 후 재시도
-                        except requests.exceptions.Timeout as e:
-                            message = f"{pill_name} 총량 전달 중 오류: timeout of 10000ms exceeded"
-                            self.log_message(message)
-                            retry_count += 1
-                            if retry_count < max_retries:
-                                self.log_message("3초 후 재시도합니다...")
-                                time.sleep(3)
-                        except requests.exceptions.ConnectionError as e:
-                            message = f"{pill_name} 연결 오류 (시도 {retry_count + 1}/{max_retries}): {str(e)}"
-                            self.log_message(message)
-                            retry_count += 1
-                            if retry_count < max_retries:
-                                self.log_message("3초 후 재시도합니다...")
-                                time.sleep(3)
-                        except Exception as e:
-                            message = f"{pill_name} 총량 전달 중 오류: {str(e)}"
-                            self.log_message(message)
-                            retry_count += 1
-                            if retry_count < max_retries:
-                                self.log_message("3초 후 재시도합니다...")
-                                time.sleep(3)
-                            else:
-                                ttk.dialogs.Messagebox.show_error("오류", message)
-                                break
-                    
-                    if not success:
-                        message = f"{pill_name} 총량 전달 실패 (최대 재시도 횟수 초과)"
-                        self.log_message(message)
-                        ttk.dialogs.Messagebox.show_error("오류", message)
-                        all_success = False
-                        # 실패 시 상태를 다시 "연결됨"으로 복원
-                        self.update_device_status(ip, "연결됨")
-                        self.log_message(f"{pill_name} 조제 실패 - 기기 상태를 '연결됨'으로 복원")
-                    else:
-                        # 성공 시에도 일정 시간 후 상태를 "연결됨"으로 복원 (조제 완료 후)
-                        def restore_status():
-                            self.update_device_status(ip, "연결됨")
-                            self.log_message(f"{pill_name} 조제 완료 - 기기 상태를 '연결됨'으로 복원")
-                        # 30초 후에 상태 복원 (조제 시간을 고려)
-                        self.root.after(30000, restore_status)
-                    break  # 일치하는 기기를 찾았으면 다음 약물로 넘어감
-            
-            if not device_found:
-                message = f"{pill_name}에 연결된 시럽조제기가 없습니다."
-                self.log_message(message)
-                ttk.dialogs.Messagebox.show_warning("경고", message)
-                all_success = False
-        
-        # 모든 약물 전송이 성공적으로 완료되었는지 확인하고 상태 업데이트
-        if all_success:
-            self.update_transmission_status(receipt_number, "완료")
-        else:
-            self.update_transmission_status(receipt_number, "실패")
+
+        medicines = [self.medicine_rows[item] for item in self.medicine_table.keys()]
+        if self.core.enqueue_dispense(receipt_number, patient_name, medicines, urgent=urgent) == "duplicate":
+            ttk.dialogs.Messagebox.show_warning(f"접수번호 {receipt_number}의 조제 작업이 이미 대기열에 있습니다.")
+
+    def update_dispense_queue_label(self):
+        """조제 대기열 길이와 긴급/일반 작업의 처방전 도착 -> 기기 수신 지연 시간을 표시합니다."""
+        self.dispense_queue_label.config(text=self.core.dispense_queue_summary())
+
+    def on_dispense_failed(self, receipt_number, pill_names):
+        ttk.dialogs.Messagebox.show_error("오류", f"{', '.join(pill_names)} 총량 전달 실패 (최대 재시도 횟수 초과)")
+
+    def on_dispense_expired(self, receipt_number, pill_names):
+        ttk.dialogs.Messagebox.show_warning(
+            f"{', '.join(pill_names)}: 기기 연결이 오래 끊겨 조제 작업을 취소했습니다.\n"
+            f"기기를 확인한 뒤 다시 조제해주세요.")
 
     def delete_selected_medicine(self):
         """선택된 약물 정보를 삭제합니다."""
-        selected_items = self.medicine_tree.selection()
+        selected_items = self.medicine_table.selection()
         if not selected_items:
             ttk.dialogs.Messagebox.show_warning("삭제할 약물을 선택해주세요.")
             return
-            
+
         for item in selected_items:
-            values = self.medicine_tree.item(item)['values']
-            pill_name = values[0]
-            self.medicine_tree.delete(item)
+            pill_name = self.medicine_rows[item][0]
+            self.delete_medicine_row(item)
             self.log_message(f"약물 '{pill_name}'이(가) 삭제되었습니다.")
-            
+
         ttk.dialogs.Messagebox.show_info("선택된 약물이 삭제되었습니다.")
 
     def on_pill_code_entered(self, event):
         """약품코드 입력 시 해당 시럽조제기의 별명을 약물명에 자동 입력합니다."""
         pill_code = self.pill_code.get().strip()
-        
+
         # 저장된 연결 정보에서 해당 약품코드와 일치하는 시럽조제기 찾기
-        for device_info in self.saved_connections.values():
+        for device_info in self.core.saved_connections.values():
             if device_info.get('pill_code') == pill_code:
                 # 약물명 입력 필드에 시럽조제기 별명 입력
                 self.pill_name.delete(0, tk.END)
                 self.pill_name.insert(0, device_info['nickname'])
                 break
-        
+
         # 다음 입력 필드로 포커스 이동
         self.volume.focus()
 
     def update_pill_name_combo(self):
         """저장된 시럽조제기 목록을 콤보박스에 업데이트합니다."""
         pill_names = []
-        for device_info in self.saved_connections.values():
+        for device_info in self.core.saved_connections.values():
             if device_info.get('nickname') and device_info.get('nickname') not in pill_names:
                 pill_names.append(device_info['nickname'])
         self.pill_name['values'] = sorted(pill_names)
@@ -1158,7 +1207,7 @@ class ArduinoConnector:
     def on_pill_name_selected(self, event):
         """약물명이 선택되었을 때 해당하는 약물코드를 자동으로 채웁니다."""
         selected_name = self.pill_name.get()
-        for device_info in self.saved_connections.values():
+        for device_info in self.core.saved_connections.values():
             if device_info.get('nickname') == selected_name:
                 self.pill_code.delete(0, tk.END)
                 self.pill_code.insert(0, device_info.get('pill_code', ''))
@@ -1171,158 +1220,53 @@ class ArduinoConnector:
         if path:
             self.path_entry.delete(0, tk.END)
             self.path_entry.insert(0, path)
-            self.prescription_path = path
             self.save_prescription_path()
 
     def save_prescription_path(self):
-        """처방전 파일 경로를 저장합니다."""
-        path = self.path_entry.get().strip()
-        if path and os.path.exists(path):
-            self.prescription_path = path
-            with open("prescription_path.txt", "w") as f:
-                f.write(path)
+        """처방전 파일 경로를 저장하고 새 경로의 처방전을 다시 불러옵니다."""
+        if self.core.set_prescription_path(self.path_entry.get().strip()):
             ttk.dialogs.Messagebox.show_info("처방전 파일 경로가 저장되었습니다.")
         else:
             ttk.dialogs.Messagebox.show_warning("올바른 경로를 입력해주세요.")
 
-    def load_prescription_path(self):
-        """저장된 처방전 파일 경로를 로드합니다."""
-        try:
-            with open("prescription_path.txt", "r") as f:
-                return f.read().strip()
-        except:
-            return ""
-
-    def start_prescription_monitor(self):
-        """처방전 파일을 모니터링합니다."""
-        if not self.prescription_path:
+    def start_bulk_import(self):
+        """처방전 폴더 전체를 백그라운드에서 여러 프로세스로 파싱해 캐시에 저장합니다."""
+        if self.core.import_running:
             return
-            
-        def monitor():
-            while True:
-                try:
-                    # 가장 최근 파일 찾기
-                    files = glob.glob(os.path.join(self.prescription_path, "*.txt"))
-                    if files:
-                        latest_file = max(files, key=os.path.getctime)
-                        # 아직 파싱하지 않은 파일인 경우에만 파싱
-                        if latest_file not in self.parsed_files:
-                            self.parse_prescription_file(latest_file)
-                            self.parsed_files.add(latest_file)
-                except Exception as e:
-                    print(f"파일 모니터링 중 오류 발생: {e}")
-                time.sleep(5)  # 5초마다 확인
-        
-        thread = threading.Thread(target=monitor, daemon=True)
-        thread.start()
-
-    def parse_prescription_file(self, file_path):
-        """처방전 파일을 파싱합니다."""
-        try:
-            # 이미 파싱된 파일인지 확인
-            if file_path in self.parsed_files:
-                return
-                
-            # cp949 인코딩으로 파일 읽기 시도
-            try:
-                with open(file_path, 'r', encoding='cp949') as f:
-                    lines = f.readlines()
-            except UnicodeDecodeError:
-                # cp949로 실패하면 euc-kr 시도
-                with open(file_path, 'r', encoding='euc-kr') as f:
-                    lines = f.readlines()
-                
-            if not lines:
-                return
-                
-            # 파일명에서 접수번호 추출
-            receipt_number = os.path.basename(file_path).split('.')[0]
-            
-            # 환자 이름 파싱
-            patient_name = lines[0].strip()
-            
-            # 접수 시간 생성 (파일명의 날짜 부분 사용)
-            receipt_time = f"{receipt_number[:4]}-{receipt_number[4:6]}-{receipt_number[6:8]}"
-            
-            # 약물 정보 파싱
-            medicine_data = []
-            for line in lines[1:]:
-                if not line.strip():
-                    continue
-                parts = line.strip().split('\\')
-                if len(parts) >= 8:
-                    medicine_data.append({
-                        'pill_code': parts[0],
-                        'pill_name': parts[1],
-                        'volume': int(parts[2]),
-                        'daily': int(parts[3]),
-                        'period': int(parts[4]),
-                        'total': int(parts[5]),
-                        'date': parts[6],
-                        'line_number': int(parts[7])
-                    })
-            # 처방전줄수 기준으로 정렬
-            medicine_data.sort(key=lambda x: x['line_number'])
-            # 파싱된 데이터 저장
-            self.parsed_prescriptions[receipt_number] = {
-                'patient': {
-                    'name': patient_name,
-                    'receipt_time': receipt_time,
-                    'receipt_number': receipt_number
-                },
-                'medicines': medicine_data
-            }
-            # 환자 정보 테이블에 추가 (중복 방지)
-            already_exists = False
-            for item in self.patient_tree.get_children():
-                values = self.patient_tree.item(item)['values']
-                if str(values[2]) == receipt_number:
-                    already_exists = True
-                    break
-            if not already_exists:
-                self.patient_tree.insert('', 0, values=(patient_name, receipt_time, receipt_number, ""))
-                # 자동 조제가 활성화되어 있다면 자동으로 조제 시작
-                if self.auto_dispensing:
-                    self.log_message(f"새로운 처방전 '{os.path.basename(file_path)}'이(가) 감지되어 자동으로 조제를 시작합니다.")
-                    self.start_dispensing()
-            # 파싱된 파일 목록에 추가
-            self.parsed_files.add(file_path)
-            # 로그 메시지 추가
-            self.log_message(f"처방전 파일 '{os.path.basename(file_path)}' 파싱 완료")
-        except Exception as e:
-            error_msg = f"파일 파싱 중 오류 발생: {str(e)}"
-            print(error_msg)
-            self.log_message(error_msg)
-
-    def parse_all_prescription_files(self):
-        """처방전 폴더 내 모든 txt 파일을 파싱하여 오늘 날짜의 환자 정보만 테이블에 표시합니다."""
-        if not self.prescription_path:
+        if not self.core.start_bulk_import():
+            ttk.dialogs.Messagebox.show_warning("올바른 처방전 파일 경로를 먼저 저장해주세요.")
             return
-        files = glob.glob(os.path.join(self.prescription_path, "*.txt"))
-        for file_path in files:
-            self.parse_prescription_file(file_path)
-        # 오늘 날짜로 필터링하여 표시
-        if hasattr(self, 'date_var'):
-            self.filter_patients_by_date()
-        else:
-            today = datetime.now().strftime('%Y-%m-%d')
-            for item in self.patient_tree.get_children():
-                self.patient_tree.delete(item)
-            for pres in self.parsed_prescriptions.values():
-                patient = pres['patient']
-                if patient['receipt_time'] == today:
-                    self.patient_tree.insert('', 0, values=(patient['name'], patient['receipt_time'], patient['receipt_number'], ""))
+        self.import_progress['value'] = 0
+        self.import_progress_label.config(text="파일 목록 확인 중...")
+        self.import_progress_frame.pack(fill=tk.X, padx=5, pady=5)
+
+    def on_bulk_import_progress(self, done, total):
+        self.import_progress['maximum'] = max(total, 1)
+        self.import_progress['value'] = done
+        self.import_progress_label.config(text=f"{done}/{total}")
+
+    def on_bulk_import_finished(self, result, error):
+        self.import_progress_frame.pack_forget()
+
+    def on_prescription_added(self, prescription):
+        """새로 도착한 처방전을 환자 정보 테이블 맨 위에 추가합니다."""
+        self.insert_patient_row(0, prescription.patient_name, prescription.receipt_time, prescription.receipt_number)
 
     def filter_patients_by_date(self):
-        selected_date = self.date_var.get()
-        for item in self.patient_tree.get_children():
-            self.patient_tree.delete(item)
-        for pres in self.parsed_prescriptions.values():
-            patient = pres['patient']
-            if patient['receipt_time'] == selected_date:
-                self.patient_tree.insert('', 0, values=(patient['name'], patient['receipt_time'], patient['receipt_number'], ""))
+        """선택한 날짜의 환자만 표시합니다. 'YYYY-MM-DD~YYYY-MM-DD' 형식이면 기간으로 조회합니다."""
+        prescriptions = self.core.prescriptions_for(self.date_var.get())
+        transmission_status = self.core.transmission_status
+        # 최근 접수가 최상단에 위치하도록 접수번호 역순으로 표시 (보이는 행만 다시 그림)
+        self.patient_table.set_rows(
+            (pres.receipt_number,
+             (pres.patient_name, pres.receipt_time, pres.receipt_number,
+              transmission_status.get(pres.receipt_number, "")),
+             ())
+            for pres in reversed(prescriptions))
 
     def show_calendar_popup(self):
+        # 달력은 처음 열 때 불러옴 (babel 로케일 데이터까지 읽으므로 시작 시간에서 제외)
+        from tkcalendar import Calendar
         # 별도의 Toplevel 인스턴스 생성
         cal_root = tk.Toplevel(self.root)
         cal_root.title("날짜 선택")
@@ -1344,23 +1288,69 @@ class ArduinoConnector:
 
     def toggle_auto_dispensing(self):
         """자동 조제 상태를 토글합니다."""
-        self.auto_dispensing = self.auto_dispense_var.get()
-        status = "활성화" if self.auto_dispensing else "비활성화"
+        self.core.auto_dispensing = self.auto_dispense_var.get()
+        status = "활성화" if self.core.auto_dispensing else "비활성화"
         self.log_message(f"자동 조제 기능이 {status}되었습니다.")
 
-    def update_transmission_status(self, receipt_number, status):
-        """환자의 전송 상태를 업데이트합니다."""
-        for item in self.patient_tree.get_children():
-            values = self.patient_tree.item(item)['values']
-            if str(values[2]) == str(receipt_number):
-                values = list(values)
-                values[3] = status
-                self.patient_tree.item(item, values=values)
-                break
+    def on_transmission_status(self, receipt_number, status):
+        """환자 정보 테이블에 표시된 환자의 전송 상태를 업데이트합니다."""
+        if receipt_number in self.patient_table:
+            self.patient_table.set(receipt_number, 'transmission_status', status)
+
+    def insert_patient_row(self, index, name, receipt_time, receipt_number):
+        """환자 정보 테이블에 행을 추가합니다. 이미 있는 접수번호면 행을 갱신하고 위치를 옮깁니다."""
+        receipt_number = str(receipt_number).strip()
+        values = (name, receipt_time, receipt_number, self.core.transmission_status.get(receipt_number, ""))
+        return self.patient_table.insert(index, receipt_number, values)
+
+    def on_first_frame(self):
+        self.startup_times["first_frame"] = time.perf_counter() - STARTUP_STARTED
+
+    def on_startup_progress(self, stage, done, total):
+        """끝난 시작 단계 수를 진행 표시에 반영하고 남은 단계를 표시합니다."""
+        self.startup_progress['value'] = done
+        remaining = [name for key, name in STARTUP_STAGES.items() if key not in self.core.startup_times]
+        if remaining:
+            self.startup_label.config(text=f"시작 준비 중 ({done}/{total}): {', '.join(remaining)}")
+
+    def on_startup_finished(self, times):
+        """진행 표시를 숨기고, 실행부터 창 표시와 사용 준비 완료까지 걸린 시간을 로그에 남깁니다."""
+        self.startup_frame.pack_forget()
+        self.startup_times["ready"] = time.perf_counter() - STARTUP_STARTED
+        names = {"modules": "모듈 로드", "window": "창 구성", "first_frame": "첫 화면", "ready": "사용 준비 완료"}
+        self.log_message(
+            "시작 시간: " + ", ".join(f"{names[key]} {seconds:.2f}초" for key, seconds in self.startup_times.items()),
+            **{f"{key}_s": round(seconds, 3) for key, seconds in self.startup_times.items()})
 
     def run(self):
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            # 감시와 작업 스레드를 멈추고 감사 로그 파일에 남은 기록을 모두 쓰고 종료
+            self.core.close()
+
+def run_import_cli(folder, workers=None):
+    """화면 없이 처방전 폴더를 파싱해 캐시를 미리 채웁니다."""
+    def on_progress(done, total):
+        print(f"\r처방전 파싱 {done}/{total}", end="", flush=True)
+
+    result = bulk_import_prescriptions(folder, PrescriptionCache(), workers=workers, on_progress=on_progress)
+    print()
+    for message in result['errors']:
+        print(f"파일 파싱 중 오류 발생: {message}")
+    print(f"완료: 파일 {result['files']}개 (캐시 {result['cached']}개, 새로 파싱 {result['parsed']}개, "
+          f"오류 {len(result['errors'])}개), {result['elapsed']:.1f}초")
+    return 1 if result['errors'] else 0
+
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="시럽조제기 연결 관리자")
+    parser.add_argument("--import", dest="import_path", metavar="PATH",
+                        help="화면 없이 PATH의 처방전을 파싱해 캐시를 미리 채운 뒤 종료합니다")
+    parser.add_argument("--workers", type=int, default=None, help="일괄 가져오기에 사용할 프로세스 수")
+    args = parser.parse_args()
+    if args.import_path:
+        sys.exit(run_import_cli(args.import_path, args.workers))
     app = ArduinoConnector()
     app.run()
@@ -0,0 +1,732 @@
+"""시럽조제기 연결 프로그램 성능 측정 도구
+
+화면(디스플레이) 없이 syrup_core.py 엔진과 arduino_connector.py 화면의 주요 경로를
+합성 데이터로 측정합니다. 엔진은 EventLoop 위에서 직접 실행하고, 화면 갱신까지 재는
+시나리오는 Tk 위젯 대신 같은 메서드만 흉내 내는 헤드리스 위젯을 붙인 ArduinoConnector를
+엔진에 구독시킵니다. 시럽조제기는 esp32_simulator.py의 시뮬레이터 기기로 대신합니다.
+
+측정 항목 (--scenarios로 선택)
+  parse_file      parse_prescription_file: 파일 하나씩 파싱 + 캐시 저장
+  bulk_import     bulk_import_prescriptions: 폴더 전체를 프로세스 풀로 파싱
+  parse_all_cold  parse_all_prescription_files: 빈 캐시에서 시작
+  parse_all_warm  parse_all_prescription_files: 캐시가 채워진 상태에서 시작
+  filter_date     filter_patients_by_date: 날짜별 조회 (다른 날짜는 캐시에서 불러옴)
+  filter_range    filter_patients_by_date: 기간 조회
+  medicine_colors update_medicine_colors: 전체 다시 칠하기 / 기기 상태 변경 시 부분 갱신
+  scan            scan_network: 시뮬레이터 기기 대역 전체 스캔
+  dispense        enqueue_dispense -> 기기 수신 -> 조제 완료까지의 조제 루프
+  startup         SyrupCore.start: 처방전 색인(빈 캐시) + 시뮬레이터 기기 대역 첫 스캔까지
+
+결과는 시나리오별 처리량, 지연 시간 백분위수(밀리초), 최대 메모리(tracemalloc)이며
+--output으로 JSON 파일에 저장하고 --compare로 이전 결과와 비교할 수 있습니다.
+시간과 메모리는 서로 영향을 주지 않도록 시나리오를 두 번(시간 측정, 메모리 측정) 실행합니다.
+
+  python benchmark.py --files-per-day 2000 --devices 24 --output bench.json
+  python benchmark.py --scenarios scan,dispense --compare bench.json
+
+scan과 dispense는 127.0.0.x 루프백 주소마다 기기를 띄우므로 리눅스에서 실행해야 합니다.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import arduino_connector as ac
+import esp32_simulator as sim
+import syrup_core as sc
+
+SCENARIOS = ("parse_file", "bulk_import", "parse_all_cold", "parse_all_warm", "filter_date", "filter_range",
+             "medicine_colors", "scan", "dispense", "startup")
+
+# 헤드리스 테이블에 한 화면으로 그릴 행 수
+VISIBLE_ROWS = 30
+
+SURNAMES = "김이박최정강조윤장임한오서신권황안송류홍"
+GIVEN_NAMES = "민서준지현우하윤도예시은수아연주원채유진"
+SYRUP_NAMES = ("아세트아미노펜", "이부프로펜", "세티리진", "암브록솔", "클래리스로마이신",
+               "아목시실린", "덱스트로메토르판", "슈도에페드린", "레보세티리진", "코데인")
+
+
+# ── 합성 데이터 ────────────────────────────────────────────────────────
+
+def pill_codes(count):
+    return [f"6{i:08d}" for i in range(count)]
+
+
+def generate_prescriptions(folder, days, files_per_day, medicines, code_count, seed=0, today=None):
+    """cp949 처방전 파일을 접수일 days일 × 하루 files_per_day개 만들고 파일 경로 목록을 반환합니다.
+
+    형식은 처방전 프로그램과 같이 첫 줄이 환자 이름, 이후 약물 줄이
+    약품코드\\약물명\\1회량\\1일 횟수\\일수\\총량\\날짜\\줄 번호 입니다.
+    """
+    rng = random.Random(seed)
+    codes = pill_codes(code_count)
+    names = {code: f"{SYRUP_NAMES[i % len(SYRUP_NAMES)]}시럽{i}" for i, code in enumerate(codes)}
+    today = today or datetime.now()
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for day in range(days):
+        prefix = (today - timedelta(days=day)).strftime("%Y%m%d")
+        for number in range(1, files_per_day + 1):
+            patient = rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES) + rng.choice(GIVEN_NAMES)
+            lines = [patient]
+            for line_number, code in enumerate(rng.sample(codes, min(medicines, len(codes))), start=1):
+                volume, daily, period = rng.randint(1, 10), rng.choice((2, 3)), rng.randint(3, 7)
+                lines.append("\\".join((code, names[code], str(volume), str(daily), str(period),
+                                        str(volume * daily * period), prefix, str(line_number))))
+            path = os.path.join(folder, f"{prefix}{number:06d}.txt")
+            with open(path, "wb") as f:
+                f.write(("\r\n".join(lines) + "\r\n").encode("cp949"))
+            paths.append(path)
+    return paths
+
+
+# ── 헤드리스 Tk 대체물 ────────────────────────────────────────────────
+
+class HeadlessWidget:
+    """옵션만 기억하고 나머지 메서드 호출은 무시하는 위젯입니다 (라벨, 스크롤바 등)."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def config(self, **options):
+        self.options.update(options)
+
+    configure = config
+
+    def cget(self, option):
+        return self.options.get(option)
+
+    def __getitem__(self, option):
+        return self.options.get(option)
+
+    def __setitem__(self, option, value):
+        self.options[option] = value
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class HeadlessVar:
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class HeadlessTree(HeadlessWidget):
+    """VirtualTable과 연결 기기 테이블이 쓰는 ttk.Treeview 메서드만 구현합니다. ops는 항목 조작 횟수입니다."""
+
+    def __init__(self, root, columns, height=VISIBLE_ROWS):
+        super().__init__(columns=tuple(columns), height=height)
+        self.root = root
+        self.items = {}
+        self.order = []
+        self._selection = ()
+        self._ids = itertools.count()
+        self.ops = 0
+
+    def after_idle(self, callback, *args):
+        return self.root.after_idle(callback, *args)
+
+    def winfo_height(self):
+        return 1
+
+    def insert(self, parent, index, iid=None, values=(), tags=()):
+        self.ops += 1
+        iid = f"I{next(self._ids):03X}" if iid is None else iid
+        self.items[iid] = [tuple(values), tuple(tags)]
+        if index == "end":
+            self.order.append(iid)
+        else:
+            self.order.insert(index, iid)
+        return iid
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.ops += 1
+            del self.items[iid]
+            self.order.remove(iid)
+
+    def item(self, iid, values=None, tags=None):
+        self.ops += 1
+        if values is not None:
+            self.items[iid][0] = tuple(values)
+        if tags is not None:
+            self.items[iid][1] = tuple(tags)
+
+    def move(self, iid, parent, index):
+        self.ops += 1
+        self.order.remove(iid)
+        self.order.insert(index, iid)
+
+    def set(self, iid, column, value):
+        self.ops += 1
+        values = list(self.items[iid][0])
+        values[self.options["columns"].index(column)] = value
+        self.items[iid][0] = tuple(values)
+
+    def exists(self, iid):
+        return iid in self.items
+
+    def selection(self):
+        return self._selection
+
+    def selection_set(self, iids):
+        self._selection = tuple(iids)
+
+
+class HeadlessListbox(HeadlessWidget):
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+
+    def insert(self, index, text):
+        if index == ac.tk.END:
+            self.entries.append(text)
+        else:
+            self.entries.insert(index, text)
+
+    def delete(self, first, last=None):
+        if last == ac.tk.END:
+            del self.entries[first:]
+        else:
+            del self.entries[first]
+
+    def get(self, index):
+        return self.entries[index]
+
+    def curselection(self):
+        return ()
+
+
+class HeadlessText(HeadlessWidget):
+    """조제 로그 Text 위젯: 줄 수만 셉니다."""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = 0
+
+    def yview(self):
+        return (0.0, 1.0)
+
+    def insert(self, index, *chunks):
+        self.lines += sum(chunk.count("\n") for chunk in chunks[::2])
+
+    def index(self, index):
+        return f"{self.lines + 1}.0"
+
+    def delete(self, first, last):
+        self.lines -= int(last.split(".")[0]) - 1
+
+
+def build_core(loop, port=sc.DEVICE_PORT, prescription_path=None):
+    """EventLoop 위에서 실행할 SyrupCore를 만듭니다. 파일은 현재 디렉터리에 생깁니다."""
+    core = sc.SyrupCore(loop, port=port)
+    core.prescription_path = prescription_path
+    # 측정에서는 모든 작업의 지연 시간을 남김
+    core.dispense_latency = {True: deque(), False: deque()}
+    return core
+
+
+def build_connector(loop, prescription_path=None):
+    """헤드리스 위젯을 붙인 ArduinoConnector를 만듭니다.
+
+    __init__은 Tk 창과 위젯을 만들고 스캔/감시를 시작하므로 호출하지 않고, EventLoop를
+    Tk 루트 대신 쓰는 UIDispatcher와 SyrupCore에 __init__과 같은 화면 상태를 붙입니다.
+    """
+    app = object.__new__(ac.ArduinoConnector)
+    app.root = loop
+    app.ui = ac.UIDispatcher(loop)
+    app.core = build_core(app.ui, prescription_path=prescription_path)
+    app.medicine_rows = {}
+    app.medicine_items_by_code = {}
+    app.medicine_keys = itertools.count()
+    app.ip_list_macs = []
+    app.saved_list_macs = []
+    app.pending_color_codes = set()
+    app.pending_log_lines = deque(maxlen=ac.LOG_MAX_LINES)
+    # 위젯
+    app.date_var = HeadlessVar(datetime.now().strftime("%Y-%m-%d"))
+    app.patient_tree = HeadlessTree(loop, ("username", "createdat", "receipt_number", "transmission_status"))
+    app.patient_table = ac.VirtualTable(app.patient_tree, HeadlessWidget())
+    app.medicine_tree = HeadlessTree(
+        loop, ("pillname", "pillcode", "volume", "dailyintakenumber", "intakeperiod", "totalvolume"))
+    app.medicine_table = ac.VirtualTable(app.medicine_tree, HeadlessWidget())
+    app.connected_tree = HeadlessTree(loop, ("nickname", "pill_code", "ip", "status", "last_activity"))
+    app.ip_list = HeadlessListbox()
+    app.saved_list = HeadlessListbox()
+    app.log_text = HeadlessText()
+    app.scan_status_label = HeadlessWidget()
+    app.connection_stats_label = HeadlessWidget()
+    app.dispense_queue_label = HeadlessWidget()
+    app.import_progress = HeadlessWidget()
+    app.import_progress_label = HeadlessWidget()
+    app.import_progress_frame = HeadlessWidget()
+    app.subscribe_core_events()
+    return app
+
+
+def close_core(core):
+    core.close()
+    core.health_executor.shutdown(wait=True)
+    core.dispense_executor.shutdown(wait=True)
+    core.progress_executor.shutdown(wait=True)
+    core.prescription_cache.conn.close()
+
+
+# ── 측정 ─────────────────────────────────────────────────────────────
+
+class Recorder:
+    """시나리오 하나의 측정값을 모읍니다.
+
+    run() 구간 전체 시간을 elapsed로, sample()/time()으로 기록한 값을 지연 시간 표본으로 씁니다.
+    trace_memory면 run() 구간의 tracemalloc 최대 메모리를 peak로 기록합니다.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.samples = []
+        self.elapsed = 0.0
+        self.peak = None
+        self.extra = {}
+
+    @contextmanager
+    def run(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.elapsed += time.perf_counter() - started
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.peak = max(self.peak or 0, peak)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        yield
+        self.samples.append(time.perf_counter() - started)
+
+    def sample(self, seconds):
+        self.samples.append(seconds)
+
+    def summary(self):
+        samples = self.samples
+        result = {
+            "count": len(samples),
+            "elapsed_s": round(self.elapsed, 4),
+            "throughput_per_s": round(len(samples) / self.elapsed, 2) if self.elapsed and samples else None,
+            "latency_ms": {
+                "p50": _ms(sc.percentile(samples, 50)),
+                "p95": _ms(sc.percentile(samples, 95)),
+                "p99": _ms(sc.percentile(samples, 99)),
+                "max": _ms(max(samples) if samples else None),
+                "mean": _ms(sum(samples) / len(samples) if samples else None),
+            },
+        }
+        result.update(self.extra)
+        return result
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class Benchmark:
+    """합성 데이터 폴더와 시나리오별 작업 디렉터리를 관리하고 시나리오를 실행합니다."""
+
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.folder = os.path.join(workdir, "prescriptions")
+        self.files = generate_prescriptions(self.folder, args.days, args.files_per_day, args.medicines,
+                                            args.pill_codes, seed=args.seed)
+        # 캐시가 채워진 상태가 필요한 시나리오용 캐시
+        self.warm_cache = os.path.join(workdir, "warm_cache.db")
+        cache = sc.PrescriptionCache(self.warm_cache)
+        sc.bulk_import_prescriptions(self.folder, cache, workers=args.workers)
+        cache.conn.close()
+        self._runs = itertools.count()
+
+    @contextmanager
+    def run_dir(self, warm=False):
+        """시나리오마다 새 작업 디렉터리로 이동합니다. 엔진이 쓰는 파일(캐시, 대기열, 로그)이 여기에 생깁니다."""
+        run_dir = os.path.join(self.workdir, f"run{next(self._runs)}")
+        os.makedirs(run_dir)
+        if warm:
+            shutil.copyfile(self.warm_cache, os.path.join(run_dir, "prescription_cache.db"))
+        cwd = os.getcwd()
+        os.chdir(run_dir)
+        try:
+            yield run_dir
+        finally:
+            os.chdir(cwd)
+
+    @contextmanager
+    def core(self, warm=False, port=sc.DEVICE_PORT):
+        """화면 없이 EventLoop 위에서 실행하는 엔진을 만듭니다."""
+        with self.run_dir(warm):
+            loop = sc.EventLoop()
+            core = build_core(loop, port=port, prescription_path=self.folder)
+            try:
+                yield core
+            finally:
+                close_core(core)
+
+    @contextmanager
+    def connector(self, warm=False):
+        """헤드리스 위젯 화면이 구독하는 엔진을 만듭니다 (화면 갱신까지 측정하는 시나리오용)."""
+        with self.run_dir(warm):
+            app = build_connector(sc.EventLoop(), self.folder)
+            try:
+                yield app
+            finally:
+                close_core(app.core)
+
+    def run(self, name):
+        scenario = getattr(self, f"scenario_{name}")
+        recorder = Recorder()
+        scenario(recorder)
+        result = recorder.summary()
+        if not self.args.no_memory:
+            traced = Recorder(trace_memory=True)
+            scenario(traced)
+            result["peak_memory_kb"] = round(traced.peak / 1024, 1)
+        return result
+
+    # 처방전 파싱/불러오기
+
+    def scenario_parse_file(self, rec):
+        with self.core() as core, rec.run():
+            for path in self.files:
+                with rec.time():
+                    core.parse_prescription_file(path)
+                    core.loop.run_pending()
+        rec.extra["files"] = len(self.files)
+
+    def scenario_bulk_import(self, rec):
+        for _ in range(self.args.repeat):
+            with self.core() as core, rec.run(), rec.time():
+                result = sc.bulk_import_prescriptions(self.folder, core.prescription_cache, workers=self.args.workers)
+        rec.extra.update(files=result["files"], files_per_s=round(result["files"] * len(rec.samples) / rec.elapsed, 1),
+                         workers=self.args.workers or os.cpu_count())
+
+    def _parse_all(self, rec, warm):
+        for _ in range(self.args.repeat):
+            with self.connector(warm=warm) as app, rec.run():
+                with rec.time():
+                    app.core.parse_all_prescription_files()
+                    app.root.run_pending()
+        rec.extra["files_loaded"] = len(app.core.parsed_files)
+        rec.extra["patient_tree_ops"] = app.patient_tree.ops
+
+    def scenario_parse_all_cold(self, rec):
+        self._parse_all(rec, warm=False)
+
+    def scenario_parse_all_warm(self, rec):
+        self._parse_all(rec, warm=True)
+
+    # 환자 조회
+
+    def _dates(self):
+        today = datetime.now()
+        return [(today - timedelta(days=day)).strftime("%Y-%m-%d") for day in range(self.args.days)]
+
+    def scenario_filter_date(self, rec):
+        dates = self._dates()
+        with self.connector(warm=True) as app:
+            app.core.parse_all_prescription_files()
+            app.root.run_pending()
+            with rec.run():
+                for _ in range(self.args.repeat):
+                    for date in dates:
+                        app.date_var.set(date)
+                        with rec.time():
+                            app.filter_patients_by_date()
+                            app.root.run_pending()
+            rec.extra["patient_tree_ops"] = app.patient_tree.ops
+
+    def scenario_filter_range(self, rec):
+        dates = self._dates()
+        with self.connector(warm=True) as app:
+            app.core.parse_all_prescription_files()
+            app.root.run_pending()
+            app.date_var.set(f"{dates[-1]}~{dates[0]}")
+            with rec.run():
+                for _ in range(self.args.repeat):
+                    with rec.time():
+                        app.filter_patients_by_date()
+                        app.root.run_pending()
+            rec.extra["rows"] = len(app.patient_table)
+
+    # 약물 색상
+
+    def scenario_medicine_colors(self, rec):
+        """medicine_rows개의 약물 행에서 전체 다시 칠하기와, 기기 하나의 상태 변경에 따른 부분 갱신을 측정합니다."""
+        codes = pill_codes(self.args.pill_codes)
+        rng = random.Random(self.args.seed)
+        with self.connector() as app:
+            devices = app.core.connected_devices
+            # 약품코드의 절반에 기기를 연결
+            for i, code in enumerate(codes[::2]):
+                devices.add(f"02:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}", f"10.0.{i >> 8}.{i & 0xFF}", f"기기{i}", code)
+            devices.refresh_pill_codes()
+            for i in range(self.args.medicine_rows):
+                app.insert_medicine_row(f"약물{i}", rng.choice(codes), 5, 3, 5, 75)
+            app.root.run_pending()
+            macs = list(devices)
+            full = []
+            with rec.run():
+                for i in range(self.args.repeat * 10):
+                    started = time.perf_counter()
+                    app.update_medicine_colors()
+                    app.root.run_pending()
+                    full.append(time.perf_counter() - started)
+                    mac = macs[i % len(macs)]
+                    status = "연결 끊김" if devices[mac]["status"] != "연결 끊김" else "연결됨"
+                    with rec.time():
+                        devices.set_status(mac, status)
+                        app.core.refresh_pill_code_index()
+                        app.flush_medicine_colors()
+                        app.root.run_pending()
+            rec.extra["rows"] = self.args.medicine_rows
+            rec.extra["full_repaint_ms"] = {
+                "p50": _ms(sc.percentile(full, 50)), "p95": _ms(sc.percentile(full, 95))}
+            rec.extra["medicine_tree_ops"] = app.medicine_tree.ops
+
+    # 시뮬레이터 기기
+
+    @contextmanager
+    def fleet(self, **options):
+        devices = sim.start_fleet(self.args.devices, base_ip=self.args.base_ip, port=self.args.port,
+                                  seed=self.args.seed, **options)
+        try:
+            yield devices
+        finally:
+            sim.stop_fleet(devices)
+
+    def _attach(self, core, devices, save=True):
+        core.network_prefix = self.args.base_ip.rsplit(".", 1)[0] + "."
+        if not save:
+            return
+        codes = pill_codes(self.args.pill_codes)
+        for i, device in enumerate(devices):
+            core.saved_connections[device.mac] = {
+                "ip": device.ip, "nickname": f"기기{i}", "pill_code": codes[i % len(codes)]}
+
+    def scenario_scan(self, rec):
+        with self.fleet(latency=self.args.latency) as devices, self.core(port=self.args.port) as core:
+            # 저장된 기기가 없어야 자동 연결 없이 스캔 자체만 측정됨
+            self._attach(core, devices, save=False)
+            summaries = []
+            core.subscribe("scan_finished", summaries.append)
+            with rec.run():
+                for _ in range(self.args.repeat):
+                    scans = len(summaries)
+                    with rec.time():
+                        core.scan_network(full=True)
+                        core.loop.run_until(lambda: len(summaries) > scans, timeout=60)
+            rec.extra["devices"] = len(devices)
+            rec.extra["found"] = len(core.discovered_devices)
+
+    def scenario_dispense(self, rec):
+        """prescriptions건의 처방전을 arrival_ms 간격으로 도착시키고 모든 작업이 조제 완료될 때까지 돌립니다.
+
+        표본은 처방전 도착 -> 기기 수신 지연 시간이며, 처리량은 완료한 작업 수 / 전체 시간입니다.
+        """
+        args = self.args
+        rng = random.Random(args.seed)
+        with self.fleet(dispense_seconds=args.dispense_seconds, latency=args.latency) as devices, \
+                self.core(port=args.port) as core:
+            self._attach(core, devices)
+            for mac in list(core.saved_connections):
+                core.connect_to_device(mac)
+            codes = [info["pill_code"] for info in core.saved_connections.values()]
+            prescriptions = [
+                (f"BENCH{n:06d}", f"환자{n}",
+                 [(f"약물{code}", code, rng.randint(10, 200))
+                  for code in rng.sample(codes, min(args.medicines, len(codes)))])
+                for n in range(args.prescriptions)]
+            jobs = sum(len(medicines) for _, _, medicines in prescriptions)
+            arrivals = iter(prescriptions)
+            pending_arrivals = [len(prescriptions)]
+            events = Counter()
+            for event in ("device_status", "transmission_status", "dispense_queue_changed"):
+                core.subscribe(event, lambda *_, event=event: events.update((event,)))
+
+            def arrive():
+                receipt_number, patient_name, medicines = next(arrivals)
+                core.arrival_times[receipt_number] = time.time()
+                core.enqueue_dispense(receipt_number, patient_name, medicines)
+                pending_arrivals[0] -= 1
+                if pending_arrivals[0]:
+                    core.loop.after(args.arrival_ms, arrive)
+
+            def finished():
+                return not pending_arrivals[0] and core.dispense_queue.depth() == (0, 0)
+
+            with rec.run():
+                core.schedule_progress_poll()
+                arrive()
+                core.loop.run_until(finished, timeout=args.timeout)
+            for lane in (False, True):
+                for latency in core.dispense_latency[lane]:
+                    rec.sample(latency)
+            completed = sum(device.completed for device in devices)
+            rec.extra.update(
+                devices=len(devices), jobs=jobs, completed=completed,
+                jobs_per_s=round(completed / rec.elapsed, 2),
+                failed=sum(1 for status in core.transmission_status.values() if status == "실패"),
+                http=core.device_client.stats(), core_events=dict(events))
+
+    def scenario_startup(self, rec):
+        """start()부터 모든 시작 단계(네트워크, 처방전 색인, 첫 스캔)가 끝날 때까지 걸린 시간을 측정합니다.
+
+        네트워크 감지 대신 시뮬레이터 기기 대역을 지정하며, 처방전 캐시는 매번 비어 있습니다.
+        """
+        prefix = self.args.base_ip.rsplit(".", 1)[0] + "."
+        stages = {stage: [] for stage in sc.STARTUP_STAGES}
+        with self.fleet(latency=self.args.latency) as devices:
+            for _ in range(self.args.repeat):
+                with self.core(port=self.args.port) as core, rec.run():
+                    finished = []
+                    core.subscribe("startup_finished", finished.append)
+                    with rec.time():
+                        core.start(network_prefix=prefix)
+                        core.loop.run_until(lambda: finished, timeout=60)
+                    for stage, seconds in finished[0].items():
+                        stages[stage].append(seconds)
+                    rec.extra["found"] = len(core.discovered_devices)
+        rec.extra["devices"] = len(devices)
+        rec.extra["stage_ms"] = {stage: {"p50": _ms(sc.percentile(times, 50)), "max": _ms(max(times))}
+                                 for stage, times in stages.items()}
+
+
+# ── 결과 ─────────────────────────────────────────────────────────────
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_result(name, result):
+    latency = result["latency_ms"]
+    line = (f"{name:<16} n={result['count']:<7} {result['elapsed_s']:>9.3f}s  "
+            f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms")
+    if result.get("throughput_per_s") is not None:
+        line += f"  {result['throughput_per_s']}/s"
+    if "peak_memory_kb" in result:
+        line += f"  peak={result['peak_memory_kb']}KB"
+    print(line)
+
+
+def compare_results(baseline, current):
+    """두 결과의 주요 수치를 나란히 보여 줍니다. 비율이 1보다 크면 이번 결과가 더 큽니다 (느리거나 많음)."""
+    print(f"\n{'시나리오':<16}{'항목':<16}{'이전':>12}{'이번':>12}{'비율':>8}")
+    for name, result in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        metrics = [("elapsed_s", old.get("elapsed_s"), result.get("elapsed_s")),
+                   ("p50_ms", old["latency_ms"].get("p50"), result["latency_ms"].get("p50")),
+                   ("p95_ms", old["latency_ms"].get("p95"), result["latency_ms"].get("p95")),
+                   ("peak_memory_kb", old.get("peak_memory_kb"), result.get("peak_memory_kb"))]
+        for metric, before, after in metrics:
+            if before is None or after is None:
+                continue
+            ratio = f"{after / before:.2f}" if before else "-"
+            print(f"{name:<16}{metric:<16}{before:>12}{after:>12}{ratio:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="시럽조제기 연결 프로그램 성능 측정")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"쉼표로 구분한 시나리오 ({', '.join(SCENARIOS)})")
+    parser.add_argument("--days", type=int, default=7, help="처방전 접수일 수 (오늘부터 과거로)")
+    parser.add_argument("--files-per-day", type=int, default=300, help="접수일별 처방전 파일 수")
+    parser.add_argument("--medicines", type=int, default=5, help="처방전 하나의 약물 수")
+    parser.add_argument("--pill-codes", type=int, default=40, help="약품코드 종류 수")
+    parser.add_argument("--medicine-rows", type=int, default=2000, help="medicine_colors의 약물 정보 행 수")
+    parser.add_argument("--devices", type=int, default=20, help="시뮬레이터 기기 수")
+    parser.add_argument("--base-ip", default="127.0.0.20", help="첫 시뮬레이터 기기의 IP")
+    parser.add_argument("--port", type=int, default=18080, help="시뮬레이터 기기 HTTP 포트")
+    parser.add_argument("--latency", type=float, default=0.0, help="시뮬레이터 기기 응답 지연(초)")
+    parser.add_argument("--prescriptions", type=int, default=60, help="dispense에서 도착시킬 처방전 수")
+    parser.add_argument("--arrival-ms", type=int, default=50, help="dispense 처방전 도착 간격(밀리초)")
+    parser.add_argument("--dispense-seconds", type=float, default=0.2, help="시뮬레이터 작업당 분주 시간(초)")
+    parser.add_argument("--timeout", type=float, default=300, help="dispense 최대 실행 시간(초)")
+    parser.add_argument("--repeat", type=int, default=5, help="반복 측정 횟수")
+    parser.add_argument("--workers", type=int, default=None, help="bulk_import 작업 프로세스 수")
+    parser.add_argument("--seed", type=int, default=1, help="합성 데이터 난수 시드")
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc 메모리 측정 생략")
+    parser.add_argument("--keep", action="store_true", help="작업 디렉터리를 지우지 않음")
+    parser.add_argument("--output", help="결과를 저장할 JSON 파일")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON 파일")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"알 수 없는 시나리오: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="syrup-bench-")
+    cwd = os.getcwd()
+    # 연결 프로그램이 현재 디렉터리에 쓰는 파일이 작업 디렉터리에 생기도록 이동
+    os.chdir(workdir)
+    try:
+        started = time.perf_counter()
+        bench = Benchmark(args, workdir)
+        print(f"합성 처방전 {len(bench.files)}개 생성 ({time.perf_counter() - started:.1f}초): {bench.folder}")
+        results = {
+            "meta": {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep")},
+            },
+            "scenarios": {},
+        }
+        for name in names:
+            result = bench.run(name)
+            results["scenarios"][name] = result
+            print_result(name, result)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_results(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
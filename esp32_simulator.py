@@ -0,0 +1,308 @@
+"""시럽조제기(ESP32) 시뮬레이터
+
+실제 기기 없이 arduino_connector.py의 네트워크 스캔, 연결, 상태 확인, 조제 전송을
+시험하기 위한 독립 실행 스크립트입니다. esp32_urgent_dispense.ino와 같은 HTTP
+엔드포인트를 기기마다 별도의 서버로 제공합니다.
+
+  GET /           {"status":"ready","mac":...,"ip":...,"state":...,"busy":...,"queue":...,"completed":...}
+  POST /dispense  {"patient_name":...,"total_volume":...,"urgent":...} -> "OK" / "BUSY"
+  POST /syrup     {"amount":...} -> "OK" / "BUSY"
+
+기기는 기본적으로 127.0.0.x 루프백 주소마다 하나씩 뜹니다(리눅스에서는 127.0.0.0/8
+전체가 루프백입니다). 연결 프로그램은 같은 포트로 스캔해야 하므로 예를 들어
+
+  python esp32_simulator.py --devices 24 --port 8080
+  SYRUP_DEVICE_PORT=8080 python arduino_connector.py
+
+처럼 실행하고 네트워크 설정에서 "127.0.0."을 입력합니다. 루프백 별칭이 없는
+환경에서는 --port-step으로 한 주소의 연속 포트에 기기를 띄울 수 있습니다.
+"""
+
+import argparse
+import ipaddress
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+DEFAULT_PORT = 8080
+DEFAULT_BASE_IP = "127.0.0.1"
+
+
+class SimulatedDispenser:
+    """시럽조제기 한 대를 흉내 냅니다.
+
+    펌웨어처럼 요청을 한 번에 하나씩 처리하고(단일 스레드 서버), 작업은 대기열에
+    쌓였다가 하나씩 분주됩니다. 긴급 작업은 대기열 맨 앞에 들어갑니다.
+    분주가 끝나면 confirm_seconds 동안 약사 확인 대기(wait_confirm) 상태가 됩니다.
+    """
+
+    def __init__(self, ip, port, mac, dispense_seconds=3.0, ml_per_second=0.0,
+                 confirm_seconds=0.0, queue_depth=0, drop_rate=0.0, latency=0.0,
+                 jitter=0.0, legacy=False, seed=None, verbose=False):
+        self.ip = ip
+        self.port = port
+        self.mac = mac
+        self.dispense_seconds = dispense_seconds
+        self.ml_per_second = ml_per_second
+        self.confirm_seconds = confirm_seconds
+        self.queue_depth = queue_depth
+        self.drop_rate = drop_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.legacy = legacy
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.jobs = deque()
+        self.state = "idle"
+        self.busy = False
+        self.completed = 0
+        self.stats = {"requests": 0, "accepted": 0, "rejected": 0, "dropped": 0, "invalid": 0}
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._server = None
+        self._threads = []
+
+    @property
+    def address(self):
+        return self.ip if self.port == 80 else f"{self.ip}:{self.port}"
+
+    def start(self):
+        """HTTP 서버와 분주 작업 스레드를 시작합니다."""
+        self._server = HTTPServer((self.ip, self.port), DispenserRequestHandler)
+        self._server.device = self
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.1}, daemon=True),
+            threading.Thread(target=self._run_jobs, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def status(self):
+        """GET / 응답 본문. legacy면 진행 상태 필드가 없는 구형 펌웨어처럼 응답합니다."""
+        body = {"status": "ready", "mac": self.mac, "ip": self.ip}
+        if not self.legacy:
+            with self._cond:
+                body.update(state=self.state, busy=self.busy, queue=len(self.jobs), completed=self.completed)
+        return body
+
+    def submit(self, patient_name, volume, urgent=False):
+        """작업을 대기열에 넣고 응답 문자열을 반환합니다. 대기열이 가득 차면 None."""
+        with self._cond:
+            if self.queue_depth and len(self.jobs) >= self.queue_depth:
+                self.stats["rejected"] += 1
+                return None
+            # 펌웨어와 같이 작업을 넣기 전의 분주 상태로 응답을 정합니다.
+            response = "OK" if self.state == "idle" else "BUSY"
+            job = (patient_name, volume, urgent)
+            if urgent:
+                self.jobs.appendleft(job)
+            else:
+                self.jobs.append(job)
+            self.stats["accepted"] += 1
+            self._cond.notify_all()
+        return response
+
+    def response_delay(self):
+        if not self.latency and not self.jitter:
+            return 0.0
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def should_drop(self):
+        return self.drop_rate > 0 and self.random.random() < self.drop_rate
+
+    def dispense_time(self, volume):
+        duration = self.dispense_seconds
+        if self.ml_per_second > 0:
+            duration += volume / self.ml_per_second
+        return duration
+
+    def _run_jobs(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                while not self.jobs and not self._stopped.is_set():
+                    self._cond.wait()
+                if self._stopped.is_set():
+                    return
+                patient_name, volume, urgent = self.jobs.popleft()
+                self.busy = True
+                self.state = "dispensing"
+            if self.verbose:
+                print(f"[{self.address}] 분주 시작: {patient_name} {volume}mL{' (긴급)' if urgent else ''}")
+            self._stopped.wait(self.dispense_time(volume))
+            with self._cond:
+                self.busy = False
+                self.completed += 1
+                self.state = "wait_confirm" if self.confirm_seconds > 0 else "idle"
+            if self.confirm_seconds > 0:
+                self._stopped.wait(self.confirm_seconds)
+                with self._cond:
+                    self.state = "idle"
+
+
+class DispenserRequestHandler(BaseHTTPRequestHandler):
+    """펌웨어 handleClient()와 같은 방식으로 응답합니다. 모든 연결은 응답 후 닫힙니다."""
+
+    server_version = "ESP32Sim/1.0"
+
+    @property
+    def device(self):
+        return self.server.device
+
+    def log_message(self, format, *args):
+        if self.device.verbose:
+            super().log_message(format, *args)
+
+    def _begin(self):
+        """요청 공통 처리: 지연을 적용하고, 드롭할 요청이면 False를 반환합니다."""
+        device = self.device
+        device.stats["requests"] += 1
+        delay = device.response_delay()
+        if delay:
+            time.sleep(delay)
+        if device.should_drop():
+            device.stats["dropped"] += 1
+            # 응답 없이 연결을 끊어 패킷 손실/기기 재부팅을 흉내 냅니다.
+            self.close_connection = True
+            return False
+        return True
+
+    def _send(self, code, body, content_type="text/plain"):
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            data = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def do_GET(self):
+        if not self._begin():
+            return
+        if self.path != "/":
+            self._send(404, "Not Found")
+            return
+        self._send(200, json.dumps(self.device.status()), "application/json")
+
+    def do_POST(self):
+        if not self._begin():
+            return
+        if self.path == "/dispense":
+            fields = ("total_volume", "patient_name")
+        elif self.path == "/syrup":
+            fields = ("amount", None)
+        else:
+            self._send(404, "Not Found")
+            return
+        data = self._read_json()
+        volume_field, name_field = fields
+        try:
+            volume = int(data[volume_field])
+        except (TypeError, KeyError, ValueError):
+            self.device.stats["invalid"] += 1
+            self._send(400, "Invalid JSON")
+            return
+        name = str(data.get(name_field) or "Unknown") if name_field else "시럽"
+        response = self.device.submit(name, volume, bool(data.get("urgent", False)))
+        if response is None:
+            self._send(503, "FULL")
+        else:
+            self._send(200, response)
+
+
+def device_addresses(count, base_ip=DEFAULT_BASE_IP, port=DEFAULT_PORT, port_step=0):
+    """기기 count대의 (ip, port) 목록. port_step이 0이면 IP를, 아니면 포트를 늘립니다."""
+    base = ipaddress.IPv4Address(base_ip)
+    if port_step:
+        return [(str(base), port + i * port_step) for i in range(count)]
+    return [(str(base + i), port) for i in range(count)]
+
+
+def start_fleet(count, base_ip=DEFAULT_BASE_IP, port=DEFAULT_PORT, port_step=0, seed=None, **options):
+    """시뮬레이터 기기 count대를 시작해 목록으로 반환합니다."""
+    devices = []
+    try:
+        for index, (ip, device_port) in enumerate(device_addresses(count, base_ip, port, port_step)):
+            mac = "02:53:59:%02X:%02X:%02X" % ((index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF)
+            device_seed = None if seed is None else seed + index
+            devices.append(SimulatedDispenser(ip, device_port, mac, seed=device_seed, **options).start())
+    except OSError:
+        stop_fleet(devices)
+        raise
+    return devices
+
+
+def stop_fleet(devices):
+    for device in devices:
+        device.stop()
+
+
+def print_summary(devices):
+    print(f"{'주소':<22}{'MAC':<19}{'요청':>6}{'접수':>6}{'완료':>6}{'거절':>6}{'드롭':>6}{'대기':>6}")
+    for device in devices:
+        stats = device.stats
+        print(f"{device.address:<22}{device.mac:<19}{stats['requests']:>6}{stats['accepted']:>6}"
+              f"{device.completed:>6}{stats['rejected']:>6}{stats['dropped']:>6}{len(device.jobs):>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="시럽조제기(ESP32) 시뮬레이터")
+    parser.add_argument("--devices", type=int, default=1, help="시뮬레이션할 기기 수")
+    parser.add_argument("--base-ip", default=DEFAULT_BASE_IP, help="첫 기기의 IP (기본 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="HTTP 포트 (펌웨어는 80)")
+    parser.add_argument("--port-step", type=int, default=0,
+                        help="0이 아니면 같은 IP에서 포트를 이만큼씩 늘려 기기를 띄웁니다")
+    parser.add_argument("--dispense-seconds", type=float, default=3.0, help="작업당 기본 분주 시간(초)")
+    parser.add_argument("--ml-per-second", type=float, default=0.0,
+                        help="0보다 크면 용량/속도만큼 분주 시간을 더합니다")
+    parser.add_argument("--confirm-seconds", type=float, default=0.0,
+                        help="분주 후 약사 확인까지 기다리는 시간(초)")
+    parser.add_argument("--queue-depth", type=int, default=0,
+                        help="기기 대기열 최대 길이, 초과 시 503 FULL (0은 무제한)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="응답 없이 연결을 끊을 확률 (0~1)")
+    parser.add_argument("--latency", type=float, default=0.0, help="응답 전 지연(초)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="지연에 더할 무작위 편차(초)")
+    parser.add_argument("--legacy", action="store_true", help="진행 상태 필드가 없는 구형 펌웨어로 응답")
+    parser.add_argument("--seed", type=int, default=None, help="드롭/지연 난수 시드")
+    parser.add_argument("--verbose", action="store_true", help="요청과 분주 로그 출력")
+    args = parser.parse_args(argv)
+
+    devices = start_fleet(
+        args.devices, base_ip=args.base_ip, port=args.port, port_step=args.port_step, seed=args.seed,
+        dispense_seconds=args.dispense_seconds, ml_per_second=args.ml_per_second,
+        confirm_seconds=args.confirm_seconds, queue_depth=args.queue_depth, drop_rate=args.drop_rate,
+        latency=args.latency, jitter=args.jitter, legacy=args.legacy, verbose=args.verbose)
+    print(f"시럽조제기 {len(devices)}대 실행 중: {devices[0].address} ~ {devices[-1].address} (Ctrl+C로 종료)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_fleet(devices)
+        print_summary(devices)
+
+
+if __name__ == "__main__":
+    main()
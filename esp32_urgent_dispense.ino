@@ -59,6 +59,9 @@ bool isProcessing = true;
 bool pageSwitchedToProcess = false;  // 이 줄을 추가하세요
 // 전역 변수 추가
 volatile bool isDispenseReady = false;
+// 대기열에서 꺼내 분주 중인 작업이 있는지, 부팅 후 완료한 작업 수 (GET / 진행 상태 응답용)
+volatile bool jobActive = false;
+volatile uint32_t completedJobs = 0;
 
 String ssidList[6];
 String selectedSSID;
@@ -363,6 +366,7 @@ void dispenseTask(void* parameter) {
         currentJob = jobQueue.front();
         jobQueue.pop();
         hasJob = true;
+        jobActive = true;
       }
       xSemaphoreGive(jobQueueMutex);
     }
@@ -479,6 +483,8 @@ void dispenseTask(void* parameter) {
             xSemaphoreGive(jobQueueMutex);
           }
           //sendToNextion("complete.n0.val=" + String(U_volume));
+          jobActive = false;
+          completedJobs++;
           dspState = DSP_WAIT_CONFIRM;
           break;
       }
@@ -619,8 +625,21 @@ void handleClient(WiFiClient &client){
   Serial.println("🌐 요청: "+req);
 
   if(req.startsWith("GET / ")){
+    // 진행 상태: busy(분주 중인 작업 있음), queue(대기 작업 수, 확인 실패 시 -1), state, completed(완료한 작업 수)
+    int qsize = -1;
+    bool busy = jobActive;
+    if (xSemaphoreTake(jobQueueMutex, pdMS_TO_TICKS(100)) == pdTRUE) {
+      qsize = jobQueue.size();
+      busy = jobActive;
+      xSemaphoreGive(jobQueueMutex);
+    }
+    String state = busy ? "dispensing" : (dspState == DSP_WAIT_CONFIRM ? "wait_confirm" : "idle");
     String body = "{\"status\":\"ready\",\"mac\":\""+getMacAddressString()+
-                  "\",\"ip\":\""+WiFi.localIP().toString()+"\"}";
+                  "\",\"ip\":\""+WiFi.localIP().toString()+
+                  "\",\"state\":\""+state+
+                  "\",\"busy\":"+String(busy ? "true" : "false")+
+                  ",\"queue\":"+String(qsize)+
+                  ",\"completed\":"+String(completedJobs)+"}";
     client.println("HTTP/1.1 200 OK");
     client.println("Content-Type: application/json");
     client.print("Content-Length: "); client.println(body.length());
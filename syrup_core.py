@@ -0,0 +1,2425 @@
+"""시럽조제기 연결 엔진
+
+화면(Tk)과 무관한 부분을 모은 모듈입니다. 네트워크 스캔, 기기 연결과 상태 확인,
+조제 대기열과 전송, 처방전 파싱/감시/캐시, 감사 로그를 담당하며, 상태 변화는
+SyrupCore.subscribe로 등록한 콜백에 이벤트로 알립니다.
+
+arduino_connector.py의 화면은 이 엔진의 이벤트를 받아 그리기만 하고, 화면 없이
+서비스로 실행하거나 성능을 측정할 때는 EventLoop 위에서 엔진만 실행합니다.
+
+  python syrup_core.py --prescriptions D:\\처방전 --network 192.168.0. --auto-dispense
+"""
+
+import sys
+import json
+import socket
+import threading
+from datetime import datetime
+import time
+import os
+import queue
+import logging
+import logging.handlers
+import asyncio
+import io
+import codecs
+import bisect
+from collections import OrderedDict, deque, namedtuple
+import sqlite3
+import select
+import struct
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import argparse
+import itertools
+import math
+import heapq
+
+# 시럽조제기 HTTP 포트 (시뮬레이터 등 다른 포트로 시험할 때는 SYRUP_DEVICE_PORT로 지정)
+DEVICE_PORT = int(os.environ.get("SYRUP_DEVICE_PORT", "80"))
+
+# 조제 로그(SyrupCore.log)를 받지 않는 이벤트 루프 등의 오류 기록용
+logger = logging.getLogger("syrup.core")
+
+
+class DeviceDiscovery:
+    """asyncio 이벤트 루프 하나로 서브넷의 시럽조제기를 동시에 탐색합니다.
+
+    스레드를 주소마다 만들지 않고, 백그라운드 루프 스레드 하나에서
+    최대 max_concurrency개의 비동기 연결만 동시에 유지합니다.
+    """
+
+    def __init__(self, max_concurrency=64, timeout=1.0, port=DEVICE_PORT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.port = port
+        self.scanning = False
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def _ensure_loop(self):
+        """탐색용 이벤트 루프 스레드를 필요할 때 한 번만 시작합니다."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            thread.start()
+        return self._loop
+
+    def scan(self, hosts, on_found=None, on_done=None):
+        """hosts를 백그라운드에서 탐색합니다. 이미 탐색 중이면 False를 반환합니다.
+
+        on_found(ip, data)는 기기가 응답할 때마다, on_done(stats)는 탐색이
+        끝났을 때 루프 스레드에서 호출됩니다.
+        """
+        with self._lock:
+            if self.scanning:
+                return False
+            self.scanning = True
+        asyncio.run_coroutine_threadsafe(self._scan(list(hosts), on_found, on_done), self._ensure_loop())
+        return True
+
+    async def _scan(self, hosts, on_found, on_done):
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        found = {}
+
+        async def probe(ip):
+            async with semaphore:
+                data = await self.probe(ip)
+            if data:
+                found[ip] = data
+                if on_found:
+                    on_found(ip, data)
+
+        try:
+            await asyncio.gather(*(probe(ip) for ip in hosts))
+        finally:
+            with self._lock:
+                self.scanning = False
+        stats = {
+            "hosts": hosts,
+            "found": found,
+            "elapsed": time.perf_counter() - started,
+        }
+        if on_done:
+            on_done(stats)
+
+    async def probe(self, ip):
+        """GET / 요청으로 기기를 확인하고, 준비된 시럽조제기면 응답 JSON을 반환합니다."""
+        try:
+            return await asyncio.wait_for(self._probe(ip), self.timeout)
+        except (OSError, asyncio.TimeoutError, ValueError):
+            return None
+
+    async def _probe(self, ip):
+        reader, writer = await asyncio.open_connection(ip, self.port)
+        try:
+            writer.write(f"GET / HTTP/1.1\r\nHost: {ip}\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            raw = b""
+            while len(raw) < 8192:
+                chunk = await reader.read(1024)
+                if not chunk:
+                    break
+                raw += chunk
+        finally:
+            writer.close()
+        head, _, body = raw.partition(b"\r\n\r\n")
+        if not head.startswith(b"HTTP/") or head.split(b" ", 2)[1:2] != [b"200"]:
+            return None
+        data = json.loads(body.decode("utf-8"))
+        if isinstance(data, dict) and data.get("status") == "ready" and data.get("mac"):
+            return data
+        return None
+
+
+class ScanScheduler:
+    """IP별 생존 정보를 바탕으로 다음 스캔 대상을 정합니다.
+
+    평소에는 저장된 기기와 최근에 응답한 IP만 확인하고, 전체 대역 스캔은
+    점점 늘어나는 간격으로만 수행합니다. 저장된 기기가 응답하지 않게 되면
+    IP가 바뀌었을 수 있으므로 즉시 전체 스캔을 요청합니다.
+    """
+
+    def __init__(self, recent_window=600, min_sweep_interval=60, max_sweep_interval=900, missing_after=2):
+        self.recent_window = recent_window
+        self.min_sweep_interval = min_sweep_interval
+        self.max_sweep_interval = max_sweep_interval
+        self.missing_after = missing_after
+        self.reset()
+
+    def reset(self):
+        """생존 정보를 비우고 다음 스캔을 전체 스캔으로 만듭니다."""
+        # IP -> {"last_seen": 마지막 응답 시각, "mac": 마지막 MAC, "misses": 연속 무응답 횟수}
+        self.hosts = {}
+        self.sweep_interval = self.min_sweep_interval
+        self.last_sweep = None
+        self.sweep_requested = True
+
+    def plan(self, prefix, saved_ips, now=None):
+        """이번에 확인할 IP 목록과 전체 스캔 여부를 반환합니다."""
+        now = time.time() if now is None else now
+        all_hosts = [f"{prefix}{i}" for i in range(1, 255)]
+        if self.sweep_requested or self.last_sweep is None or now - self.last_sweep >= self.sweep_interval:
+            return all_hosts, True
+        targets = {ip for ip in saved_ips if ip.startswith(prefix)}
+        for ip, entry in self.hosts.items():
+            if ip.startswith(prefix) and now - entry["last_seen"] <= self.recent_window:
+                targets.add(ip)
+        return sorted(targets, key=lambda ip: int(ip.rsplit('.', 1)[1])), False
+
+    def record(self, probed, found, full, saved_macs, now=None):
+        """스캔 결과를 생존 정보에 반영합니다. found는 IP -> 응답 JSON입니다."""
+        now = time.time() if now is None else now
+        new_device = False
+        for ip in probed:
+            entry = self.hosts.get(ip)
+            data = found.get(ip)
+            if data:
+                if entry is None:
+                    new_device = True
+                    entry = self.hosts[ip] = {"last_seen": now, "mac": data["mac"], "misses": 0}
+                elif entry["mac"] != data["mac"]:
+                    # 같은 IP에 다른 기기가 응답하면 저장된 기기의 IP가 바뀐 것일 수 있음
+                    if entry["mac"] in saved_macs:
+                        self.sweep_requested = True
+                    new_device = True
+                entry.update(last_seen=now, mac=data["mac"], misses=0)
+            elif entry is not None:
+                entry["misses"] += 1
+                if entry["misses"] == self.missing_after and entry["mac"] in saved_macs:
+                    self.sweep_requested = True
+                if now - entry["last_seen"] > self.recent_window:
+                    del self.hosts[ip]
+        if full:
+            self.last_sweep = now
+            self.sweep_requested = False
+            # 새 기기가 없으면 전체 스캔 간격을 두 배로 늘림
+            if new_device:
+                self.sweep_interval = self.min_sweep_interval
+            else:
+                self.sweep_interval = min(self.sweep_interval * 2, self.max_sweep_interval)
+
+
+class DeviceClient:
+    """시럽조제기별 HTTP 세션을 재사용하는 통신 계층입니다.
+
+    IP마다 requests.Session을 하나씩 두어 펌웨어가 연결을 유지하면 재사용하고,
+    pool_block으로 기기 하나에 동시에 열리는 소켓 수를 pool_maxsize로 제한합니다.
+    현재 펌웨어(와 시뮬레이터)는 응답마다 'Connection: close'로 연결을 닫으므로 요청마다
+    새 소켓을 열며, 연결 재사용은 펌웨어가 keep-alive를 지원해야 효과가 있습니다.
+    stats()는 실제로 소켓을 연 횟수를 세어 이를 그대로 보여 줍니다.
+    """
+
+    # 요청 종류별 기본 타임아웃 (초)
+    DEFAULT_TIMEOUTS = {"probe": 1, "health": 5, "progress": 2, "syrup": 1, "dispense": 30}
+
+    def __init__(self, pool_maxsize=2, timeouts=None, port=DEVICE_PORT):
+        self.pool_maxsize = pool_maxsize
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.port = port
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "opened": 0}
+        self._pool_class = None
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def counting_pool_class(self):
+        """소켓을 열 때마다(connect 호출) 'opened'를 세는 urllib3 연결 풀 클래스를 반환합니다.
+
+        urllib3의 num_connections는 연결 객체 수라서, 서버가 연결을 닫아 같은 객체가
+        다시 connect하는 경우를 세지 못합니다.
+        """
+        if self._pool_class is None:
+            from urllib3.connection import HTTPConnection
+            from urllib3.connectionpool import HTTPConnectionPool
+            client = self
+
+            class CountingConnection(HTTPConnection):
+                def connect(self):
+                    client._count("opened")
+                    super().connect()
+
+            class CountingPool(HTTPConnectionPool):
+                ConnectionCls = CountingConnection
+
+            self._pool_class = CountingPool
+        return self._pool_class
+
+    def session(self, ip):
+        """기기 IP에 해당하는 세션을 반환합니다. 없으면 새로 만듭니다."""
+        # requests는 불러오는 데 시간이 걸리므로 시작할 때가 아니라 첫 기기 통신 때 불러옴
+        import requests
+        with self._lock:
+            session = self._sessions.get(ip)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_maxsize,
+                    pool_block=True, max_retries=0)
+                adapter.poolmanager.pool_classes_by_scheme = {"http": self.counting_pool_class()}
+                session.mount("http://", adapter)
+                self._sessions[ip] = session
+            return session
+
+    def url(self, ip, path="/"):
+        if self.port != 80 and ":" not in ip:
+            return f"http://{ip}:{self.port}{path}"
+        return f"http://{ip}{path}"
+
+    def get(self, ip, path="/", kind="probe", **kwargs):
+        kwargs.setdefault("timeout", self.timeouts[kind])
+        session = self.session(ip)
+        self._count("requests")
+        return session.get(self.url(ip, path), **kwargs)
+
+    def post(self, ip, path, kind, **kwargs):
+        kwargs.setdefault("timeout", self.timeouts[kind])
+        session = self.session(ip)
+        self._count("requests")
+        return session.post(self.url(ip, path), **kwargs)
+
+    def close(self, ip=None):
+        """세션을 닫습니다. ip가 없으면 모든 세션을 닫습니다."""
+        with self._lock:
+            ips = [ip] if ip else list(self._sessions)
+            for key in ips:
+                session = self._sessions.pop(key, None)
+                if session:
+                    session.close()
+
+    def stats(self):
+        """전체 요청 수와 실제로 소켓을 연 횟수, 열린 연결을 재사용한 요청 수를 반환합니다."""
+        with self._lock:
+            requests_sent = self._counts["requests"]
+            opened = self._counts["opened"]
+        return {"requests": requests_sent, "opened": opened, "reused": max(requests_sent - opened, 0)}
+
+
+class DeviceRegistry:
+    """연결된 시럽조제기 목록과 조회용 색인입니다.
+
+    MAC -> 기기 정보, IP -> MAC, MAC <-> 연결 기기 테이블 행, 약품코드 -> MAC 색인을
+    함께 관리해 상태 갱신과 조회를 목록 순회 없이 처리합니다. 기기 정보는
+    {"ip", "nickname", "pill_code", "status"} 형식의 딕셔너리입니다.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.ip_to_mac = {}
+        self.rows = {}
+        self.row_to_mac = {}
+        # 약품코드 -> 기기 MAC 색인과 조제 가능한('연결됨') 약품코드
+        self.pill_code_devices = {}
+        self.ready_pill_codes = set()
+
+    def add(self, mac, ip, nickname, pill_code, status="연결됨"):
+        self.remove(mac)
+        info = {"ip": ip, "nickname": nickname, "pill_code": pill_code, "status": status}
+        self.devices[mac] = info
+        self.ip_to_mac[ip] = mac
+        return info
+
+    def remove(self, mac):
+        """기기를 목록에서 제거하고, 연결되어 있던 테이블 행을 반환합니다."""
+        info = self.devices.pop(mac, None)
+        if info is None:
+            return None
+        if self.ip_to_mac.get(info["ip"]) == mac:
+            del self.ip_to_mac[info["ip"]]
+        row = self.rows.pop(mac, None)
+        if row is not None:
+            self.row_to_mac.pop(row, None)
+        return row
+
+    def by_ip(self, ip):
+        """IP에 해당하는 기기의 (MAC, 기기 정보)를 반환합니다. 없으면 (None, None)을 반환합니다."""
+        mac = self.ip_to_mac.get(ip)
+        if mac is None:
+            return None, None
+        return mac, self.devices[mac]
+
+    def set_status(self, mac, status):
+        self.devices[mac]["status"] = status
+
+    def bind_row(self, mac, row):
+        self.rows[mac] = row
+        self.row_to_mac[row] = mac
+
+    def row_for(self, mac):
+        return self.rows.get(mac)
+
+    def mac_for_row(self, row):
+        return self.row_to_mac.get(row)
+
+    def for_pill_code(self, pill_code):
+        """약품코드에 연결된 기기의 (MAC, 기기 정보)를 반환합니다. 없으면 (None, None)을 반환합니다."""
+        mac = self.pill_code_devices.get(normalize_pill_code(pill_code))
+        if mac is None or mac not in self.devices:
+            return None, None
+        return mac, self.devices[mac]
+
+    def refresh_pill_codes(self):
+        """약품코드 색인을 다시 만들고, 조제 가능 여부가 바뀐 약품코드 집합을 반환합니다."""
+        index = {}
+        for mac, info in self.devices.items():
+            # 같은 약품코드의 기기가 여럿이면 조제 가능한 기기 중 먼저 연결된 기기를 사용
+            code = normalize_pill_code(info.get("pill_code", ""))
+            current = index.get(code)
+            if current is None or (self.devices[current].get("status", "") != "연결됨"
+                                   and info.get("status", "") == "연결됨"):
+                index[code] = mac
+        ready = {code for code, mac in index.items() if self.devices[mac].get("status", "") == "연결됨"}
+        changed = ready ^ self.ready_pill_codes
+        self.pill_code_devices = index
+        self.ready_pill_codes = ready
+        return changed
+
+    def get(self, mac, default=None):
+        return self.devices.get(mac, default)
+
+    def items(self):
+        return self.devices.items()
+
+    def values(self):
+        return self.devices.values()
+
+    def __getitem__(self, mac):
+        return self.devices[mac]
+
+    def __contains__(self, mac):
+        return mac in self.devices
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __repr__(self):
+        return f"DeviceRegistry({self.devices!r})"
+
+
+# 조제 작업 대기열 파일과 기기별로 넘긴 뒤 아직 끝나지 않은 작업 수 (조제 중 1건 + 기기 대기열 1건)
+DISPENSE_QUEUE_FILE = "dispense_queue.json"
+DEVICE_MAX_IN_FLIGHT = 2
+
+# 조제 진행 상태 확인 주기와, 진행 상태를 보고하지 않는 펌웨어의 조제 완료 간주 시간 (밀리초)
+PROGRESS_POLL_INTERVAL_MS = 1000
+LEGACY_DISPENSE_TIME_MS = 30000
+
+# 기기 연결이 이 시간(초) 넘게 끊겨 있으면 그 기기의 조제 작업을 대기열에서 뺌
+DEVICE_GONE_EXPIRY_SECONDS = 600
+
+# 처방전 도착부터 기기 수신까지 걸린 시간을 긴급/일반별로 보관할 최근 작업 수
+LATENCY_SAMPLES = 200
+
+
+def percentile(values, q):
+    """values의 q 백분위수(0~100, 최근접 순위 방식)를 반환합니다. 값이 없으면 None을 반환합니다."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class DispenseQueue:
+    """기기별 조제 작업 대기열입니다.
+
+    작업은 (접수번호, 약물, 기기 MAC) 단위이며 기기마다 들어온 순서(FIFO)대로 꺼냅니다.
+    긴급 작업은 대기 중인 일반 작업보다 앞에 두고, 기기 한도를 한 건 넘겨서라도 바로 보냅니다.
+    꺼낸 작업은 전송 중 -> 기기가 접수(accept) -> 조제 완료(finish) 순으로 진행되며,
+    기기 하나에 넘긴 뒤 끝나지 않은 작업은 max_in_flight개로, 동시에 전송 중인 요청은
+    1개로 제한해 기기 대기열의 순서가 꺼낸 순서와 같게 합니다. 서로 다른 기기의 작업은
+    함께 꺼낼 수 있습니다. 대기열이 바뀔 때마다 파일에 저장하므로 프로그램을 다시 시작해도
+    남은 작업을 이어서 보내고, 기기가 접수한 작업은 완료를 계속 확인합니다. 전송 도중
+    종료되어 결과를 알 수 없는 작업은 다시 보내지 않고 interrupted에 모아 둡니다.
+    """
+
+    def __init__(self, path=DISPENSE_QUEUE_FILE, max_in_flight=DEVICE_MAX_IN_FLIGHT):
+        self.path = path
+        self.max_in_flight = max_in_flight
+        # 기기 MAC -> 대기 중인 작업 (FIFO), 기기 MAC -> {작업 ID: 전송 중인 작업}
+        self.pending = {}
+        self.in_flight = {}
+        self.next_id = 1
+        self.interrupted = []
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.next_id = data.get("next_id", 1)
+        for job in data.get("pending", []):
+            self.pending.setdefault(job["mac"], deque()).append(job)
+        for job in data.get("in_flight", []):
+            if "accepted" in job:
+                self.in_flight.setdefault(job["mac"], {})[job["id"]] = job
+            else:
+                self.interrupted.append(job)
+        if self.interrupted:
+            self.save()
+
+    def save(self):
+        """대기열을 임시 파일에 쓴 뒤 교체해 저장 도중 종료되어도 파일이 깨지지 않게 합니다."""
+        data = {
+            "next_id": self.next_id,
+            "pending": [job for jobs in self.pending.values() for job in jobs],
+            "in_flight": [job for jobs in self.in_flight.values() for job in jobs.values()],
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def add(self, receipt_number, patient_name, pill_name, pill_code, total_volume, mac,
+            urgent=False, arrived=None):
+        """작업을 추가합니다. arrived는 처방전이 도착한 시각으로, 기기 수신까지의 지연 시간 계산에 씁니다."""
+        now = time.time()
+        job = {
+            "id": self.next_id,
+            "receipt_number": receipt_number,
+            "patient_name": patient_name,
+            "pill_name": pill_name,
+            "pill_code": pill_code,
+            "total_volume": total_volume,
+            "mac": mac,
+            "urgent": urgent,
+            "created": now,
+            "arrived": arrived or now,
+        }
+        self.next_id += 1
+        self._enqueue(job)
+        self.save()
+        return job
+
+    def _enqueue(self, job):
+        jobs = self.pending.setdefault(job["mac"], deque())
+        if job.get("urgent"):
+            # 긴급 작업은 대기 중인 일반 작업보다 앞, 먼저 들어온 긴급 작업보다 뒤에 넣음
+            index = next((i for i, queued in enumerate(jobs) if not queued.get("urgent")), len(jobs))
+            jobs.insert(index, job)
+        else:
+            jobs.append(job)
+
+    def promote(self, receipt_number):
+        """접수번호의 대기 중인 작업을 긴급으로 바꿔 각 기기 대기열 앞쪽으로 옮기고, 옮긴 작업 수를 반환합니다."""
+        moved = 0
+        for jobs in self.pending.values():
+            targets = [job for job in jobs if job["receipt_number"] == receipt_number and not job.get("urgent")]
+            for job in targets:
+                jobs.remove(job)
+                job["urgent"] = True
+                self._enqueue(job)
+                moved += 1
+        if moved:
+            self.save()
+        return moved
+
+    def take_ready(self, can_send=lambda mac: True):
+        """전송 가능한 기기마다 다음 작업을 꺼내 전송 중으로 옮기고, 꺼낸 작업 목록을 반환합니다."""
+        taken = []
+        for mac, jobs in self.pending.items():
+            if not jobs or not can_send(mac):
+                continue
+            running = self.in_flight.setdefault(mac, {})
+            sending = any("accepted" not in job for job in running.values())
+            # 긴급 작업은 한도를 한 건 넘겨 보내 기기 대기열의 일반 작업보다 먼저 조제되게 함
+            limit = self.max_in_flight + (1 if jobs and jobs[0].get("urgent") else 0)
+            if jobs and not sending and len(running) < limit:
+                job = jobs.popleft()
+                running[job["id"]] = job
+                taken.append(job)
+        if taken:
+            self.save()
+        return taken
+
+    def accept(self, job, device_busy=True):
+        """기기가 작업을 대기열에 받았음을 기록합니다. 조제가 끝나면 finish를 호출합니다.
+
+        device_busy는 기기가 마지막으로 보고한 분주 중 여부입니다.
+        """
+        jobs = self.on_device(job["mac"])
+        job["accepted"] = time.time()
+        job["latency"] = job["accepted"] - job.get("arrived", job["created"])
+        if job.get("urgent") and jobs:
+            # 펌웨어는 긴급 작업을 기기 대기열 맨 앞에 넣음. 분주 중인 작업은 대기열에서 이미
+            # 꺼냈으므로 그 바로 다음이 되고, 분주 중이 아니면(약사 확인 대기 등) 맨 앞이 됨
+            jobs.insert(1 if device_busy else 0, job)
+        else:
+            jobs.append(job)
+        for order, item in enumerate(jobs):
+            item["device_order"] = order
+        self.save()
+
+    def finish(self, job):
+        self.in_flight.get(job["mac"], {}).pop(job["id"], None)
+        self.save()
+
+    def expire(self, mac):
+        """기기의 대기 중인 작업과 기기가 접수한 작업을 빼고 (대기 중, 접수됨) 목록으로 반환합니다.
+
+        전송 중인 작업은 전송 결과가 돌아올 때 정리되므로 남겨 둡니다.
+        """
+        pending = list(self.pending.pop(mac, ()))
+        running = self.in_flight.get(mac, {})
+        accepted = [job for job in running.values() if "accepted" in job]
+        for job in accepted:
+            del running[job["id"]]
+        if pending or accepted:
+            self.save()
+        return pending, accepted
+
+    def macs(self):
+        """대기 중이거나 전송 중인 작업이 있는 기기 MAC 집합을 반환합니다."""
+        return ({mac for mac, jobs in self.pending.items() if jobs}
+                | {mac for mac, running in self.in_flight.items() if running})
+
+    def is_in_flight(self, job):
+        return job["id"] in self.in_flight.get(job["mac"], {})
+
+    def on_device(self, mac):
+        """기기가 접수했지만 아직 끝나지 않은 작업을 기기가 처리할 순서대로 반환합니다."""
+        jobs = [job for job in self.in_flight.get(mac, {}).values() if "accepted" in job]
+        return sorted(jobs, key=lambda job: job["device_order"])
+
+    def accepted_macs(self):
+        return [mac for mac, running in self.in_flight.items()
+                if any("accepted" in job for job in running.values())]
+
+    def has_unsent(self, receipt_number):
+        """접수번호의 작업 중 아직 기기가 접수하지 않은 작업이 있는지 확인합니다."""
+        for jobs in itertools.chain(self.pending.values(), (running.values() for running in self.in_flight.values())):
+            if any(job["receipt_number"] == receipt_number and "accepted" not in job for job in jobs):
+                return True
+        return False
+
+    def has_receipt(self, receipt_number):
+        for jobs in itertools.chain(self.pending.values(), (running.values() for running in self.in_flight.values())):
+            if any(job["receipt_number"] == receipt_number for job in jobs):
+                return True
+        return False
+
+    def depth(self):
+        """(대기 중인 작업 수, 전송 중인 작업 수)를 반환합니다."""
+        return (sum(len(jobs) for jobs in self.pending.values()),
+                sum(len(jobs) for jobs in self.in_flight.values()))
+
+
+# 감사용 조제 로그 파일 (JSON 줄 형식, 크기 기준 순환)
+LOG_FILE = "dispense_log.jsonl"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+
+
+class JsonLineFormatter(logging.Formatter):
+    """로그 레코드를 한 줄짜리 JSON으로 만듭니다. extra={"fields": {...}}의 값도 함께 기록합니다."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def start_audit_log(path=LOG_FILE, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS):
+    """조제 로그를 순환 파일에 기록하는 로거를 시작하고 (logger, listener)를 반환합니다.
+
+    로거에는 QueueHandler만 붙이고 파일 쓰기는 QueueListener 스레드가 맡으므로,
+    로그를 남기는 쪽은 디스크 입출력을 기다리지 않습니다. 종료할 때 listener.stop()을 호출합니다.
+    """
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(JsonLineFormatter())
+    log_queue = queue.Queue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    logger = logging.getLogger("syrup.dispense")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    return logger, listener
+
+
+class PrescriptionWatcher:
+    """처방전 폴더에 새로 생긴 .txt 파일을 감지해 콜백으로 전달합니다.
+
+    리눅스에서는 inotify로 파일 쓰기 완료/이동 이벤트를 즉시 받고, 그 외 환경에서는
+    폴더의 수정 시각이 바뀐 경우에만 파일 이름 목록을 다시 읽는 폴링으로 동작합니다.
+    어느 쪽이든 폴더 안의 모든 파일을 주기적으로 stat하지 않습니다.
+    감시 중 오류는 log(message, level)로 남기며, log가 없으면 모듈 로거에 남깁니다.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    _EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, path, on_new_file, known=(), poll_interval=0.5, log=None):
+        self.path = path
+        self.on_new_file = on_new_file
+        self.log = log or (lambda message, level: logger.log(level, message))
+        self.poll_interval = poll_interval
+        self.known = {os.path.basename(p) for p in known}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def is_prescription(name):
+        return name.lower().endswith(".txt")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _emit(self, name):
+        if name in self.known or not self.is_prescription(name):
+            return
+        self.known.add(name)
+        try:
+            # 콜백이 False를 반환하면 파일이 다시 쓰여질 때 다시 전달
+            if self.on_new_file(os.path.join(self.path, name)) is False:
+                self.known.discard(name)
+        except Exception as e:
+            self.log(f"처방전 파일 처리 요청 중 오류 발생: {e}", logging.ERROR)
+
+    def _run(self):
+        fd = self._open_inotify()
+        # 감시 시작 전에 생긴 파일도 놓치지 않도록 한 번 목록을 읽음
+        self._initial_scan()
+        if fd is not None:
+            try:
+                self._run_inotify(fd)
+            finally:
+                os.close(fd)
+        else:
+            self._run_polling()
+
+    def _initial_scan(self):
+        try:
+            with os.scandir(self.path) as entries:
+                names = [(entry.stat().st_mtime, entry.name) for entry in entries
+                         if entry.is_file() and entry.name not in self.known and self.is_prescription(entry.name)]
+        except OSError as e:
+            self.log(f"처방전 폴더를 읽을 수 없습니다: {e}", logging.ERROR)
+            return
+        for _, name in sorted(names):
+            self._emit(name)
+
+    def _open_inotify(self):
+        """inotify를 사용할 수 있으면 감시 fd를, 아니면 None을 반환합니다."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            wd = libc.inotify_add_watch(fd, os.fsencode(self.path), self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+            if wd < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _run_inotify(self, fd):
+        header_size = self._EVENT_HEADER.size
+        while not self._stop.is_set():
+            ready, _, _ = select.select([fd], [], [], self.poll_interval)
+            if not ready:
+                continue
+            data = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset + header_size <= len(data):
+                _, mask, _, length = self._EVENT_HEADER.unpack_from(data, offset)
+                raw_name = data[offset + header_size:offset + header_size + length]
+                offset += header_size + length
+                if mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                    self._emit(os.fsdecode(raw_name.rstrip(b"\0")))
+
+    def _run_polling(self):
+        last_mtime = None
+        # 아직 쓰는 중일 수 있는 새 파일 (이름 -> 마지막으로 본 크기)
+        pending = {}
+        while not self._stop.wait(self.poll_interval):
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != last_mtime:
+                    last_mtime = mtime
+                    with os.scandir(self.path) as entries:
+                        for entry in entries:
+                            if entry.name not in self.known and entry.name not in pending and self.is_prescription(entry.name):
+                                pending[entry.name] = -1
+                # 새 파일은 크기가 한 주기 동안 변하지 않았을 때 도착 순서대로 전달
+                ready = []
+                for name, last_size in list(pending.items()):
+                    try:
+                        stat = os.stat(os.path.join(self.path, name))
+                    except FileNotFoundError:
+                        del pending[name]
+                        continue
+                    if stat.st_size > 0 and stat.st_size == last_size:
+                        del pending[name]
+                        ready.append((stat.st_mtime_ns, name))
+                    else:
+                        pending[name] = stat.st_size
+                for _, name in sorted(ready):
+                    self._emit(name)
+            except OSError as e:
+                self.log(f"파일 모니터링 중 오류 발생: {e}", logging.ERROR)
+
+
+class PrescriptionCache:
+    """처방전 파싱 결과를 파일 경로, 크기, 수정 시각 기준으로 SQLite에 저장합니다.
+
+    시작할 때 크기와 수정 시각이 그대로인 파일은 다시 파싱하지 않고 캐시에서 불러옵니다.
+    """
+
+    SCHEMA_VERSION = 2
+
+    def __init__(self, db_path="prescription_cache.db"):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self.conn:
+            # 저장 형식이 바뀌면 기존 캐시를 버리고 다시 만듦
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                self.conn.execute("DROP TABLE IF EXISTS prescriptions")
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS prescriptions ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, data TEXT NOT NULL)")
+
+    def paths(self, folder):
+        """폴더에 속한 캐시 항목의 경로 목록을 반환합니다."""
+        prefix = os.path.join(folder, "")
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path FROM prescriptions WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_many(self, paths):
+        """경로별 캐시 항목을 {경로: (크기, 수정 시각, 처방전 JSON)} 형태로 반환합니다."""
+        paths = list(paths)
+        result = {}
+        with self._lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT path, size, mtime_ns, data FROM prescriptions WHERE path IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                for path, size, mtime_ns, data in rows:
+                    result[path] = (size, mtime_ns, data)
+        return result
+
+    def put_many(self, entries):
+        """(경로, 크기, 수정 시각, 처방전) 목록을 저장합니다."""
+        rows = [(path, size, mtime_ns, prescription_to_json(prescription))
+                for path, size, mtime_ns, prescription in entries]
+        if not rows:
+            return
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO prescriptions VALUES (?, ?, ?, ?)", rows)
+
+    def put(self, path, prescription):
+        """파일 하나의 파싱 결과를 현재 크기, 수정 시각과 함께 저장합니다."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        self.put_many([(path, stat.st_size, stat.st_mtime_ns, prescription)])
+
+    def delete_many(self, paths):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM prescriptions WHERE path = ?", [(path,) for path in paths])
+
+
+class PrescriptionIndex:
+    """파싱된 처방전을 접수번호와 접수일로 색인합니다.
+
+    날짜별 조회는 해당 날짜의 처방전만, 기간 조회는 정렬된 날짜 목록에서
+    범위에 드는 날짜만 확인하므로 전체 처방전 수와 무관하게 동작합니다.
+    """
+
+    def __init__(self):
+        # 접수번호 -> 처방전
+        self.by_receipt = {}
+        # 접수일(YYYY-MM-DD) -> {접수번호: 처방전}
+        self.by_date = {}
+        # 정렬된 접수일 목록
+        self.dates = []
+
+    def add(self, prescription):
+        receipt_number = prescription.receipt_number.strip()
+        self.remove(receipt_number)
+        self.by_receipt[receipt_number] = prescription
+        date = prescription.receipt_time
+        if date not in self.by_date:
+            self.by_date[date] = {}
+            bisect.insort(self.dates, date)
+        self.by_date[date][receipt_number] = prescription
+
+    def remove(self, receipt_number):
+        prescription = self.by_receipt.pop(str(receipt_number).strip(), None)
+        if prescription is None:
+            return None
+        date = prescription.receipt_time
+        day = self.by_date.get(date)
+        if day is not None:
+            day.pop(prescription.receipt_number.strip(), None)
+            if not day:
+                del self.by_date[date]
+                self.dates.pop(bisect.bisect_left(self.dates, date))
+        return prescription
+
+    def get(self, receipt_number, default=None):
+        return self.by_receipt.get(str(receipt_number).strip(), default)
+
+    def on_date(self, date):
+        """해당 날짜의 처방전을 접수번호 순으로 반환합니다."""
+        day = self.by_date.get(date, {})
+        return [day[k] for k in sorted(day)]
+
+    def in_range(self, start, end):
+        """start부터 end까지(포함) 날짜의 처방전을 접수번호 순으로 반환합니다."""
+        result = []
+        lo = bisect.bisect_left(self.dates, start)
+        hi = bisect.bisect_right(self.dates, end)
+        for date in self.dates[lo:hi]:
+            result.extend(self.on_date(date))
+        return result
+
+    def values(self):
+        return self.by_receipt.values()
+
+    def __getitem__(self, receipt_number):
+        return self.by_receipt[str(receipt_number).strip()]
+
+    def __contains__(self, receipt_number):
+        return str(receipt_number).strip() in self.by_receipt
+
+    def __len__(self):
+        return len(self.by_receipt)
+
+
+# 한 번에 반영할 새 처방전 수와 처리 대기열 크기
+PRESCRIPTION_BATCH_SIZE = 20
+PRESCRIPTION_QUEUE_SIZE = 256
+
+# 메모리에 유지할 최대 접수일 수 (오늘은 항상 유지)
+MAX_RESIDENT_DAYS = 7
+
+
+def normalize_pill_code(pill_code):
+    """약품코드를 비교할 수 있도록 문자열로 바꾸고 앞뒤 공백을 제거합니다."""
+    return str(pill_code).strip()
+
+
+def receipt_date(receipt_number):
+    """접수번호 앞 8자리(YYYYMMDD)로 접수일(YYYY-MM-DD)을 만듭니다."""
+    return f"{receipt_number[:4]}-{receipt_number[4:6]}-{receipt_number[6:8]}"
+
+
+def is_valid_date(date):
+    """date가 'YYYY-MM-DD' 형식의 올바른 날짜인지 확인합니다."""
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+# 처방전 약물 한 줄 (파일의 '\\' 구분 항목 순서와 같음)
+MedicineRecord = namedtuple(
+    'MedicineRecord', ['pill_code', 'pill_name', 'volume', 'daily', 'period', 'total', 'date', 'line_number'])
+
+# 처방전 한 건 (errors는 형식이 잘못된 줄에 대한 설명 목록)
+Prescription = namedtuple(
+    'Prescription', ['receipt_number', 'patient_name', 'receipt_time', 'medicines', 'errors'])
+
+
+def sniff_encoding(head):
+    """파일 앞부분으로 인코딩을 판단합니다. BOM이나 올바른 UTF-8이 아니면 cp949로 봅니다."""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if any(byte >= 0x80 for byte in head):
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+    # euc-kr은 cp949의 부분집합이므로 cp949 하나로 처리
+    return 'cp949'
+
+
+def iter_medicine_records(lines, errors, first_line_number=2):
+    """약물 줄을 하나씩 MedicineRecord로 변환합니다. 잘못된 줄은 errors에 기록하고 건너뜁니다."""
+    for line_number, line in enumerate(lines, start=first_line_number):
+        line = line.strip()
+        if not line:
+            continue
+        parts = line.split('\\')
+        if len(parts) < 8:
+            errors.append(f"{line_number}번째 줄: 항목이 {len(parts)}개뿐입니다")
+            continue
+        try:
+            yield MedicineRecord(
+                sys.intern(parts[0]), sys.intern(parts[1]),
+                int(parts[2]), int(parts[3]), int(parts[4]), int(parts[5]),
+                sys.intern(parts[6]), int(parts[7]))
+        except ValueError as e:
+            errors.append(f"{line_number}번째 줄: {e}")
+
+
+def read_prescription_file(file_path):
+    """처방전 파일을 한 번만 디코딩하며 줄 단위로 읽어 Prescription을 반환합니다. 빈 파일이면 None을 반환합니다."""
+    with open(file_path, 'rb') as raw:
+        encoding = sniff_encoding(raw.read(4096))
+        raw.seek(0)
+        with io.TextIOWrapper(raw, encoding=encoding, errors='replace') as f:
+            # 환자 이름 파싱
+            first_line = f.readline()
+            if not first_line:
+                return None
+            errors = []
+            # 처방전줄수 기준으로 정렬
+            medicines = sorted(iter_medicine_records(f, errors), key=lambda m: m.line_number)
+        
+    # 파일명에서 접수번호 추출
+    receipt_number = os.path.basename(file_path).split('.')[0]
+    
+    # 접수 시간 생성 (파일명의 날짜 부분 사용)
+    return Prescription(receipt_number, first_line.strip(), receipt_date(receipt_number),
+                        tuple(medicines), tuple(errors))
+
+
+def prescription_to_json(prescription):
+    """캐시에 저장할 수 있도록 처방전을 JSON 문자열로 바꿉니다."""
+    return json.dumps([prescription.receipt_number, prescription.patient_name, prescription.receipt_time,
+                       [list(m) for m in prescription.medicines], list(prescription.errors)],
+                      ensure_ascii=False)
+
+
+def prescription_from_json(data):
+    receipt_number, patient_name, receipt_time, medicines, errors = json.loads(data)
+    return Prescription(receipt_number, patient_name, receipt_time,
+                        tuple(MedicineRecord(*m) for m in medicines), tuple(errors))
+
+
+def parse_file_for_import(file_path):
+    """일괄 가져오기 작업 프로세스에서 파일 하나를 파싱합니다.
+
+    (경로, 크기, 수정 시각, 처방전 또는 None, 오류 메시지 또는 None)을 반환합니다.
+    """
+    try:
+        stat = os.stat(file_path)
+        return file_path, stat.st_size, stat.st_mtime_ns, read_prescription_file(file_path), None
+    except Exception as e:
+        return file_path, 0, 0, None, str(e)
+
+
+def bulk_import_prescriptions(folder, cache, workers=None, on_progress=None):
+    """폴더의 처방전 중 캐시에 없거나 바뀐 파일을 프로세스 풀에서 나눠 파싱해 캐시에 저장합니다.
+
+    on_progress(처리한 수, 전체 수)는 진행될 때마다 호출됩니다. 결과 요약을 반환합니다.
+    """
+    started = time.perf_counter()
+    with os.scandir(folder) as entries:
+        files = {entry.path: entry.stat() for entry in entries
+                 if entry.name.lower().endswith(".txt") and entry.is_file()}
+    cached = cache.get_many(files)
+    stale = sorted(path for path, stat in files.items()
+                   if cached.get(path, (None, None))[:2] != (stat.st_size, stat.st_mtime_ns))
+    errors = []
+    parsed = 0
+    batch = []
+    if on_progress:
+        on_progress(0, len(stale))
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, min(256, len(stale) // ((workers or os.cpu_count() or 1) * 4)))
+            for done, (path, size, mtime_ns, prescription, error) in enumerate(
+                    executor.map(parse_file_for_import, stale, chunksize=chunksize), start=1):
+                if error is not None:
+                    errors.append(f"{os.path.basename(path)}: {error}")
+                elif prescription is not None:
+                    batch.append((path, size, mtime_ns, prescription))
+                    parsed += 1
+                if len(batch) >= 500:
+                    cache.put_many(batch)
+                    batch = []
+                if on_progress and (done % 100 == 0 or done == len(stale)):
+                    on_progress(done, len(stale))
+        cache.put_many(batch)
+    return {
+        "files": len(files),
+        "cached": len(files) - len(stale),
+        "parsed": parsed,
+        "errors": errors,
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def find_networks():
+    """이 PC의 IPv4 주소로 스캔할 네트워크 대역(예: '192.168.0.') 목록을 반환합니다.
+
+    호스트 이름 조회가 오래 걸릴 수 있으므로 시작할 때는 작업 스레드에서 호출합니다.
+    """
+    networks = []
+    for host_ip in socket.getaddrinfo(socket.gethostname(), None):
+        if len(host_ip[4]) == 2:
+            ip = host_ip[4][0]
+            if not ip.startswith('127.'):
+                network = '.'.join(ip.split('.')[:-1]) + '.'
+                if network not in networks:
+                    networks.append(network)
+    return networks
+
+
+def index_prescription_folder(folder, cache, warm_dates=()):
+    """처방전 폴더의 파일을 접수일별로 분류해 ({접수일: [경로]}, 새로 파싱한 [(경로, 처방전)])을 반환합니다.
+
+    파일 이름(접수번호) 앞 8자리가 접수일이므로 파일을 열지 않고 분류하며, 사라진 파일은 캐시에서 지웁니다.
+    warm_dates의 파일 중 캐시에 없거나 바뀐 파일은 미리 파싱해 캐시에 넣어 두므로, 이후 불러올 때는
+    캐시만 읽습니다. 캐시는 스레드 안전하므로 작업 스레드에서 호출할 수 있습니다.
+    """
+    files_by_date = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(".txt") and entry.is_file():
+                date = receipt_date(entry.name.split('.')[0])
+                files_by_date.setdefault(date, []).append(entry.path)
+    # 사라진 파일은 캐시에서 제거
+    existing = {path for paths in files_by_date.values() for path in paths}
+    cache.delete_many([path for path in cache.paths(folder) if path not in existing])
+    paths = [path for date in warm_dates for path in files_by_date.get(date, ())]
+    cached = cache.get_many(paths)
+    new_entries = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        cached_entry = cached.get(path)
+        if cached_entry and cached_entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            continue
+        try:
+            prescription = read_prescription_file(path)
+        except Exception:
+            # 읽지 못한 파일은 불러올 때 다시 파싱하며 오류를 로그에 남김
+            continue
+        if prescription is not None:
+            new_entries.append((path, stat.st_size, stat.st_mtime_ns, prescription))
+    cache.put_many(new_entries)
+    return files_by_date, [(path, prescription) for path, _, _, prescription in new_entries]
+
+
+# 저장된 연결 정보와 처방전 폴더 경로 파일
+CONNECTIONS_FILE = "connections.json"
+PRESCRIPTION_PATH_FILE = "prescription_path.txt"
+
+# 시작할 때 백그라운드에서 진행하는 단계와 로그에 표시할 이름
+STARTUP_STAGES = {"networks": "네트워크 감지", "prescriptions": "처방전 색인", "scan": "첫 기기 스캔"}
+
+
+class EventLoop:
+    """화면 없이 SyrupCore를 실행하는 이벤트 루프입니다.
+
+    UIDispatcher와 같은 after(ms, callback, *args)와 post(callback, *args, key=None)를 제공하며,
+    예약된 콜백은 run_forever/run_until을 호출한 스레드 하나에서 차례로 실행됩니다.
+    post는 어느 스레드에서나 호출할 수 있고, key가 같은 대기 중인 콜백은 마지막 것 하나로 합쳐집니다.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # (실행 시각, 순번, 콜백, 인자) 힙
+        self._timers = []
+        self._seq = itertools.count()
+        self._keyed = {}
+        self._stopped = False
+
+    def after(self, ms, callback, *args):
+        with self._cond:
+            heapq.heappush(self._timers, (time.monotonic() + ms / 1000, next(self._seq), callback, args))
+            self._cond.notify()
+
+    def after_idle(self, callback, *args):
+        self.after(0, callback, *args)
+
+    def post(self, callback, *args, key=None):
+        with self._cond:
+            if key is not None:
+                queued = key in self._keyed
+                self._keyed[key] = (callback, args)
+                if queued:
+                    return
+                callback, args = self._run_keyed, (key,)
+            heapq.heappush(self._timers, (time.monotonic(), next(self._seq), callback, args))
+            self._cond.notify()
+
+    def _run_keyed(self, key):
+        with self._cond:
+            callback, args = self._keyed.pop(key)
+        callback(*args)
+
+    def _call(self, callback, args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.exception(f"이벤트 처리 중 오류 발생: {e}")
+
+    def _next(self, deadline=None):
+        """실행할 때가 된 콜백을 꺼냅니다. deadline(monotonic)까지 없거나 멈추면 None을 반환합니다."""
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                if self._timers and self._timers[0][0] <= now:
+                    _, _, callback, args = heapq.heappop(self._timers)
+                    return callback, args
+                wait = self._timers[0][0] - now if self._timers else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+            return None
+
+    def run_pending(self):
+        """지금 실행할 때가 된 콜백만 실행합니다 (실행 중에 새로 예약된 콜백은 다음 호출에서 실행)."""
+        with self._cond:
+            now = time.monotonic()
+            last = next(self._seq)
+        while True:
+            with self._cond:
+                if not self._timers or self._timers[0][0] > now or self._timers[0][1] > last:
+                    return
+                _, _, callback, args = heapq.heappop(self._timers)
+            self._call(callback, args)
+
+    def run_until(self, predicate, timeout=None):
+        """predicate()가 참이 될 때까지 콜백을 실행합니다. timeout(초)이 지나면 TimeoutError를 냅니다."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not predicate():
+            # 작업 스레드가 바꾸는 값을 기다릴 수도 있으므로 조건을 짧은 간격으로 다시 확인
+            check = time.monotonic() + 0.05
+            item = self._next(check if deadline is None else min(check, deadline))
+            if item is not None:
+                self._call(*item)
+            elif self._stopped:
+                return
+            elif deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"{timeout}초 안에 끝나지 않았습니다")
+
+    def run_forever(self):
+        """stop()이 호출될 때까지 콜백을 실행합니다."""
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            self._call(*item)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class SyrupCore:
+    """화면과 무관한 시럽조제기 연결 엔진입니다.
+
+    저장된 기기, 네트워크 스캔, 기기 상태 확인, 조제 대기열과 전송, 처방전 파싱/감시/캐시를
+    담당합니다. 모든 상태는 loop(after/post를 제공하는 EventLoop 또는 UIDispatcher)를 실행하는
+    스레드 하나에서만 바꾸고, 작업 스레드의 결과는 loop.post로 그 스레드에 돌아옵니다.
+
+    화면이나 서비스는 subscribe(이벤트, 콜백)으로 상태 변화를 받습니다. 콜백은 loop 스레드에서
+    호출되며, 'log' 이벤트만 log()를 호출한 스레드에서 바로 호출되므로 스레드 안전해야 합니다.
+
+      log (message, level)                          조제 로그 한 줄
+      saved_devices_changed ()                      저장된 기기 목록 변경
+      device_discovered (mac, ip)                   스캔 중 기기가 응답함
+      scan_finished (summary)                       스캔 종료 (응답하지 않은 기기는 discovered_devices에서 빠짐)
+      device_connected (mac, info)                  기기 연결
+      device_disconnected (mac, row)                기기 연결 해제 (row는 bind_row로 묶어 둔 화면 행)
+      device_status (mac)                           기기 상태 변경
+      pill_codes_changed (pill_codes)               조제 가능 여부가 바뀐 약품코드
+      connection_stats (stats)                      상태 확인 한 주기가 끝난 뒤의 HTTP 연결 통계
+      prescription_added (prescription)             감시 중인 폴더에 새 처방전 도착
+      prescriptions_reloaded ()                     처방전 폴더를 다시 읽음
+      transmission_status (receipt_number, status)  전송여부 변경
+      dispense_queue_changed ()                     조제 대기열 길이 또는 지연 시간 변경
+      dispense_failed (receipt_number, pill_names)  최대 재시도 후에도 전송하지 못한 약물
+      dispense_expired (receipt_number, pill_names) 기기 연결이 오래 끊겨 대기열에서 뺀 약물
+      bulk_import_progress (done, total)
+      bulk_import_finished (result, error)
+      networks_detected (networks)                  시작할 때 찾은 네트워크 대역 (없으면 빈 목록)
+      startup_progress (stage, done, total)         STARTUP_STAGES의 한 단계가 끝남
+      startup_finished (times)                      모든 시작 단계가 끝남 ({단계: start() 후 완료 시점(초)})
+    """
+
+    def __init__(self, loop, port=DEVICE_PORT):
+        self.loop = loop
+        self._subscribers = {}
+
+        # 자동 조제 상태
+        self.auto_dispensing = False
+
+        # 저장된 연결 정보
+        self.saved_connections = {}
+        self.last_connected = None
+        self.network_prefix = None
+        self.available_networks = []
+
+        # 현재 연결된 기기들 (MAC/IP/화면 행/약품코드 색인)
+        self.connected_devices = DeviceRegistry()
+        self.auto_reconnect_attempted = set()
+
+        # 네트워크 스캔 엔진 및 스캔으로 발견된 기기 (MAC -> IP)
+        self.discovery = DeviceDiscovery(port=port)
+        self.scan_scheduler = ScanScheduler()
+        self.discovered_devices = {}
+        # 탐색 중이라 미뤄 둔 전체 스캔 요청
+        self.full_scan_requested = False
+
+        # 감사 로그 파일 기록기
+        self.audit_log, self.audit_log_listener = start_audit_log()
+
+        # 기기별 HTTP 세션 (연결 재사용 및 기기당 동시 연결 수 제한)
+        self.device_client = DeviceClient(pool_maxsize=2, port=port)
+
+        # 연결 상태 확인용 작업 스레드 풀 및 확인 중인 항목
+        self.health_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="health-check")
+        self.health_checks_pending = set()
+        self.health_check_cycle = set()
+
+        # 조제 요청 전송용 작업 스레드 풀
+        self.dispense_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dispense")
+
+        # 조제 진행 상태 확인용 작업 스레드 풀 (응답 없는 기기의 상태 확인이 완료 감지를 막지 않도록 분리)
+        self.progress_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="progress")
+
+        # 기기별 조제 작업 대기열과 접수번호별 전송 결과 (건너뛴 약물 여부, 실패한 약물)
+        self.dispense_queue = DispenseQueue()
+        self.dispense_results = {}
+
+        # 접수번호 -> 처방전 파일이 감지된 시각, 긴급/일반 작업의 도착 -> 기기 수신 지연 시간 (초)
+        self.arrival_times = {}
+        self.dispense_latency = {True: deque(maxlen=LATENCY_SAMPLES), False: deque(maxlen=LATENCY_SAMPLES)}
+
+        # 조제 진행 상태 확인 중인 기기와 연속 확인 실패 횟수,
+        # 진행 상태를 보고하지 않는 (구형 펌웨어) 기기와 완료 간주 타이머가 걸린 작업
+        self.progress_polls_pending = set()
+        self.progress_failures = {}
+        # 기기 MAC -> 마지막 진행 상태 응답의 분주 중 여부 (긴급 작업의 기기 대기열 위치 계산용)
+        self.device_busy = {}
+        # 작업이 남은 기기 MAC -> 연결이 끊긴 것을 처음 본 시각
+        self.device_gone_since = {}
+        self.legacy_devices = set()
+        self.legacy_timers = set()
+
+        # 처방전 파일 경로
+        self.prescription_path = self.load_prescription_path()
+
+        # 파싱된 파일 목록
+        self.parsed_files = set()
+
+        # 처방전 폴더 감시기 및 새 처방전 처리 대기열
+        self.prescription_watcher = None
+        self.prescription_queue = queue.Queue(maxsize=PRESCRIPTION_QUEUE_SIZE)
+
+        # 파싱된 처방전 데이터 (접수번호 및 접수일별 색인)
+        self.parsed_prescriptions = PrescriptionIndex()
+
+        # 접수번호 -> 전송여부 (조회 날짜가 바뀌어도 유지)
+        self.transmission_status = {}
+
+        # 처방전 파싱 결과 캐시
+        self.prescription_cache = PrescriptionCache()
+
+        # 접수일별 처방전 파일 경로와 메모리에 불러온 접수일 (LRU 순서)
+        self.prescription_files_by_date = {}
+        self.resident_dates = OrderedDict()
+
+        # 일괄 가져오기 진행 여부
+        self.import_running = False
+
+        # start()를 호출한 시각과 시작 단계별 완료 시점 (초)
+        self.startup_started = None
+        self.startup_times = {}
+
+        # 저장된 연결 정보 로드
+        self.load_connections()
+
+    # ── 이벤트 ──────────────────────────────────────────────────────
+
+    def subscribe(self, event, callback):
+        self._subscribers.setdefault(event, []).append(callback)
+
+    def emit(self, event, *args):
+        for callback in self._subscribers.get(event, ()):
+            callback(*args)
+
+    def start(self, network_prefix=None):
+        """지난 실행에서 남은 조제 작업을 알리고, 주기 작업과 시작 단계를 시작합니다.
+
+        화면이나 서비스가 바로 응답하도록 네트워크 감지, 처방전 색인, 첫 전체 스캔은
+        백그라운드에서 진행하고 'startup_progress'/'startup_finished'로 알립니다.
+        network_prefix를 주면 네트워크 감지 없이 그 대역을 스캔합니다.
+        """
+        self.startup_started = time.perf_counter()
+        self.startup_times = {}
+
+        # 지난 실행에서 남은 조제 작업 확인
+        self.restore_dispense_queue()
+
+        # 주기적인 부분 스캔은 첫 전체 스캔이 시작된 뒤부터
+        self.loop.after(5000, self.schedule_scan)
+
+        # 주기적인 연결 상태 확인
+        self.schedule_connection_check()
+
+        # 기기가 접수한 조제 작업의 완료 확인
+        self.schedule_progress_poll()
+
+        # 새 처방전 대기열 처리 시작
+        self.process_prescription_queue()
+
+        # 네트워크 감지 후 첫 전체 스캔
+        if network_prefix:
+            self.finish_startup_stage("networks")
+            self.select_network(network_prefix)
+        else:
+            self.detect_networks_in_background()
+
+        # 처방전 색인 후 폴더 감시 시작
+        self.index_prescriptions_in_background()
+
+    def finish_startup_stage(self, stage):
+        """시작 단계의 완료 시점을 기록하고, 모든 단계가 끝나면 시작 시간을 로그에 남깁니다."""
+        if self.startup_started is None or stage in self.startup_times:
+            return
+        self.startup_times[stage] = time.perf_counter() - self.startup_started
+        self.emit("startup_progress", stage, len(self.startup_times), len(STARTUP_STAGES))
+        if len(self.startup_times) < len(STARTUP_STAGES):
+            return
+        times = {stage: self.startup_times[stage] for stage in STARTUP_STAGES}
+        self.log("시작 단계 완료 시점: " + ", ".join(
+            f"{STARTUP_STAGES[stage]} {seconds:.2f}초" for stage, seconds in times.items()),
+            **{f"{stage}_s": round(seconds, 3) for stage, seconds in times.items()})
+        self.emit("startup_finished", times)
+
+    def close(self):
+        """감시와 작업 스레드를 멈추고, 감사 로그 파일에 남은 기록을 모두 씁니다."""
+        if self.prescription_watcher:
+            self.prescription_watcher.stop()
+        self.health_executor.shutdown(wait=False)
+        self.dispense_executor.shutdown(wait=False)
+        self.progress_executor.shutdown(wait=False)
+        self.device_client.close()
+        self.audit_log_listener.stop()
+
+    def log(self, message, level=logging.INFO, **fields):
+        """조제 로그에 메시지를 남깁니다. 어느 스레드에서나 호출할 수 있습니다.
+
+        모든 수준을 감사 로그 파일에 기록하고 'log' 이벤트로 알립니다.
+        fields는 감사 로그 파일의 JSON 항목에만 추가됩니다.
+        """
+        self.audit_log.log(level, message, extra={"fields": fields})
+        self.emit("log", message, level)
+
+    # ── 저장된 기기 ─────────────────────────────────────────────────
+
+    def load_connections(self):
+        """저장된 연결 정보를 로드합니다."""
+        try:
+            with open(CONNECTIONS_FILE, "r") as f:
+                data = json.load(f)
+                self.saved_connections = data.get("connections", {})
+                self.last_connected = data.get("last_connected")
+
+                # 기존 연결 정보에 pill_code 필드가 없는 경우 추가
+                for mac, info in self.saved_connections.items():
+                    if "pill_code" not in info:
+                        info["pill_code"] = ""
+        except FileNotFoundError:
+            pass
+
+    def save_connections(self):
+        data = {"connections": self.saved_connections, "last_connected": self.last_connected}
+        with open(CONNECTIONS_FILE, "w") as f:
+            json.dump(data, f)
+
+    def save_device(self, mac, nickname, pill_code):
+        """스캔으로 발견한 기기를 별명, 약품코드와 함께 저장합니다."""
+        self.saved_connections[mac] = {
+            "ip": self.discovered_devices[mac],
+            "nickname": nickname,
+            "pill_code": pill_code
+        }
+        self.save_connections()
+        self.emit("saved_devices_changed")
+
+    def delete_device(self, mac):
+        """저장된 기기를 삭제합니다. 연결된 기기면 삭제하지 않고 False를 반환합니다."""
+        if mac in self.connected_devices:
+            return False
+        del self.saved_connections[mac]
+        self.save_connections()
+        self.emit("saved_devices_changed")
+        return True
+
+    def device_for_pill_code(self, pill_code):
+        """약품코드에 연결된 기기의 (MAC, 기기 정보)를 반환합니다. 없으면 (None, None)을 반환합니다."""
+        return self.connected_devices.for_pill_code(pill_code)
+
+    # ── 네트워크 스캔 ───────────────────────────────────────────────
+
+    def detect_networks(self):
+        """이 PC의 IPv4 주소로 네트워크 대역을 찾아 반환합니다. 찾으면 첫 대역을 선택해 스캔합니다."""
+        self.available_networks = find_networks()
+        if self.available_networks:
+            self.select_network(self.available_networks[0])
+        return self.available_networks
+
+    def detect_networks_in_background(self):
+        """작업 스레드에서 네트워크 대역을 찾고, 결과는 loop에서 on_networks_detected로 반영합니다."""
+        def run():
+            try:
+                networks = find_networks()
+                error = None
+            except Exception as e:
+                networks = []
+                error = str(e)
+            self.loop.post(self.on_networks_detected, networks, error)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def on_networks_detected(self, networks, error):
+        """찾은 네트워크 대역을 알리고, 아직 선택한 대역이 없으면 첫 대역을 전체 스캔합니다."""
+        if error is not None:
+            self.log(f"네트워크 감지 중 오류 발생: {error}", logging.WARNING)
+        elif not networks:
+            self.log("사용 가능한 네트워크를 찾을 수 없습니다. 네트워크 설정에서 수동으로 지정해주세요.",
+                     logging.WARNING)
+        for network in networks:
+            if network not in self.available_networks:
+                self.available_networks.append(network)
+        self.emit("networks_detected", networks)
+        self.finish_startup_stage("networks")
+        if self.network_prefix:
+            # 감지하는 동안 사용자가 대역을 직접 정했으면 그 대역의 스캔을 따름
+            return
+        if networks:
+            self.select_network(networks[0])
+        else:
+            # 스캔할 대역이 없으면 첫 스캔 단계는 건너뜀
+            self.finish_startup_stage("scan")
+
+    def select_network(self, prefix, reset=False):
+        """스캔할 네트워크 대역(예: '192.168.1.')을 정하고 전체 스캔합니다.
+
+        reset이면 이전 대역의 생존 정보를 버립니다.
+        """
+        self.network_prefix = prefix
+        if prefix not in self.available_networks:
+            self.available_networks.append(prefix)
+        if reset:
+            self.scan_scheduler.reset()
+        self.scan_network()
+
+    def schedule_scan(self):
+        self.scan_network(full=False)
+        self.loop.after(5000, self.schedule_scan)
+
+    def scan_network(self, full=True):
+        """현재 네트워크 대역을 백그라운드에서 스캔합니다.
+
+        full이 False면 스캔 스케줄러가 정한 IP만 확인합니다.
+        """
+        if not self.network_prefix:
+            return
+        if full:
+            hosts = [f"{self.network_prefix}{i}" for i in range(1, 255)]
+        else:
+            saved_ips = [info["ip"] for info in self.saved_connections.values()]
+            hosts, full = self.scan_scheduler.plan(self.network_prefix, saved_ips)
+            if not hosts:
+                return
+        started = self.discovery.scan(
+            hosts,
+            on_found=lambda ip, data: self.loop.post(self.on_device_found, ip, data),
+            on_done=lambda stats: self.loop.post(self.on_scan_finished, stats, full))
+        if not started and full:
+            # 이미 탐색 중이면 요청한 전체 스캔을 지금 탐색이 끝난 뒤에 실행
+            self.full_scan_requested = True
+
+    def on_device_found(self, ip, data):
+        """스캔 중 응답한 기기를 기록하고, 저장된 기기면 자동으로 연결합니다."""
+        mac = data['mac']
+        self.discovered_devices[mac] = ip
+        self.emit("device_discovered", mac, ip)
+        if mac not in self.saved_connections:
+            return
+        if mac in self.connected_devices or mac in self.auto_reconnect_attempted:
+            return
+        self.auto_reconnect_attempted.add(mac)
+        # 스캔이 이미 이 IP에서 기기를 확인했으므로 다시 확인하지 않고 바로 연결
+        if self.saved_connections[mac]["ip"] != ip:
+            self.saved_connections[mac]["ip"] = ip
+            self.save_connections()
+        self.register_device(mac, ip)
+
+    def on_scan_finished(self, stats, full=True):
+        """스캔이 끝나면 응답하지 않은 기기를 발견 목록에서 빼고 소요 시간을 알립니다."""
+        probed = set(stats['hosts'])
+        found_macs = {data['mac'] for data in stats['found'].values()}
+        self.scan_scheduler.record(probed, stats['found'], full, set(self.saved_connections))
+        for mac in list(self.discovered_devices):
+            if mac not in found_macs and self.discovered_devices[mac] in probed:
+                del self.discovered_devices[mac]
+        scan_type = "전체" if full else "부분"
+        summary = (f"마지막 스캔({scan_type}): {len(probed)}개 주소, {len(found_macs)}대 발견, "
+                   f"{stats['elapsed']:.2f}초")
+        self.emit("scan_finished", summary)
+        self.log(summary, logging.DEBUG)
+        if full:
+            self.finish_startup_stage("scan")
+        if self.full_scan_requested:
+            self.full_scan_requested = False
+            self.scan_network()
+
+    # ── 기기 연결 ───────────────────────────────────────────────────
+
+    def connect_to_device(self, mac):
+        """저장된 기기에 연결합니다. 'connected', 'already_connected', 'not_found' 중 하나를 반환합니다."""
+        if mac in self.connected_devices:
+            return "already_connected"
+        if mac not in self.saved_connections:
+            return "not_found"
+        ip = self.saved_connections[mac]["ip"]
+        try:
+            response = self.device_client.get(ip, kind="probe")
+            if response.status_code == 200:
+                data = response.json()
+                if data["mac"] == mac:
+                    self.register_device(mac, ip)
+                    return "connected"
+        except:
+            pass
+        new_ip = self.discovered_devices.get(mac)
+        if new_ip:
+            self.saved_connections[mac]["ip"] = new_ip
+            self.register_device(mac, new_ip)
+            return "connected"
+        return "not_found"
+
+    def register_device(self, mac, ip):
+        """연결된 기기를 목록에 추가합니다."""
+        saved = self.saved_connections[mac]
+        # 같은 IP를 쓰던 이전 기기는 연결 목록에서 제거
+        old_mac, _ = self.connected_devices.by_ip(ip)
+        if old_mac is not None:
+            self.unregister_device(old_mac)
+        info = self.connected_devices.add(mac, ip, saved["nickname"], saved.get("pill_code", ""))
+        self.emit("device_connected", mac, info)
+        # 연결 상태 변경 시 약품코드 색인과 약물 색상 업데이트
+        self.refresh_pill_code_index()
+        # 이 기기를 기다리던 조제 작업 전송
+        self.dispatch_dispense_jobs()
+
+    def unregister_device(self, mac):
+        """기기를 연결 목록에서 제거합니다."""
+        row = self.connected_devices.remove(mac)
+        self.emit("device_disconnected", mac, row)
+
+    def disconnect_device(self, mac):
+        """사용자가 끊은 기기를 연결 목록에서 제거하고 별명을 반환합니다."""
+        nickname = self.connected_devices[mac]['nickname']
+        self.unregister_device(mac)
+        # 사용자가 끊은 기기는 다음 스캔에서 자동으로 다시 연결하지 않음
+        self.auto_reconnect_attempted.add(mac)
+        if self.last_connected and self.last_connected.get("mac") == mac:
+            self.last_connected = None
+        self.save_connections()
+        # 연결 해제 시 약품코드 색인과 약물 색상 업데이트
+        self.refresh_pill_code_index()
+        return nickname
+
+    def schedule_connection_check(self):
+        """연결된 기기들의 상태를 작업 스레드 풀에서 동시에 확인합니다."""
+        # 이번 주기에 새로 확인을 시작한 기기들 (모두 끝나면 색상과 통계를 한 번만 갱신)
+        self.health_check_cycle = set()
+        for mac, device_info in self.connected_devices.items():
+            ip = device_info['ip']
+            # 이전 확인이 아직 끝나지 않은 기기만 이번 주기에서 건너뛰기
+            if mac in self.health_checks_pending:
+                self.log(f"이전 연결 상태 확인이 끝나지 않아 건너뜀: {ip}", logging.DEBUG)
+                continue
+            # 조제 중인 기기는 연결 상태 확인을 건너뛰기
+            if device_info['status'] == "시럽 조제 중":
+                self.log(f"조제 중인 기기 연결 상태 확인 건너뜀: {ip}", logging.DEBUG)
+                continue
+
+            self.health_checks_pending.add(mac)
+            self.health_check_cycle.add(mac)
+            self.health_executor.submit(self.check_device_health, mac, ip)
+        self.loop.after(5000, self.schedule_connection_check)
+
+    def check_device_health(self, mac, ip):
+        """작업 스레드에서 기기 상태를 확인하고 결과를 loop로 전달합니다."""
+        import requests
+        data = None
+        error = None
+        try:
+            # 연결 상태 확인을 위한 재시도 로직
+            response = None
+            for retry in range(2):
+                try:
+                    response = self.device_client.get(ip, kind="health")
+                    break
+                except requests.exceptions.Timeout:
+                    if retry == 0:
+                        self.log(f"연결 상태 확인 재시도: {ip} - timeout of 5000ms exceeded", logging.WARNING)
+                        time.sleep(1)  # 1초 대기 후 재시도
+                    else:
+                        raise
+            if response.status_code == 200:
+                data = response.json()
+        except Exception as e:
+            error = str(e)
+        self.loop.post(self.on_device_health, mac, ip, data, error)
+
+    def on_device_health(self, mac, ip, data, error):
+        """기기 상태 확인 결과를 반영합니다."""
+        self.health_checks_pending.discard(mac)
+        self.health_check_cycle.discard(mac)
+        device_info = self.connected_devices.get(mac)
+        # 확인하는 동안 연결이 해제되었거나 IP가 바뀌었거나 조제가 시작된 기기는 결과를 무시
+        if device_info and device_info['ip'] == ip and device_info['status'] != "시럽 조제 중":
+            if error is not None:
+                self.update_device_status(ip, "연결 끊김", refresh_colors=False)
+                self.log(f"연결 상태 확인 오류: {ip} - {error}", logging.WARNING)
+            elif data is None:
+                self.update_device_status(ip, "연결 끊김", refresh_colors=False)
+            elif data.get("mac") == mac:
+                self.update_device_status(ip, "연결됨", refresh_colors=False)
+                if "queue" in data:
+                    self.legacy_devices.discard(mac)
+            else:
+                # 같은 IP에 다른 기기가 응답하면 연결 목록에서 제거
+                self.unregister_device(mac)
+        # 이번 주기의 확인이 모두 끝나면 약물 색상과 연결 통계를 한 번만 갱신
+        # (이전 주기에서 늦게 도착한 결과는 진행 중인 주기가 끝날 때 함께 반영)
+        if not self.health_check_cycle:
+            self.refresh_pill_code_index()
+            # 다시 연결된 기기를 기다리던 조제 작업 전송
+            self.dispatch_dispense_jobs()
+            self.emit("connection_stats", self.device_client.stats())
+
+    def update_device_status(self, ip, status, refresh_colors=True):
+        mac, device_info = self.connected_devices.by_ip(ip)
+        if mac is not None:
+            self.connected_devices.set_status(mac, status)
+            self.emit("device_status", mac)
+        # 연결 상태 변경 시 약품코드 색인과 약물 색상도 갱신
+        if refresh_colors:
+            self.refresh_pill_code_index()
+
+    def refresh_pill_code_index(self):
+        """기기 연결 상태가 바뀌면 약품코드 색인을 다시 만들고, 상태가 바뀐 약품코드를 알립니다."""
+        pill_codes = self.connected_devices.refresh_pill_codes()
+        if pill_codes:
+            self.emit("pill_codes_changed", pill_codes)
+
+    def send_syrup_amount(self, mac, amount):
+        """기기에 시럽 용량을 보냅니다. 기기가 받으면 True를 반환하고, 통신 오류는 예외로 전달합니다."""
+        ip = self.connected_devices[mac]['ip']
+        response = self.device_client.post(ip, "/syrup", kind="syrup", json={"amount": amount})
+        if response.status_code != 200:
+            return False
+        self.update_device_status(ip, "시럽 조제 중")
+        return True
+
+    # ── 조제 ────────────────────────────────────────────────────────
+
+    def promote(self, receipt_number):
+        """접수번호의 대기 중인 조제 작업을 긴급으로 올리고 옮긴 작업 수를 반환합니다."""
+        moved = self.dispense_queue.promote(receipt_number)
+        self.log(f"접수번호 {receipt_number}의 대기 중인 조제 작업 {moved}건을 긴급으로 변경했습니다.",
+                 receipt_number=receipt_number)
+        if moved:
+            self.update_transmission_status(receipt_number, "대기 (긴급)")
+            self.dispatch_dispense_jobs()
+        return moved
+
+    def enqueue_dispense(self, receipt_number, patient_name, medicines, urgent=False):
+        """처방전의 약물들을 담당 기기별 조제 작업으로 대기열에 넣습니다.
+
+        medicines는 (약물명, 약품코드, 총량) 목록입니다. 연결된 기기가 없는 약물은 건너뛰고,
+        그런 약물이 있으면 나머지 전송이 끝난 뒤 전송여부를 '실패'로 표시합니다.
+        urgent면 각 기기 대기열에서 일반 작업보다 먼저 보냅니다.
+        이미 대기열에 있는 접수번호면 'duplicate', 보낼 약물이 없으면 'failed',
+        대기열에 넣었으면 'queued'를 반환합니다.
+        """
+        if self.dispense_queue.has_receipt(receipt_number):
+            self.log(f"접수번호 {receipt_number}의 조제 작업이 이미 대기열에 있습니다.", logging.WARNING)
+            return "duplicate"
+        skipped = False
+        queued = 0
+        # 처방전 파일이 감지된 시각 (직접 조제를 시작한 경우에는 지금)
+        arrived = self.arrival_times.pop(receipt_number, None)
+        for pill_name, pill_code, total_volume in medicines:
+            mac, device_info = self.device_for_pill_code(pill_code)
+            if device_info is None or device_info['status'] == '연결 끊김':
+                self.log(f"{pill_name}은(는) 연결되지 않은 약물이므로 건너뜁니다.")
+                skipped = True
+                continue
+            self.log(f"처리 중인 약물: {pill_name}, 코드: {pill_code}, 총량: {total_volume}")
+            self.dispense_queue.add(receipt_number, patient_name, pill_name, pill_code, total_volume, mac,
+                                    urgent=urgent, arrived=arrived)
+            queued += 1
+        if not queued:
+            self.update_transmission_status(receipt_number, "실패")
+            return "failed"
+        self.dispense_results[receipt_number] = {"skipped": skipped, "failed": []}
+        self.update_transmission_status(receipt_number, "대기 (긴급)" if urgent else "대기")
+        self.dispatch_dispense_jobs()
+        return "queued"
+
+    def dispatch_dispense_jobs(self):
+        """기기별 전송 한도 안에서 대기 중인 조제 작업을 꺼내 작업 스레드 풀로 보냅니다."""
+        def can_send(mac):
+            device_info = self.connected_devices.get(mac)
+            return device_info is not None and device_info['status'] != '연결 끊김'
+
+        for job in self.dispense_queue.take_ready(can_send):
+            ip = self.connected_devices[job['mac']]['ip']
+            pill_name = job['pill_name']
+            # 조제 시작 전에 상태를 "시럽 조제 중"으로 변경
+            self.update_device_status(ip, "시럽 조제 중")
+            self.log(f"{pill_name} 조제 시작 - 기기 상태를 '시럽 조제 중'으로 변경")
+            future = self.dispense_executor.submit(
+                self.send_dispense_request, ip, pill_name, job['patient_name'], job['total_volume'],
+                urgent=job.get('urgent', False))
+            future.add_done_callback(
+                lambda f, job=job, ip=ip: self.loop.post(
+                    self.on_dispense_result, job, ip, not f.exception() and f.result()))
+        self.emit("dispense_queue_changed")
+
+    def dispense_queue_summary(self):
+        """조제 대기열 길이와 긴급/일반 작업의 처방전 도착 -> 기기 수신 지연 시간을 한 줄로 만듭니다."""
+        pending, in_flight = self.dispense_queue.depth()
+        text = f"조제 대기 {pending}건 / 전송 중 {in_flight}건"
+        latencies = []
+        for urgent, name in ((True, "긴급"), (False, "일반")):
+            samples = self.dispense_latency[urgent]
+            if samples:
+                latencies.append(f"{name} 중앙값 {percentile(samples, 50):.1f}초, p95 {percentile(samples, 95):.1f}초")
+        if latencies:
+            text += " | 도착→기기 수신 " + " / ".join(latencies)
+        return text
+
+    def restore_dispense_queue(self):
+        """지난 실행에서 남은 조제 작업을 알리고, 전송 도중 끊긴 작업은 확인이 필요하다고 표시합니다."""
+        for job in self.dispense_queue.interrupted:
+            self.log(
+                f"{job['pill_name']} (접수번호 {job['receipt_number']}) 전송 도중 프로그램이 종료되어 "
+                f"조제 여부를 확인할 수 없습니다. 기기를 확인해주세요.", logging.WARNING,
+                receipt_number=job['receipt_number'], pill_name=job['pill_name'], mac=job['mac'])
+            self.update_transmission_status(job['receipt_number'], "확인 필요")
+        self.dispense_queue.interrupted = []
+        for jobs in self.dispense_queue.pending.values():
+            for job in jobs:
+                self.dispense_results.setdefault(job['receipt_number'], {"skipped": False, "failed": []})
+                self.update_transmission_status(job['receipt_number'], "대기")
+        self.emit("dispense_queue_changed")
+
+    def send_dispense_request(self, ip, pill_name, patient_name, total_volume, max_retries=3, retry_delay=3,
+                              urgent=False):
+        """작업 스레드에서 기기에 총량을 전송합니다. 실패하면 대기 시간을 두 배씩 늘리며 재시도합니다.
+
+        urgent면 펌웨어가 작업을 기기 대기열 맨 앞에 넣습니다.
+        """
+        import requests
+        # 환자 이름과 총량을 JSON 형태로 전송
+        data = {
+            "patient_name": patient_name,
+            "total_volume": total_volume,
+            "urgent": urgent
+        }
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
+        for retry_count in range(max_retries):
+            try:
+                response = self.device_client.post(ip, "/dispense", kind="dispense",
+                                                   json=data,
+                                                   headers=headers)
+
+                # 응답 상세 정보는 감사 로그 파일에만 기록
+                self.log(f"{pill_name} 응답 상태 코드: {response.status_code}", logging.DEBUG,
+                         ip=ip, status_code=response.status_code)
+
+                # ESP32의 응답 확인
+                if response.status_code == 200 and "BUSY" in response.text:
+                    self.log(f"{pill_name} 조제 중 - 대기열에 추가됨",
+                             ip=ip, pill_name=pill_name, total_volume=total_volume)
+                    return True
+                if response.status_code == 200 and "OK" in response.text:
+                    self.log(f"{pill_name} 총량 전달 성공",
+                             ip=ip, pill_name=pill_name, total_volume=total_volume)
+                    return True
+                message = (f"{pill_name} 총량 전달 실패 (시도 {retry_count + 1}/{max_retries}, "
+                           f"응답 {response.status_code})")
+            except requests.exceptions.Timeout:
+                message = f"{pill_name} 총량 전달 중 오류: timeout of 30000ms exceeded"
+            except requests.exceptions.ConnectionError as e:
+                message = f"{pill_name} 연결 오류 (시도 {retry_count + 1}/{max_retries}): {str(e)}"
+            except Exception as e:
+                message = f"{pill_name} 총량 전달 중 오류: {str(e)}"
+            self.log(message, logging.WARNING, ip=ip)
+            if retry_count + 1 < max_retries:
+                delay = retry_delay * (2 ** retry_count)
+                self.log(f"{pill_name}: {delay}초 후 재시도합니다...")
+                time.sleep(delay)
+        return False
+
+    def on_dispense_result(self, job, ip, success):
+        """작업별 전송 결과를 반영하고, 접수번호의 모든 작업이 전송되면 전송여부를 갱신합니다."""
+        pill_name = job['pill_name']
+        receipt_number = job['receipt_number']
+        result = self.dispense_results.setdefault(receipt_number, {"skipped": False, "failed": []})
+        if success:
+            # 기기 대기열에 들어간 작업은 기기가 조제를 마쳤다고 보고할 때 완료 처리
+            self.dispense_queue.accept(job, device_busy=self.device_busy.get(job['mac'], True))
+            urgent = bool(job.get('urgent'))
+            self.dispense_latency[urgent].append(job['latency'])
+            self.log(f"{pill_name} 기기 수신 (처방전 도착 후 {job['latency']:.1f}초)", logging.DEBUG,
+                     receipt_number=receipt_number, pill_name=pill_name, urgent=urgent,
+                     latency=round(job['latency'], 3))
+            if job['mac'] in self.legacy_devices:
+                self.schedule_legacy_completion(job)
+        else:
+            self.dispense_queue.finish(job)
+            self.log(f"{pill_name} 총량 전달 실패 (최대 재시도 횟수 초과)", logging.ERROR,
+                     ip=ip, pill_name=pill_name, receipt_number=receipt_number)
+            result["failed"].append(pill_name)
+            self.refresh_device_dispense_status(job['mac'])
+            self.log(f"{pill_name} 조제 실패")
+
+        self.settle_transmission_status(receipt_number)
+        self.dispatch_dispense_jobs()
+
+    def settle_transmission_status(self, receipt_number):
+        """접수번호의 모든 약물 전송이 끝났으면 전송여부를 '완료' 또는 '실패'로 갱신합니다."""
+        if self.dispense_queue.has_unsent(receipt_number):
+            return
+        result = self.dispense_results.pop(receipt_number, None)
+        if result is None:
+            return
+        if result["failed"] or result["skipped"]:
+            self.update_transmission_status(receipt_number, "실패")
+        else:
+            self.update_transmission_status(receipt_number, "완료")
+        if result["failed"]:
+            self.emit("dispense_failed", receipt_number, result["failed"])
+
+    def expire_dispense_jobs(self, now=None):
+        """연결이 DEVICE_GONE_EXPIRY_SECONDS 넘게 끊긴 기기의 조제 작업을 대기열에서 뺍니다.
+
+        보내지 못한 작업은 '실패'로, 기기가 접수했던 작업은 조제 여부를 알 수 없으므로
+        '확인 필요'로 표시합니다. 대기열에서 빠진 접수번호는 다시 조제할 수 있습니다.
+        프로그램을 다시 시작한 뒤 돌아오지 않는 기기도 시작 시점부터 시간을 잽니다.
+        """
+        now = time.time() if now is None else now
+        macs = self.dispense_queue.macs()
+        for mac in list(self.device_gone_since):
+            if mac not in macs:
+                del self.device_gone_since[mac]
+        for mac in macs:
+            device_info = self.connected_devices.get(mac)
+            if device_info is not None and device_info['status'] != '연결 끊김':
+                self.device_gone_since.pop(mac, None)
+                continue
+            since = self.device_gone_since.setdefault(mac, now)
+            if now - since < DEVICE_GONE_EXPIRY_SECONDS:
+                continue
+            del self.device_gone_since[mac]
+            pending, accepted = self.dispense_queue.expire(mac)
+            minutes = DEVICE_GONE_EXPIRY_SECONDS // 60
+            for job in accepted:
+                self.log(
+                    f"{job['pill_name']} (접수번호 {job['receipt_number']}) 기기 연결이 {minutes}분 넘게 끊겨 "
+                    f"조제 여부를 확인할 수 없습니다. 기기를 확인해주세요.", logging.WARNING,
+                    receipt_number=job['receipt_number'], pill_name=job['pill_name'], mac=mac)
+                self.update_transmission_status(job['receipt_number'], "확인 필요")
+            expired = {}
+            for job in pending:
+                self.log(
+                    f"{job['pill_name']} (접수번호 {job['receipt_number']}) 기기 연결이 {minutes}분 넘게 끊겨 "
+                    f"조제 작업을 대기열에서 뺐습니다.", logging.ERROR,
+                    receipt_number=job['receipt_number'], pill_name=job['pill_name'], mac=mac)
+                expired.setdefault(job['receipt_number'], []).append(job['pill_name'])
+                # 보내지 못한 약물이 있으므로 나머지 전송이 끝나면 '실패'로 표시
+                self.dispense_results.setdefault(
+                    job['receipt_number'], {"skipped": False, "failed": []})["skipped"] = True
+            for receipt_number, pill_names in expired.items():
+                self.settle_transmission_status(receipt_number)
+                self.emit("dispense_expired", receipt_number, pill_names)
+            self.emit("dispense_queue_changed")
+
+    def schedule_progress_poll(self):
+        """기기가 접수한 조제 작업이 남아 있는 기기들의 진행 상태를 주기적으로 확인합니다."""
+        self.expire_dispense_jobs()
+        for mac in self.dispense_queue.accepted_macs():
+            device_info = self.connected_devices.get(mac)
+            if device_info is None or mac in self.progress_polls_pending or mac in self.legacy_devices:
+                continue
+            self.progress_polls_pending.add(mac)
+            self.progress_executor.submit(self.poll_device_progress, mac, device_info['ip'])
+        self.loop.after(PROGRESS_POLL_INTERVAL_MS, self.schedule_progress_poll)
+
+    def poll_device_progress(self, mac, ip):
+        """작업 스레드에서 기기의 진행 상태(GET /)를 읽어 loop로 전달합니다."""
+        data = None
+        error = None
+        sent = time.time()
+        try:
+            response = self.device_client.get(ip, kind="progress")
+            if response.status_code == 200:
+                data = response.json()
+            else:
+                error = f"응답 {response.status_code}"
+        except Exception as e:
+            error = str(e)
+        self.loop.post(self.on_device_progress, mac, ip, data, error, sent)
+
+    def on_device_progress(self, mac, ip, data, error, sent):
+        """기기에 남은 작업 수(분주 중 + 대기)로 끝난 작업을 찾아 완료 처리합니다.
+
+        sent는 진행 상태 요청을 보낸 시각입니다. 그 뒤에 접수된 작업은 응답의 남은 수에
+        들어 있는지 알 수 없으므로 이번 응답으로는 완료 처리하지 않습니다.
+        """
+        self.progress_polls_pending.discard(mac)
+        if error is not None or data is None:
+            failures = self.progress_failures.get(mac, 0) + 1
+            self.progress_failures[mac] = failures
+            self.log(f"조제 진행 상태 확인 오류: {ip} - {error}", logging.DEBUG)
+            if failures == 3:
+                self.update_device_status(ip, "연결 끊김")
+            return
+        self.progress_failures.pop(mac, None)
+        if data.get("mac") != mac:
+            return
+        if "queue" not in data or "busy" not in data:
+            # 진행 상태를 보고하지 않는 펌웨어는 접수 후 일정 시간이 지나면 완료로 간주
+            self.legacy_devices.add(mac)
+            for job in self.dispense_queue.on_device(mac):
+                self.schedule_legacy_completion(job)
+            return
+        if data["queue"] < 0:
+            # 기기가 대기열을 읽지 못한 응답은 무시
+            return
+        self.device_busy[mac] = bool(data["busy"])
+        remaining = data["queue"] + (1 if data["busy"] else 0)
+        jobs = [job for job in self.dispense_queue.on_device(mac) if job['accepted'] < sent]
+        # 기기는 받은 순서대로 처리하므로 앞쪽 작업부터 끝난 것으로 봄
+        for job in jobs[:max(len(jobs) - remaining, 0)]:
+            self.complete_dispense_job(job)
+        self.refresh_device_dispense_status(mac)
+
+    def schedule_legacy_completion(self, job):
+        if job['id'] in self.legacy_timers:
+            return
+        self.legacy_timers.add(job['id'])
+        elapsed_ms = int((time.time() - job['accepted']) * 1000)
+        self.loop.after(max(LEGACY_DISPENSE_TIME_MS - elapsed_ms, 0), self.on_legacy_dispense_timeout, job)
+
+    def on_legacy_dispense_timeout(self, job):
+        self.legacy_timers.discard(job['id'])
+        if self.dispense_queue.is_in_flight(job):
+            self.complete_dispense_job(job)
+
+    def complete_dispense_job(self, job):
+        """기기가 조제를 마친 작업을 대기열에서 빼고 다음 작업을 보냅니다."""
+        self.dispense_queue.finish(job)
+        elapsed = time.time() - job['accepted']
+        self.log(f"{job['pill_name']} 조제 완료 ({elapsed:.0f}초)",
+                 receipt_number=job['receipt_number'], pill_name=job['pill_name'],
+                 mac=job['mac'], elapsed=round(elapsed, 1))
+        self.refresh_device_dispense_status(job['mac'])
+        self.dispatch_dispense_jobs()
+
+    def refresh_device_dispense_status(self, mac):
+        """기기에 끝나지 않은 조제 작업이 있으면 '시럽 조제 중', 없으면 '연결됨'으로 표시합니다."""
+        device_info = self.connected_devices.get(mac)
+        if device_info is None:
+            return
+        status = "시럽 조제 중" if self.dispense_queue.in_flight.get(mac) else "연결됨"
+        if device_info['status'] != status:
+            self.update_device_status(device_info['ip'], status)
+
+    def update_transmission_status(self, receipt_number, status):
+        """환자의 전송 상태를 업데이트합니다."""
+        receipt_number = str(receipt_number).strip()
+        self.transmission_status[receipt_number] = status
+        self.emit("transmission_status", receipt_number, status)
+
+    # ── 처방전 ──────────────────────────────────────────────────────
+
+    def load_prescription_path(self):
+        """저장된 처방전 파일 경로를 로드합니다."""
+        try:
+            with open(PRESCRIPTION_PATH_FILE, "r") as f:
+                return f.read().strip()
+        except:
+            return ""
+
+    def set_prescription_path(self, path):
+        """처방전 폴더 경로를 저장하고, 새 경로의 처방전을 백그라운드에서 다시 불러와 감시합니다. 없는 경로면 False."""
+        if not path or not os.path.exists(path):
+            return False
+        self.prescription_path = path
+        with open(PRESCRIPTION_PATH_FILE, "w") as f:
+            f.write(path)
+        # 이전 경로의 감시는 바로 멈추고, 새 경로의 감시는 색인이 끝난 뒤 시작
+        if self.prescription_watcher:
+            self.prescription_watcher.stop()
+            self.prescription_watcher = None
+        self.index_prescriptions_in_background()
+        return True
+
+    def start_prescription_monitor(self, known=()):
+        """처방전 폴더를 감시하여 새 파일이 생기면 파싱합니다. known의 파일은 새 파일로 보지 않습니다."""
+        if self.prescription_watcher:
+            self.prescription_watcher.stop()
+            self.prescription_watcher = None
+        if not self.prescription_path or not os.path.isdir(self.prescription_path):
+            return
+        self.prescription_watcher = PrescriptionWatcher(
+            self.prescription_path,
+            on_new_file=self.enqueue_prescription_file,
+            log=self.log,
+            known=[path for paths in self.prescription_files_by_date.values() for path in paths] + list(known))
+        self.prescription_watcher.start()
+
+    def enqueue_prescription_file(self, file_path):
+        """감시 스레드에서 새 처방전 파일을 파싱해 처리 대기열에 넣습니다."""
+        try:
+            prescription = read_prescription_file(file_path)
+            error = None
+        except Exception as e:
+            prescription = None
+            error = str(e)
+        if prescription is None and error is None:
+            # 아직 내용이 없는 파일은 다시 쓰여질 때 감지되도록 함
+            return False
+        if prescription is not None:
+            self.prescription_cache.put(file_path, prescription)
+        # 대기열이 가득 차면 loop가 따라잡을 때까지 감시 스레드가 기다림
+        self.prescription_queue.put((file_path, prescription, error, time.time()))
+        return True
+
+    def process_prescription_queue(self):
+        """처리 대기열의 새 처방전을 한 번에 최대 PRESCRIPTION_BATCH_SIZE개씩 반영합니다."""
+        for _ in range(PRESCRIPTION_BATCH_SIZE):
+            try:
+                file_path, prescription, error, arrived = self.prescription_queue.get_nowait()
+            except queue.Empty:
+                break
+            if error is not None:
+                self.log(f"파일 파싱 중 오류 발생: {error}", logging.ERROR, file=file_path)
+                continue
+            self.add_prescription(file_path, prescription, arrived=arrived)
+        self.loop.after(100, self.process_prescription_queue)
+
+    def parse_prescription_file(self, file_path):
+        """처방전 파일을 파싱합니다."""
+        try:
+            # 이미 파싱된 파일인지 확인
+            if file_path in self.parsed_files:
+                return
+            prescription = read_prescription_file(file_path)
+            if prescription is None:
+                return
+            self.prescription_cache.put(file_path, prescription)
+            self.add_prescription(file_path, prescription)
+        except Exception as e:
+            self.log(f"파일 파싱 중 오류 발생: {str(e)}", logging.ERROR, file=file_path)
+
+    def add_prescription(self, file_path, prescription, announce=True, arrived=None):
+        """파싱된 처방전을 저장하고, 새 접수번호면 'prescription_added'로 알립니다.
+
+        announce가 False면 알림, 자동 조제, 파일별 로그를 생략합니다 (일괄 로드용).
+        arrived는 감시기가 파일을 감지한 시각으로, 조제 지연 시간 측정에 씁니다.
+        """
+        if file_path in self.parsed_files:
+            return
+        receipt_number = prescription.receipt_number
+        date = prescription.receipt_time
+        files = self.prescription_files_by_date.setdefault(date, [])
+        if file_path not in files:
+            files.append(file_path)
+        if date not in self.resident_dates:
+            # 메모리에 없는 날짜의 새 파일은 캐시에만 두고 조회할 때 불러옴 (자정이 지나 생긴 오늘 날짜는 바로 유지)
+            if date != datetime.now().strftime('%Y-%m-%d'):
+                return
+            self.resident_dates[date] = True
+        is_new = self.parsed_prescriptions.get(receipt_number) is None
+        # 파싱된 데이터 저장
+        self.parsed_prescriptions.add(prescription)
+        # 파싱된 파일 목록에 추가
+        self.parsed_files.add(file_path)
+        if not announce:
+            return
+        # 같은 접수번호를 이미 알렸으면 다시 알리거나 조제하지 않음. 폴더를 다시 색인하면
+        # parsed_prescriptions가 새로 만들어지므로 도착/전송 기록도 함께 확인함
+        if is_new and (receipt_number in self.arrival_times or receipt_number in self.transmission_status):
+            is_new = False
+        if is_new:
+            if arrived is not None:
+                self.arrival_times[receipt_number] = arrived
+                # 조제하지 않은 처방전의 도착 시각은 오래된 것부터 버림
+                while len(self.arrival_times) > PRESCRIPTION_QUEUE_SIZE * 4:
+                    del self.arrival_times[next(iter(self.arrival_times))]
+            self.emit("prescription_added", prescription)
+            # 자동 조제가 활성화되어 있다면 화면 선택과 관계없이 이 처방전을 조제 대기열에 추가
+            if self.auto_dispensing:
+                self.log(f"새로운 처방전 '{os.path.basename(file_path)}'이(가) 감지되어 자동으로 조제를 시작합니다.")
+                self.enqueue_dispense(receipt_number, prescription.patient_name,
+                                      [(medicine.pill_name, medicine.pill_code, medicine.total)
+                                       for medicine in prescription.medicines])
+        # 로그 메시지 추가
+        self.log(f"처방전 파일 '{os.path.basename(file_path)}' 파싱 완료")
+        self.log_parse_errors(file_path, prescription)
+
+    def log_parse_errors(self, file_path, prescription):
+        """처방전 파일에서 형식이 잘못되어 건너뛴 줄을 로그에 남깁니다."""
+        for error in prescription.errors:
+            self.log(f"처방전 파일 '{os.path.basename(file_path)}' {error} (건너뜀)", logging.WARNING)
+
+    def start_bulk_import(self, workers=None):
+        """처방전 폴더 전체를 백그라운드에서 여러 프로세스로 파싱해 캐시에 저장합니다.
+
+        이미 가져오는 중이거나 폴더가 없으면 False를 반환합니다.
+        """
+        if self.import_running or not self.prescription_path or not os.path.isdir(self.prescription_path):
+            return False
+        self.import_running = True
+        self.log(f"처방전 일괄 가져오기 시작: {self.prescription_path}")
+        folder = self.prescription_path
+
+        def run():
+            try:
+                result = bulk_import_prescriptions(
+                    folder, self.prescription_cache, workers=workers,
+                    on_progress=lambda done, total: self.loop.post(
+                        self.emit, "bulk_import_progress", done, total, key="bulk_import_progress"))
+                error = None
+            except Exception as e:
+                result = None
+                error = str(e)
+            self.loop.post(self.on_bulk_import_finished, result, error)
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def on_bulk_import_finished(self, result, error):
+        """일괄 가져오기가 끝나면 캐시에서 처방전을 다시 불러옵니다."""
+        self.import_running = False
+        if error is not None:
+            self.log(f"처방전 일괄 가져오기 중 오류 발생: {error}", logging.ERROR)
+        else:
+            for message in result['errors']:
+                self.log(f"파일 파싱 중 오류 발생: {message}", logging.ERROR)
+            self.log(
+                f"처방전 일괄 가져오기 완료: 파일 {result['files']}개 (캐시 {result['cached']}개, "
+                f"새로 파싱 {result['parsed']}개, 오류 {len(result['errors'])}개), {result['elapsed']:.1f}초")
+        self.emit("bulk_import_finished", result, error)
+        if error is None:
+            # 불러온 날짜들은 이제 캐시에서 바로 읽힘
+            self.index_prescriptions_in_background(dates=list(self.resident_dates))
+
+    def parse_all_prescription_files(self, dates=()):
+        """처방전 폴더의 파일을 접수일별로 분류하고 오늘과 dates의 처방전만 불러옵니다.
+
+        다른 날짜는 조회할 때 load_prescription_dates로 불러옵니다.
+        """
+        index = None
+        if self.prescription_path and os.path.isdir(self.prescription_path):
+            index, _ = index_prescription_folder(self.prescription_path, self.prescription_cache)
+        self.apply_prescription_index(index, dates)
+
+    def index_prescriptions_in_background(self, dates=()):
+        """작업 스레드에서 처방전 폴더를 색인하고 오늘과 dates의 처방전을 캐시에 준비한 뒤, loop에서 불러옵니다."""
+        folder = self.prescription_path
+        dates = list(dates)
+
+        def run():
+            index = None
+            parsed = []
+            error = None
+            try:
+                if folder and os.path.isdir(folder):
+                    index, parsed = index_prescription_folder(
+                        folder, self.prescription_cache, warm_dates=[datetime.now().strftime('%Y-%m-%d')] + dates)
+            except Exception as e:
+                error = str(e)
+            self.loop.post(self.on_prescriptions_indexed, folder, index, parsed, error, dates)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def on_prescriptions_indexed(self, folder, index, parsed, error, dates=()):
+        """백그라운드 색인 결과를 반영하고 처방전 폴더 감시를 시작합니다."""
+        # 색인하는 동안 경로가 바뀌었으면 이 결과는 버리고 새 경로의 색인 결과를 기다림
+        if folder == self.prescription_path:
+            if error is not None:
+                self.log(f"처방전 폴더 색인 중 오류 발생: {error}", logging.ERROR, folder=folder)
+            for file_path, prescription in parsed:
+                self.log_parse_errors(file_path, prescription)
+            # 작업 스레드가 폴더 목록을 읽은 뒤에 도착한 파일은 이 색인에 없지만 이전 감시기가 이미
+            # 알렸을 수 있음. 그 파일들을 색인과 새 감시기의 known에 넣지 않으면 apply로 parsed_files가
+            # 비워진 뒤 새 감시기의 첫 목록 읽기가 같은 파일을 다시 알려 같은 처방전이 두 번 조제됨
+            seen = self.seen_prescription_files(folder)
+            if index is not None:
+                for file_path in seen:
+                    files = index.setdefault(receipt_date(os.path.basename(file_path).split('.')[0]), [])
+                    if file_path not in files and os.path.exists(file_path):
+                        files.append(file_path)
+            self.apply_prescription_index(index, dates)
+            self.start_prescription_monitor(known=seen)
+        self.finish_startup_stage("prescriptions")
+
+    def seen_prescription_files(self, folder):
+        """folder에서 이미 불러왔거나 지금 감시기가 알린 처방전 파일 경로 집합을 반환합니다."""
+        seen = {path for path in self.parsed_files if os.path.dirname(path) == os.path.normpath(folder)}
+        watcher = self.prescription_watcher
+        if watcher is not None and watcher.path == folder:
+            seen.update(os.path.join(folder, name) for name in list(watcher.known))
+        return seen
+
+    def apply_prescription_index(self, index, dates=()):
+        """접수일별 파일 목록(index)으로 처방전 상태를 다시 만들고 오늘과 dates의 처방전을 불러옵니다."""
+        self.prescription_files_by_date = index or {}
+        self.resident_dates.clear()
+        self.parsed_prescriptions = PrescriptionIndex()
+        self.parsed_files = set()
+        if index is not None:
+            self.load_prescription_dates([datetime.now().strftime('%Y-%m-%d')])
+            if dates:
+                self.load_prescription_dates(dates)
+        self.emit("prescriptions_reloaded")
+
+    def load_prescription_dates(self, dates):
+        """지정한 접수일의 처방전을 메모리에 불러오고, 오래 조회하지 않은 날짜는 내립니다."""
+        # 잘못된 형식의 날짜가 상주 날짜 자리를 차지해 실제 날짜를 내리지 않도록 미리 거름
+        dates = [date for date in dates if is_valid_date(date)]
+        for date in dates:
+            if date in self.resident_dates:
+                self.resident_dates.move_to_end(date)
+                continue
+            self.resident_dates[date] = True
+            self.load_prescription_files(self.prescription_files_by_date.get(date, []))
+        # 오늘과 이번에 요청한 날짜를 제외하고 가장 오래 조회하지 않은 날짜부터 내림
+        today = datetime.now().strftime('%Y-%m-%d')
+        requested = set(dates)
+        for date in list(self.resident_dates):
+            if len(self.resident_dates) <= MAX_RESIDENT_DAYS:
+                break
+            if date == today or date in requested:
+                continue
+            del self.resident_dates[date]
+            for prescription in self.parsed_prescriptions.on_date(date):
+                self.parsed_prescriptions.remove(prescription.receipt_number)
+            for file_path in self.prescription_files_by_date.get(date, []):
+                self.parsed_files.discard(file_path)
+
+    def load_prescription_files(self, file_paths):
+        """처방전 파일들을 불러옵니다. 크기와 수정 시각이 바뀌지 않은 파일은 캐시에서 읽습니다."""
+        # 접수번호(파일 이름) 순으로 불러옴
+        file_paths = sorted((path for path in file_paths if path not in self.parsed_files), key=os.path.basename)
+        if not file_paths:
+            return
+        cached = self.prescription_cache.get_many(file_paths)
+        new_entries = []
+        cache_hits = 0
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            cached_entry = cached.get(file_path)
+            if cached_entry and cached_entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                prescription = prescription_from_json(cached_entry[2])
+                cache_hits += 1
+            else:
+                try:
+                    prescription = read_prescription_file(file_path)
+                except Exception as e:
+                    self.log(f"파일 파싱 중 오류 발생: {str(e)}", logging.ERROR, file=file_path)
+                    continue
+                if prescription is None:
+                    continue
+                new_entries.append((file_path, stat.st_size, stat.st_mtime_ns, prescription))
+                self.log_parse_errors(file_path, prescription)
+            self.add_prescription(file_path, prescription, announce=False)
+        # 새로 파싱한 결과를 캐시에 저장
+        self.prescription_cache.put_many(new_entries)
+        self.log(f"처방전 파일 {cache_hits + len(new_entries)}개 로드 (캐시 {cache_hits}개, 새로 파싱 {len(new_entries)}개)")
+
+    def prescriptions_for(self, selected_date):
+        """조회할 날짜의 처방전 목록을 접수일, 접수번호 순으로 반환합니다.
+
+        'YYYY-MM-DD~YYYY-MM-DD' 형식이면 기간으로 조회하며, 필요한 날짜는 메모리에 불러옵니다.
+        """
+        selected_date = selected_date.strip()
+        if "~" in selected_date:
+            start, end = (part.strip() for part in selected_date.split("~", 1))
+            self.load_prescription_dates([date for date in sorted(self.prescription_files_by_date) if start <= date <= end])
+            return self.parsed_prescriptions.in_range(start, end)
+        self.load_prescription_dates([selected_date])
+        return self.parsed_prescriptions.on_date(selected_date)
+
+
+def run_service(args):
+    """화면 없이 SyrupCore를 실행합니다. 로그는 표준 출력에 씁니다."""
+    loop = EventLoop()
+    core = SyrupCore(loop)
+    core.subscribe("log", lambda message, level: level >= logging.INFO and print(
+        f"{datetime.now().strftime('%H:%M:%S')} [{logging.getLevelName(level)}] {message}", flush=True))
+    if args.prescriptions:
+        core.prescription_path = args.prescriptions
+    core.auto_dispensing = args.auto_dispense
+    core.start(network_prefix=args.network)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.close()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="시럽조제기 연결 엔진 (화면 없는 서비스 모드)")
+    parser.add_argument("--prescriptions", metavar="PATH", help="감시할 처방전 폴더 (기본값은 저장된 경로)")
+    parser.add_argument("--network", metavar="PREFIX", help="스캔할 네트워크 대역 (예: 192.168.0.)")
+    parser.add_argument("--auto-dispense", action="store_true", help="새 처방전을 자동으로 조제 대기열에 넣습니다")
+    run_service(parser.parse_args())